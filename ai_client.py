@@ -0,0 +1,188 @@
+import json
+import re
+import threading
+import time
+
+from zhipuai import APIRequestFailedError, ZhipuAI
+
+from rate_limiter import AdaptiveLimiter
+
+MODEL_NAME = "glm-4v-plus"
+DEFAULT_AI_WORKERS = 8
+DEFAULT_BATCH_SIZE = 1  # 每个请求的图片数，1 表示不合并
+DEFAULT_BATCH_MAX_BYTES = 4 * 1024 * 1024  # 一个请求中所有图片 Base64 的总长度上限
+
+_clients = {}
+_limiters = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key):
+    """同一个 API Key 共用一个 ZhipuAI 客户端，从而共用其 HTTP 连接池（客户端本身是线程安全的）"""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            # 重试由 AdaptiveLimiter 负责，SDK 自带的重试会绕过限速
+            client = ZhipuAI(api_key=api_key, max_retries=0)
+            _clients[api_key] = client
+            _limiters[client] = AdaptiveLimiter()
+        return client
+
+
+def get_limiter(client):
+    """客户端对应的限速器，同一个 API Key 的所有请求共用"""
+    with _clients_lock:
+        limiter = _limiters.get(client)
+        if limiter is None:
+            limiter = AdaptiveLimiter()
+            _limiters[client] = limiter
+        return limiter
+
+
+def create_completion(client, model, messages):
+    """经过限速、并发控制和退避重试后调用 chat.completions.create"""
+    return get_limiter(client).call(
+        lambda: client.chat.completions.create(model=model, messages=messages)
+    )
+
+
+def request_description(client, img_base, prompt, model=MODEL_NAME):
+    """发送一张 Base64 图片和提示词，返回模型的文字描述"""
+    response = create_completion(
+        client,
+        model,
+        [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": img_base
+                        }
+                    },
+                    {
+                        "type": "text",
+                        "text": prompt
+                    }
+                ]
+            }
+        ]
+    )
+    return response.choices[0].message.content
+
+
+def describe_cached(client, img_base, prompt, cache=None, model=MODEL_NAME, log=None):
+    """先查描述缓存，未命中时才调用 API，成功后写回缓存；只有真正发出的请求才记录耗时"""
+    key = None
+    if cache is not None:
+        key = cache.make_key(model, prompt, img_base)
+        description = cache.get(key)
+        if description is not None:
+            return description
+
+    start_time = time.time()
+    description = request_description(client, img_base, prompt, model)
+    if log is not None:
+        log(f"请求耗时: {time.time() - start_time:.2f} 秒")
+    if description and cache is not None:
+        cache.put(key, model, description)
+    return description
+
+
+class BatchReplyError(ValueError):
+    """多图请求的回复无法解析为与图片一一对应的描述"""
+
+
+def parse_batch_reply(reply, count):
+    """回复必须是长度为 count 的 JSON 字符串数组，允许包在 ```json 代码块中"""
+    text = (reply or "").strip()
+    fenced = re.fullmatch(r"```(?:json)?\s*(.*?)\s*```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    try:
+        descriptions = json.loads(text)
+    except ValueError as e:
+        raise BatchReplyError(f"回复不是 JSON: {e}")
+    if not isinstance(descriptions, list) or len(descriptions) != count:
+        raise BatchReplyError(f"回复应为 {count} 个元素的数组")
+    if not all(isinstance(item, str) and item.strip() for item in descriptions):
+        raise BatchReplyError("回复中有空的或非字符串的描述")
+    return [item.strip() for item in descriptions]
+
+
+def request_descriptions(client, img_bases, prompt, model=MODEL_NAME):
+    """在一个请求中发送多张图片，要求模型按顺序分别描述，返回与 img_bases 一一对应的描述列表"""
+    content = []
+    for index, img_base in enumerate(img_bases, 1):
+        content.append({"type": "text", "text": f"图片{index}："})
+        content.append({"type": "image_url", "image_url": {"url": img_base}})
+    content.append({
+        "type": "text",
+        "text": f"对以上 {len(img_bases)} 张图片分别执行：{prompt}\n"
+                f"只返回一个 JSON 字符串数组，按图片顺序每张一个描述，数组长度必须为 {len(img_bases)}，不要输出其他内容"
+    })
+    response = create_completion(client, model, [{"role": "user", "content": content}])
+    return parse_batch_reply(response.choices[0].message.content, len(img_bases))
+
+
+def split_by_size(img_bases, max_bytes):
+    """按总长度上限把图片分成若干组，单张超过上限的图片单独成组"""
+    chunk = []
+    chunk_bytes = 0
+    for index, img_base in enumerate(img_bases):
+        if chunk and chunk_bytes + len(img_base) > max_bytes:
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(index)
+        chunk_bytes += len(img_base)
+    if chunk:
+        yield chunk
+
+
+def describe_batch_cached(client, img_bases, prompt, cache=None, model=MODEL_NAME,
+                          max_bytes=DEFAULT_BATCH_MAX_BYTES, log=print):
+    """
+    多张图片的 describe_cached：缓存命中的不再请求，其余按总长度上限合并成多图请求
+    多图回复无法解析时退回逐张请求；逐张请求失败的图片描述为 None
+    """
+    descriptions = [None] * len(img_bases)
+    keys = [None] * len(img_bases)
+    missing = []
+    for index, img_base in enumerate(img_bases):
+        if cache is not None:
+            keys[index] = cache.make_key(model, prompt, img_base)
+            descriptions[index] = cache.get(keys[index])
+        if descriptions[index] is None:
+            missing.append(index)
+
+    for chunk in split_by_size([img_bases[index] for index in missing], max_bytes):
+        indexes = [missing[position] for position in chunk]
+        results = None
+        start_time = time.time()
+        if len(indexes) > 1:
+            try:
+                results = request_descriptions(client, [img_bases[index] for index in indexes], prompt, model)
+            except BatchReplyError as e:
+                log(f"多图回复无法解析，改为逐张请求: {e}")
+            except APIRequestFailedError as e:
+                # 400 一般是请求本身不被接受（例如图片数超过模型限制），逐张请求仍可能成功
+                log(f"多图请求被拒绝，改为逐张请求: {e}")
+            except Exception as e:
+                log(f"调用API时发生错误: {e}")
+                results = [None] * len(indexes)
+        if results is None:
+            results = []
+            for index in indexes:
+                try:
+                    results.append(request_description(client, img_bases[index], prompt, model))
+                except Exception as e:
+                    log(f"调用API时发生错误: {e}")
+                    results.append(None)
+        log(f"{len(indexes)} 张图片请求耗时: {time.time() - start_time:.2f} 秒")
+        for index, description in zip(indexes, results):
+            descriptions[index] = description
+            if description and cache is not None:
+                cache.put(keys[index], model, description)
+    return descriptions
@@ -1,74 +1,11 @@
-import base64
-import time
-from zhipuai import ZhipuAI
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import os
-import subprocess
-from datetime import datetime
 import threading
-from PIL import Image
-import io
-
-
-def compress_image(image_path, max_size=1 * 1024 * 1024):
-    """
-    压缩图片到指定大小以内
-    :param image_path: 图片文件的路径
-    :param max_size: 最大允许的文件大小（字节），默认为1MB
-    :return: 压缩后图片的Base64编码字符串
-    """
-    img = Image.open(image_path)
-    quality = 90
-    while True:
-        buffer = io.BytesIO()
-        img.save(buffer, format='JPEG', quality=quality)
-        buffer.seek(0)
-        data = buffer.read()
-        if len(data) <= max_size or quality < 10:
-            break
-        quality -= 10
-    encoded_string = base64.b64encode(data).decode('utf-8')
-    return encoded_string
-
-
-def get_image_description(img_path, api_key, prompt):
-    client = ZhipuAI(api_key=api_key)
-    img_base = compress_image(img_path)
-
-    # 记录开始时间
-    start_time = time.time()
-
-    try:
-        response = client.chat.completions.create(
-            model="glm-4v-plus",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": img_base
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ]
-                }
-            ]
-        )
-        # 记录结束时间
-        end_time = time.time()
-        # 计算耗时
-        elapsed_time = end_time - start_time
-        print(f"请求耗时: {elapsed_time:.2f} 秒")
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"调用API时发生错误: {e}")
-        return None
+from ai_client import DEFAULT_AI_WORKERS, DEFAULT_BATCH_SIZE
+from photo_renamer import DEFAULT_PROMPT, PhotoRenamer
+from rename_journal import latest_journal_path, new_journal_path, undo_journal
+from stage_timer import new_report_path
+from ui_channel import UIChannel, new_log_path
 
 
 class PhotoRenamerApp:
@@ -80,10 +17,11 @@ class PhotoRenamerApp:
         # 创建界面组件
         self.create_widgets()
         self.selected_dir = ""
-        self.total_files = 0
-        self.cancel_flag = False
+        self.renamer = None
         self.api_key = ""
         self.ai_prompt = ""
+        self.ai_worker_count = DEFAULT_AI_WORKERS
+        self.ai_batch_count = DEFAULT_BATCH_SIZE
         self.original_api_key = ""
         self.is_showing_api = False  # 用于标记当前API Key是否显示
 
@@ -106,9 +44,29 @@ class PhotoRenamerApp:
 
         ttk.Label(prompt_frame, text="AI提示词:").pack(side=tk.LEFT, padx=5)
         self.prompt_entry = ttk.Entry(prompt_frame, width=50)
-        self.prompt_entry.insert(0, "简洁的描述图片字数10字以内，不要有任何断句")
+        self.prompt_entry.insert(0, DEFAULT_PROMPT)
         self.prompt_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
+        ttk.Label(prompt_frame, text="AI并发数:").pack(side=tk.LEFT, padx=5)
+        self.ai_workers = tk.IntVar(value=DEFAULT_AI_WORKERS)
+        ttk.Spinbox(
+            prompt_frame,
+            from_=1,
+            to=32,
+            width=4,
+            textvariable=self.ai_workers
+        ).pack(side=tk.LEFT)
+
+        ttk.Label(prompt_frame, text="每次请求图片数:").pack(side=tk.LEFT, padx=5)
+        self.ai_batch_size = tk.IntVar(value=DEFAULT_BATCH_SIZE)
+        ttk.Spinbox(
+            prompt_frame,
+            from_=1,
+            to=10,
+            width=4,
+            textvariable=self.ai_batch_size
+        ).pack(side=tk.LEFT)
+
         # 目录选择部分
         dir_frame = ttk.Frame(self.master)
         dir_frame.pack(pady=10, padx=10, fill=tk.X)
@@ -122,6 +80,20 @@ class PhotoRenamerApp:
             command=self.select_directory
         ).pack(side=tk.LEFT, padx=5)
 
+        self.include_subfolders = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            dir_frame,
+            text="包含子文件夹",
+            variable=self.include_subfolders
+        ).pack(side=tk.LEFT, padx=5)
+
+        self.skip_processed = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            dir_frame,
+            text="跳过已处理的文件",
+            variable=self.skip_processed
+        ).pack(side=tk.LEFT, padx=5)
+
         # 参数选择部分
         param_frame = ttk.LabelFrame(self.master, text="文件名参数")
         param_frame.pack(pady=10, padx=10, fill=tk.X)
@@ -182,6 +154,13 @@ class PhotoRenamerApp:
             variable=self.include_ai_description
         ).pack(side=tk.LEFT, padx=5)
 
+        self.group_similar = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            param_frame,
+            text="连拍只描述一张",
+            variable=self.group_similar
+        ).pack(side=tk.LEFT, padx=5)
+
         # 处理按钮
         button_frame = ttk.Frame(self.master)
         button_frame.pack(pady=5)
@@ -200,6 +179,33 @@ class PhotoRenamerApp:
         )
         self.cancel_button.pack(side=tk.LEFT, padx=5)
 
+        self.prefill_cache = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="仅生成AI描述缓存（不重命名）",
+            variable=self.prefill_cache
+        ).pack(side=tk.LEFT, padx=5)
+
+        self.dry_run = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="仅预览新文件名（不重命名）",
+            variable=self.dry_run
+        ).pack(side=tk.LEFT, padx=5)
+
+        self.plan_first = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="先计算全部新文件名再批量重命名",
+            variable=self.plan_first
+        ).pack(side=tk.LEFT, padx=5)
+
+        ttk.Button(
+            button_frame,
+            text="撤销上次重命名",
+            command=self.undo_last_run
+        ).pack(side=tk.LEFT, padx=5)
+
         # 日志区域
         self.log_text = tk.Text(self.master, state=tk.DISABLED)
         self.log_text.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
@@ -208,6 +214,9 @@ class PhotoRenamerApp:
         self.progress_bar = ttk.Progressbar(self.master, orient="horizontal", length=500, mode="determinate")
         self.progress_bar.pack(pady=10, padx=10)
 
+        # 工作线程的日志和进度都经过它按帧批量更新到界面，完整日志另存到文件
+        self.channel = UIChannel(self.master, self.log_text, self.progress_bar, spill_path=new_log_path("photo"))
+
     def select_directory(self):
         directory = filedialog.askdirectory()
         if directory:
@@ -216,17 +225,14 @@ class PhotoRenamerApp:
             self.dir_entry.insert(0, directory)
 
     def log(self, message):
-        self.log_text.configure(state=tk.NORMAL)
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.log_text.configure(state=tk.DISABLED)
+        self.channel.log(message)
 
     def start_processing(self):
         if not self.selected_dir:
             messagebox.showerror("错误", "请先选择目录")
             return
 
-        if self.include_ai_description.get():
+        if self.include_ai_description.get() or self.prefill_cache.get():
             self.api_key = self.original_api_key
             if not self.api_key or self.api_key == "Your-API-Code":
                 messagebox.showerror("错误", "请输入智谱AI API Key")
@@ -237,168 +243,70 @@ class PhotoRenamerApp:
                 messagebox.showerror("错误", "请输入AI提示词")
                 return
 
-        self.cancel_flag = False
+            try:
+                self.ai_worker_count = self.ai_workers.get()
+                self.ai_batch_count = self.ai_batch_size.get()
+            except tk.TclError:
+                messagebox.showerror("错误", "AI并发数和每次请求图片数必须是整数")
+                return
+
+        self.renamer = PhotoRenamer(
+            self.selected_dir,
+            include_datetime=self.include_datetime.get(),
+            include_camera=self.include_camera.get(),
+            include_lens=self.include_lens.get(),
+            include_focal=self.include_focal.get(),
+            include_aperture=self.include_aperture.get(),
+            include_exposure=self.include_exposure.get(),
+            include_iso=self.include_iso.get(),
+            include_ai_description=self.include_ai_description.get(),
+            recursive=self.include_subfolders.get(),
+            api_key=self.api_key,
+            ai_prompt=self.ai_prompt,
+            ai_workers=self.ai_worker_count,
+            ai_batch_size=self.ai_batch_count,
+            group_similar=self.group_similar.get(),
+            prefill_only=self.prefill_cache.get(),
+            dry_run=self.dry_run.get(),
+            plan_first=self.plan_first.get(),
+            journal_path=None if self.dry_run.get() else new_journal_path("photo"),
+            incremental=self.skip_processed.get(),
+            report_path=new_report_path("photo"),
+            log=self.log,
+            on_progress=self.channel.progress
+        )
         self.cancel_button.config(state=tk.NORMAL)
         # 启动线程来处理文件
-        threading.Thread(target=self.process_files).start()
+        threading.Thread(target=self.process_files, args=(self.renamer,)).start()
 
     def cancel_processing(self):
-        self.cancel_flag = True
+        if self.renamer is not None:
+            self.renamer.cancel()
         self.cancel_button.config(state=tk.DISABLED)
         self.log("处理已取消")
 
-    def process_files(self):
-        supported_ext = ('.jpg', '.jpeg', '.png', '.nef', '.tiff', '.dng')
-        file_count = 0
-        success_count = 0
-        error_count = 0
-
-        files = [filename for filename in os.listdir(self.selected_dir) if filename.lower().endswith(supported_ext)]
-        self.total_files = len(files)
-
-        self.progress_bar["maximum"] = self.total_files
-        self.log("开始处理...")
-
-        for i, filename in enumerate(files):
-            if self.cancel_flag:
-                break
-            file_count += 1
-            file_path = os.path.join(self.selected_dir, filename)
-
-            # 更新进度条
-            self.master.after(0, self.update_progress, i + 1)
-
-            try:
-                exif_data = self.get_exif_data(file_path)
-
-                if not exif_data:
-                    self.log(f"跳过 {filename}：无EXIF信息")
-                    error_count += 1
-                    continue
-
-                name_parts = self.create_filename_parts(exif_data)
-
-                if self.include_ai_description.get():
-                    description = get_image_description(file_path, self.api_key, self.ai_prompt)
-                    if description:
-                        description = self.sanitize_filename(description)
-                        name_parts.append(description)
-
-                new_name = " ｜ ".join(name_parts)
-                new_name = self.sanitize_filename(new_name)
-
-                ext = os.path.splitext(filename)[1].lower()
-                new_filename = self.get_unique_filename(new_name, ext)
-
-                os.rename(file_path, os.path.join(self.selected_dir, new_filename))
-                self.log(f"重命名成功：{filename} -> {new_filename}")
-                success_count += 1
-
-            except Exception as e:
-                self.log(f"处理失败 {filename}: {str(e)}")
-                error_count += 1
-
-        self.cancel_button.config(state=tk.DISABLED)
-        self.log(f"处理完成！共处理 {file_count} 个文件，成功 {success_count} 个，失败 {error_count} 个")
-
-    def update_progress(self, value):
-        """确保进度条在主线程更新"""
-        self.progress_bar["value"] = value
+    def undo_last_run(self):
+        journal = latest_journal_path("photo")
+        if journal is None:
+            messagebox.showinfo("提示", "没有找到可以撤销的重命名记录")
+            return
+        if not messagebox.askyesno("确认", f"撤销以下记录中的所有重命名？\n{journal}"):
+            return
+        threading.Thread(target=self.undo_files, args=(journal,)).start()
 
-    def get_exif_data(self, file_path):
+    def undo_files(self, journal):
         try:
-            result = subprocess.run(
-                ['exiftool', '-json', file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-
-            if result.stderr:
-                self.log(f"EXIFTool Error: {result.stderr}")
-
-            exif_data = result.stdout.strip()
-
-            if exif_data:
-                return eval(exif_data)[0]
-            else:
-                self.log(f"EXIF数据为空 {file_path}")
-                return None
+            undo_journal(journal, self.log)
+        except Exception as e:
+            self.log(f"撤销失败: {str(e)}")
 
+    def process_files(self, renamer):
+        try:
+            renamer.run()
         except Exception as e:
-            self.log(f"EXIF读取失败: {str(e)}")
-            return None
-
-    def sanitize_filename(self, filename):
-        filename = filename.replace("?", "_").replace("<", "_").replace(">", "_")
-        filename = filename.replace("*", "_").replace("\"", "_").replace("'", "_")
-        filename = filename.replace("&", "_").replace("%", "_").replace("#", "_")
-        filename = filename.replace("+", "_")
-        return filename
-
-    def get_unique_filename(self, base_name, extension):
-        existing_files = os.listdir(self.selected_dir)
-        new_name = f"{base_name}{extension}"
-        if new_name in existing_files and " ｜ " in new_name:
-            # 如果文件名已经存在且是之前重命名生成的，直接使用该文件名
-            return new_name
-        counter = 1
-        while new_name in existing_files:
-            new_name = f"{base_name}_{counter}{extension}"
-            counter += 1
-        return new_name
-
-    def create_filename_parts(self, exif_data):
-        name_parts = []
-
-        if self.include_datetime.get() and 'DateTimeOriginal' in exif_data:
-            dt_str = exif_data['DateTimeOriginal']
-            dt = datetime.strptime(dt_str, '%Y:%m:%d %H:%M:%S')
-            name_parts.append(dt.strftime("%Y-%m-%d_%H.%M.%S"))
-
-        if self.include_camera.get() and 'Model' in exif_data:
-            camera_model = exif_data['Model'].strip().replace(" ", "")
-            name_parts.append(camera_model)
-
-        if self.include_lens.get():
-            lens_model = exif_data.get('LensModel') or exif_data.get('LensType')
-            if lens_model:
-                lens_model = lens_model.strip().replace(" ", "")
-                name_parts.append(lens_model)
-
-        if self.include_focal.get() and 'FocalLength' in exif_data:
-            try:
-                focal_value = exif_data['FocalLength'].split(' ')[0]
-                focal_float = float(focal_value)
-                focal_str = f"{focal_float:.1f}".rstrip('0').rstrip('.') + "mm"
-                name_parts.append(focal_str)
-            except (ValueError, KeyError) as e:
-                self.log(f"焦距解析失败: {str(e)}")
-
-        if self.include_exposure.get() and 'ExposureTime' in exif_data:
-            exposure = exif_data['ExposureTime']
-            try:
-                if '/' in exposure:
-                    numerator, denominator = exposure.split('/')
-                    exposure_str = f"{numerator}:{denominator}s"
-                elif float(exposure) >= 1.0:
-                    exposure_str = f"{float(exposure):.0f}s"
-                else:
-                    exposure_str = f"{float(exposure):.3f}s".rstrip('0').rstrip('.') + 's'
-                name_parts.append(exposure_str)
-            except (ValueError, KeyError) as e:
-                self.log(f"快门解析失败: {str(e)}")
-
-        if self.include_aperture.get() and 'FNumber' in exif_data:
-            aperture = str(exif_data['FNumber'])
-            name_parts.append(f"F{aperture}")
-
-        if self.include_iso.get():
-            iso = exif_data.get('ISOSpeedRatings') or exif_data.get('ISO')
-            if iso:
-                name_parts.append(f"ISO{iso}")
-
-        return name_parts
+            self.log(f"处理失败: {str(e)}")
+        finally:
+            self.channel.call(lambda: self.cancel_button.config(state=tk.DISABLED))
 
     def show_api_key(self, event):
         """当用户选中输入框时，显示真实的API Key"""
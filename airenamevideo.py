@@ -1,72 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import ffmpeg
-import xml.etree.ElementTree as ET
-from datetime import datetime
-import os
-import base64
-from zhipuai import ZhipuAI
 import threading
-import time
-
-
-def extract_keyframe(video_path):
-    try:
-        # 使用 ffmpeg 提取视频的第一帧
-        out, err = (
-            ffmpeg
-            .input(video_path)
-            .filter('select', 'eq(pict_type,PICT_TYPE_I)')
-            .output('pipe:', format='image2', vframes=1)
-            .run(capture_stdout=True, capture_stderr=True)
-        )
-        if err:
-            print(f"ffmpeg 错误信息: {err.decode('utf-8')}")
-        return out
-    except Exception as e:
-        print(f"提取关键帧时出错: {e}")
-        return None
-
-
-# 调用智谱 AI 接口获取视频描述
-def get_video_description(video_path, api_key, prompt):
-    client = ZhipuAI(api_key=api_key)
-    try:
-        # 提取关键帧
-        keyframes = extract_keyframe(video_path)
-        if keyframes:
-            # 对关键帧进行 Base64 编码
-            img_base = base64.b64encode(keyframes).decode('utf-8')
-            # 记录请求开始时间
-            start_time = time.time()
-            response = client.chat.completions.create(
-                model="glm-4v-plus",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": img_base
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
-                            }
-                        ]
-                    }
-                ]
-            )
-            # 记录请求结束时间并计算耗时
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            print(f"请求耗时: {elapsed_time:.2f} 秒")
-            return response.choices[0].message.content
-    except Exception as e:
-        messagebox.showerror("API 调用错误", f"调用智谱 AI 接口时出现错误: {str(e)}")
-        return None
+from ai_client import DEFAULT_AI_WORKERS
+from video_renamer import DEFAULT_PROMPT, VideoRenamer
+from rename_journal import latest_journal_path, new_journal_path, undo_journal
+from stage_timer import new_report_path
+from ui_channel import UIChannel, new_log_path
+from video_frames import DEFAULT_FRAME_MODE, FRAME_MODE_LABELS, FRAME_MODES
 
 
 class VideoMetadataRenamer:
@@ -89,10 +29,10 @@ class VideoMetadataRenamer:
         self.create_processing_components()
 
         self.selected_dir = ""
-        self.total_files = 0
-        self.cancel_flag = False
+        self.renamer = None
         self.api_key = ""
         self.ai_prompt = ""
+        self.ai_worker_count = DEFAULT_AI_WORKERS
         self.original_api_key = ""
 
     def create_api_key_input(self):
@@ -113,9 +53,19 @@ class VideoMetadataRenamer:
 
         ttk.Label(prompt_frame, text="AI 提示词:").pack(side=tk.LEFT, padx=5)
         self.prompt_entry = ttk.Entry(prompt_frame, width=50)
-        self.prompt_entry.insert(0, "简洁描述关键帧 10 字内")
+        self.prompt_entry.insert(0, DEFAULT_PROMPT)
         self.prompt_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
+        ttk.Label(prompt_frame, text="AI 并发数:").pack(side=tk.LEFT, padx=5)
+        self.ai_workers = tk.IntVar(value=DEFAULT_AI_WORKERS)
+        ttk.Spinbox(
+            prompt_frame,
+            from_=1,
+            to=32,
+            width=4,
+            textvariable=self.ai_workers
+        ).pack(side=tk.LEFT)
+
     def create_directory_selection(self):
         self.dir_frame = ttk.Frame(self.root)
         self.dir_frame.pack(pady=10, padx=10, fill=tk.X)
@@ -130,6 +80,20 @@ class VideoMetadataRenamer:
         )
         self.select_dir_button.pack(side=tk.LEFT, padx=5)
 
+        self.include_subfolders = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.dir_frame,
+            text="包含子文件夹",
+            variable=self.include_subfolders
+        ).pack(side=tk.LEFT, padx=5)
+
+        self.skip_processed = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            self.dir_frame,
+            text="跳过已处理的文件",
+            variable=self.skip_processed
+        ).pack(side=tk.LEFT, padx=5)
+
     def create_metadata_options(self):
         self.metadata_frame = ttk.LabelFrame(self.root, text="元数据选项")
         self.metadata_frame.pack(pady=10, padx=10, fill=tk.X)
@@ -181,6 +145,15 @@ class VideoMetadataRenamer:
             variable=self.include_ai_description
         ).pack(side=tk.LEFT, padx=5)
 
+        self.frame_mode = tk.StringVar(value=FRAME_MODE_LABELS[DEFAULT_FRAME_MODE])
+        ttk.Combobox(
+            self.metadata_frame,
+            textvariable=self.frame_mode,
+            values=[FRAME_MODE_LABELS[mode] for mode in FRAME_MODES],
+            state="readonly",
+            width=16
+        ).pack(side=tk.LEFT, padx=5)
+
     def create_processing_components(self):
         button_frame = ttk.Frame(self.root)
         button_frame.pack(pady=5)
@@ -199,12 +172,42 @@ class VideoMetadataRenamer:
         )
         self.cancel_button.pack(side=tk.LEFT, padx=5)
 
+        self.prefill_cache = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="仅生成 AI 描述缓存（不重命名）",
+            variable=self.prefill_cache
+        ).pack(side=tk.LEFT, padx=5)
+
+        self.dry_run = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="仅预览新文件名（不重命名）",
+            variable=self.dry_run
+        ).pack(side=tk.LEFT, padx=5)
+
+        self.plan_first = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="先计算全部新文件名再批量重命名",
+            variable=self.plan_first
+        ).pack(side=tk.LEFT, padx=5)
+
+        ttk.Button(
+            button_frame,
+            text="撤销上次重命名",
+            command=self.undo_last_run
+        ).pack(side=tk.LEFT, padx=5)
+
         self.log_text = tk.Text(self.root, state=tk.DISABLED)
         self.log_text.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
 
         self.progress_bar = ttk.Progressbar(self.root, orient="horizontal", length=500, mode="determinate")
         self.progress_bar.pack(pady=10, padx=10)
 
+        # 工作线程的日志和进度都经过它按帧批量更新到界面，完整日志另存到文件
+        self.channel = UIChannel(self.root, self.log_text, self.progress_bar, spill_path=new_log_path("video"))
+
     def select_directory(self):
         directory = filedialog.askdirectory()
         if directory:
@@ -213,86 +216,14 @@ class VideoMetadataRenamer:
             self.dir_entry.insert(0, directory)
 
     def log(self, message):
-        self.log_text.configure(state=tk.NORMAL)
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.log_text.configure(state=tk.DISABLED)
-
-    def get_video_metadata(self, file_path):
-        try:
-            probe = ffmpeg.probe(file_path)
-            resolution = None
-            frame_rate = None
-            codec = None
-            model = None
-
-            format_info = probe['format']
-            tags = format_info.get('tags', {})
-
-            possible_model_tags = ['model', 'Make', 'DeviceModelName', 'CameraModelName', 'ProductModel']
-            for tag in possible_model_tags:
-                if tag in tags:
-                    model = tags[tag]
-                    break
-
-            xml_metadata = tags.get('com.panasonic.Semi-Pro.metadata.xml')
-            if xml_metadata and not model:
-                try:
-                    root = ET.fromstring(xml_metadata)
-                    for elem in root.findall('.//*'):
-                        if elem.text and 'Model' in elem.tag:
-                            model = elem.text
-                            break
-                    if not model:
-                        print("未找到模型信息。")
-                except ET.ParseError as e:
-                    print(f"解析 XML 元数据时出错: {e}")
-
-            video_stream = next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
-            if video_stream:
-                width = video_stream.get('width')
-                height = video_stream.get('height')
-                if width and height:
-                    resolution = f"{width}x{height}"
-
-                r_frame_rate = video_stream.get('r_frame_rate')
-                if r_frame_rate:
-                    try:
-                        num, den = map(int, r_frame_rate.split('/'))
-                        frame_rate = num / den if den != 0 else None
-                    except ValueError:
-                        pass
-
-                profile = video_stream.get('profile')
-                codec_name = video_stream.get('codec_name')
-                if profile and codec_name:
-                    codec = f"{codec_name}_{profile}"
-
-                if not codec:
-                    codec_keywords = ['codec', 'encoding']
-                    for keyword in codec_keywords:
-                        for key, value in tags.items():
-                            if keyword.lower() in key.lower():
-                                codec = value
-                                break
-                        if codec:
-                            break
-
-                if not codec:
-                    codec = codec_name
-
-            return resolution, frame_rate, codec, model
-
-        except Exception as e:
-            self.log(f"读取元数据时出错: {e}")
-            return None, None, None, None
+        self.channel.log(message)
 
     def start_processing(self):
         if not self.selected_dir:
             messagebox.showerror("错误", "请先选择目录")
             return
 
-        if self.include_ai_description.get():
+        if self.include_ai_description.get() or self.prefill_cache.get():
             # 获取真实的 API Key
             api_key_input = self.api_entry.get()
             if api_key_input == '*' * len(self.original_api_key):
@@ -317,109 +248,72 @@ class VideoMetadataRenamer:
                 return
             self.ai_prompt = ai_prompt
 
-        self.cancel_flag = False
+            try:
+                self.ai_worker_count = self.ai_workers.get()
+            except tk.TclError:
+                messagebox.showerror("错误", "AI 并发数必须是整数")
+                return
+
+        self.renamer = VideoRenamer(
+            self.selected_dir,
+            include_modification_time=self.modification_time_var.get(),
+            include_model=self.model_var.get(),
+            include_resolution=self.resolution_var.get(),
+            include_frame_rate=self.frame_rate_var.get(),
+            include_codec=self.codec_var.get(),
+            include_ai_description=self.include_ai_description.get(),
+            recursive=self.include_subfolders.get(),
+            api_key=self.api_key,
+            ai_prompt=self.ai_prompt,
+            ai_workers=self.ai_worker_count,
+            frame_mode=self.selected_frame_mode(),
+            prefill_only=self.prefill_cache.get(),
+            dry_run=self.dry_run.get(),
+            plan_first=self.plan_first.get(),
+            journal_path=None if self.dry_run.get() else new_journal_path("video"),
+            incremental=self.skip_processed.get(),
+            report_path=new_report_path("video"),
+            log=self.log,
+            on_progress=self.channel.progress
+        )
         self.cancel_button.config(state=tk.NORMAL)
-        threading.Thread(target=self.process_files).start()
+        threading.Thread(target=self.process_files, args=(self.renamer,)).start()
+
+    def selected_frame_mode(self):
+        label = self.frame_mode.get()
+        for mode, mode_label in FRAME_MODE_LABELS.items():
+            if mode_label == label:
+                return mode
+        return DEFAULT_FRAME_MODE
 
     def cancel_processing(self):
-        self.cancel_flag = True
+        if self.renamer is not None:
+            self.renamer.cancel()
         self.cancel_button.config(state=tk.DISABLED)
         self.log("处理已取消")
 
-    def process_files(self):
-        supported_ext = ('.mp4', '.mov', '.avi', '.mkv')
-        file_count = 0
-        success_count = 0
-        error_count = 0
-
-        files = [filename for filename in os.listdir(self.selected_dir) if filename.lower().endswith(supported_ext)]
-        self.total_files = len(files)
-
-        self.progress_bar["maximum"] = self.total_files
-        self.log("开始处理...")
-
-        for i, filename in enumerate(files):
-            if self.cancel_flag:
-                break
-            file_count += 1
-            file_path = os.path.join(self.selected_dir, filename)
-
-            self.root.after(0, self.update_progress, i + 1)
-
-            try:
-                resolution, frame_rate, codec, model = self.get_video_metadata(file_path)
-
-                name_parts = []
-
-                if self.modification_time_var.get():
-                    mod_time = os.path.getmtime(file_path)
-                    dt = datetime.fromtimestamp(mod_time)
-                    name_parts.append(dt.strftime("%Y-%m-%d_%H.%M.%S"))
-
-                if self.model_var.get() and model:
-                    name_parts.append(model)
-
-                if self.resolution_var.get() and resolution:
-                    name_parts.append(resolution)
-
-                if self.frame_rate_var.get() and frame_rate:
-                    formatted_frame_rate = "{:.2f}".format(frame_rate)
-                    name_parts.append(formatted_frame_rate)
-
-                if self.codec_var.get() and codec:
-                    name_parts.append(codec)
-
-                if self.include_ai_description.get():
-                    description = get_video_description(file_path, self.api_key, self.ai_prompt)
-                    if description:
-                        description = self.sanitize_filename(description)
-                        name_parts.append(description)
-
-                new_name = " | ".join(name_parts)
-                if not new_name:
-                    self.log(f"跳过 {filename}：未获取到有效元数据用于重命名")
-                    error_count += 1
-                    continue
-
-                ext = os.path.splitext(filename)[1].lower()
-                new_filename = self.get_unique_filename(new_name, ext)
-
-                os.rename(
-                    file_path,
-                    os.path.join(self.selected_dir, new_filename)
-                )
-                self.log(f"重命名成功：{filename} -> {new_filename}")
-                success_count += 1
+    def undo_last_run(self):
+        journal = latest_journal_path("video")
+        if journal is None:
+            messagebox.showinfo("提示", "没有找到可以撤销的重命名记录")
+            return
+        if not messagebox.askyesno("确认", f"撤销以下记录中的所有重命名？\n{journal}"):
+            return
+        threading.Thread(target=self.undo_files, args=(journal,)).start()
 
-            except Exception as e:
-                self.log(f"处理失败 {filename}: {str(e)}")
-                error_count += 1
+    def undo_files(self, journal):
+        try:
+            undo_journal(journal, self.log)
+        except Exception as e:
+            self.log(f"撤销失败: {str(e)}")
 
-        self.cancel_button.config(state=tk.DISABLED)
-        self.log(f"处理完成！共处理 {file_count} 个文件，成功 {success_count} 个，失败 {error_count} 个")
-
-    def update_progress(self, value):
-        self.progress_bar["value"] = value
-
-    def sanitize_filename(self, filename):
-        filename = filename.replace("?", "_").replace("<", "_").replace(">", "_")
-        filename = filename.replace("*", "_").replace("\"", "_").replace("'", "_")
-        filename = filename.replace("&", "_").replace("%", "_").replace("#", "_")
-        filename = filename.replace("+", "_")
-        return filename
-
-    def get_unique_filename(self, base_name, extension):
-        new_name = f"{base_name}{extension}"
-        if os.path.exists(os.path.join(self.selected_dir, new_name)):
-            if " | " in base_name:
-                return new_name
-            counter = 1
-            while True:
-                temp_name = f"{base_name}_{counter}{extension}"
-                if not os.path.exists(os.path.join(self.selected_dir, temp_name)):
-                    return temp_name
-                counter += 1
-        return new_name
+    def process_files(self, renamer):
+        try:
+            renamer.run()
+        except Exception as e:
+            self.log(f"处理失败: {str(e)}")
+        finally:
+            self.channel.call(lambda: self.cancel_button.config(state=tk.DISABLED))
 
     def show_api_key(self, event):
         if self.api_entry.get() == '*' * len(self.original_api_key):
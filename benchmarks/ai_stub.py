@@ -0,0 +1,138 @@
+"""
+本地的 glm-4v-plus chat/completions 替身，用于离线基准测试
+延迟和错误率可配置；描述内容由图片内容的哈希决定，同一张图片总是得到同一个描述，
+多图请求返回 JSON 数组
+程序通过环境变量 ZHIPUAI_BASE_URL 指向它，例如 http://127.0.0.1:8765/api/paas/v4
+用法: python benchmarks/ai_stub.py [--port 8765] [--latency 0.8] [--jitter 0.2] [--error-rate 0.05]
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_PATH = "/api/paas/v4"
+SUBJECTS = ["山间小路", "城市夜景", "海边日落", "街头行人", "室内静物", "公园花丛", "雪后树林", "港口船只"]
+
+
+def describe(image):
+    digest = hashlib.sha256(image.encode("utf-8")).hexdigest()
+    return f"{SUBJECTS[int(digest[:8], 16) % len(SUBJECTS)]}{digest[:4]}"
+
+
+class StubStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.endswith("/chat/completions"):
+            self.send_json(404, {"error": {"code": "404", "message": "not found"}})
+            return
+
+        with server.stats.lock:
+            server.stats.requests += 1
+            server.stats.in_flight += 1
+            server.stats.max_in_flight = max(server.stats.max_in_flight, server.stats.in_flight)
+        try:
+            time.sleep(max(0.0, server.latency + server.rng.uniform(-server.jitter, server.jitter)))
+            if server.rng.random() < server.error_rate:
+                with server.stats.lock:
+                    server.stats.errors += 1
+                status = server.rng.choice(server.error_codes)
+                self.send_json(status, {"error": {"code": str(status), "message": "stub error"}})
+                return
+
+            request = json.loads(body or b"{}")
+            digest = hashlib.sha256(body).hexdigest()
+            images = [
+                part["image_url"]["url"]
+                for message in request.get("messages", [])
+                for part in (message.get("content") if isinstance(message.get("content"), list) else [])
+                if part.get("type") == "image_url"
+            ]
+            if len(images) > 1:
+                # 多图请求按要求返回 JSON 数组
+                content = json.dumps([describe(image) for image in images], ensure_ascii=False)
+            else:
+                content = describe(images[0] if images else "")
+            self.send_json(200, {
+                "id": digest[:16],
+                "created": int(time.time()),
+                "model": request.get("model", ""),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+                "usage": {"prompt_tokens": 100 * max(1, len(images)), "completion_tokens": 10 * max(1, len(images)),
+                          "total_tokens": 110 * max(1, len(images))},
+            })
+        finally:
+            with server.stats.lock:
+                server.stats.in_flight -= 1
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port=0, latency=0.8, jitter=0.2, error_rate=0.0, error_codes=(429, 500), seed=1):
+    """在后台线程启动替身服务，返回 (server, base_url)；port 为 0 时自动选择空闲端口"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.error_codes = list(error_codes)
+    server.rng = random.Random(seed)
+    server.stats = StubStats()
+    threading.Thread(target=server.serve_forever, name="ai-stub", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}{BASE_PATH}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 AI 接口替身")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.8, help="平均响应时间（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="响应时间的随机波动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的比例")
+    parser.add_argument("--error-codes", default="429,500", help="随机返回的错误状态码")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_stub(
+        args.port, args.latency, args.jitter, args.error_rate,
+        [int(code) for code in args.error_codes.split(",")], args.seed
+    )
+    print(f"AI 替身已启动：export ZHIPUAI_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"共 {server.stats.requests} 个请求，错误 {server.stats.errors} 个，最大并发 {server.stats.max_in_flight}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+对比每个文件启动一次 exiftool 与常驻 exiftool 进程的读取速度
+用法: python benchmarks/bench_exiftool.py <照片文件夹> [--limit N]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exiftool_session import ExifToolSession
+
+SUPPORTED_EXT = ('.jpg', '.jpeg', '.png', '.nef', '.tiff', '.dng')
+
+
+def read_per_process(files):
+    for file_path in files:
+        result = subprocess.run(
+            ['exiftool', '-json', file_path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if result.stdout.strip():
+            json.loads(result.stdout)[0]
+
+
+def read_with_session(files):
+    with ExifToolSession() as session:
+        for file_path in files:
+            session.get_metadata(file_path)
+
+
+def measure(name, func, files):
+    start_time = time.perf_counter()
+    func(files)
+    elapsed_time = time.perf_counter() - start_time
+    print(f"{name}: {len(files)} 个文件, {elapsed_time:.2f} 秒, {len(files) / elapsed_time:.1f} 文件/秒")
+    return elapsed_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="exiftool 读取速度对比")
+    parser.add_argument('folder')
+    parser.add_argument('--limit', type=int, default=500, help="最多测试的文件数")
+    args = parser.parse_args()
+
+    files = sorted(
+        os.path.join(args.folder, filename)
+        for filename in os.listdir(args.folder)
+        if filename.lower().endswith(SUPPORTED_EXT)
+    )[:args.limit]
+    if not files:
+        print("文件夹中没有支持的照片")
+        return 1
+
+    before = measure("每文件启动 exiftool", read_per_process, files)
+    after = measure("常驻 exiftool 进程", read_with_session, files)
+    print(f"加速比: {before / after:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+对比每次 os.listdir / os.path.exists 查重与内存文件名索引的速度
+用法: python benchmarks/bench_name_index.py [--entries 100000] [--lookups 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from name_index import NameIndex
+
+
+def listdir_unique(directory, base_name, extension):
+    """改动前 PhotoRenamerApp.get_unique_filename 的做法"""
+    existing_files = os.listdir(directory)
+    new_name = f"{base_name}{extension}"
+    counter = 1
+    while new_name in existing_files:
+        new_name = f"{base_name}_{counter}{extension}"
+        counter += 1
+    return new_name
+
+
+def exists_unique(directory, base_name, extension):
+    """改动前 VideoMetadataRenamer.get_unique_filename 的做法"""
+    new_name = f"{base_name}{extension}"
+    counter = 1
+    while os.path.exists(os.path.join(directory, new_name)):
+        new_name = f"{base_name}_{counter}{extension}"
+        counter += 1
+    return new_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重名检查速度对比")
+    parser.add_argument('--entries', type=int, default=100000, help="目录中的文件数")
+    parser.add_argument('--lookups', type=int, default=200, help="查重次数")
+    parser.add_argument('--collisions', type=int, default=50, help="每个基础名已有的重名文件数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        base_name = "2025-01-01_12.00.00 ｜ Camera"
+        for counter in range(args.collisions):
+            suffix = f"_{counter}" if counter else ""
+            open(os.path.join(directory, f"{base_name}{suffix}.jpg"), 'w').close()
+        for i in range(args.entries - args.collisions):
+            open(os.path.join(directory, f"IMG_{i:06d}.jpg"), 'w').close()
+        print(f"目录中共 {args.entries} 个文件，查重 {args.lookups} 次")
+
+        start_time = time.perf_counter()
+        for _ in range(args.lookups):
+            listdir_unique(directory, base_name, '.jpg')
+        elapsed = time.perf_counter() - start_time
+        print(f"os.listdir: {elapsed:.2f} 秒 ({elapsed / args.lookups * 1000:.2f} 毫秒/次)")
+
+        start_time = time.perf_counter()
+        for _ in range(args.lookups):
+            exists_unique(directory, base_name, '.jpg')
+        elapsed = time.perf_counter() - start_time
+        print(f"os.path.exists: {elapsed:.2f} 秒 ({elapsed / args.lookups * 1000:.2f} 毫秒/次)")
+
+        start_time = time.perf_counter()
+        index = NameIndex(directory)
+        build_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        for _ in range(args.lookups):
+            # claim 会占用返回的名字，与实际重命名时的行为一致
+            index.claim(base_name, '.jpg')
+        elapsed = time.perf_counter() - start_time
+        print(f"NameIndex: 建立索引 {build_time:.2f} 秒，查重 {elapsed:.4f} 秒 "
+              f"({elapsed / args.lookups * 1000:.4f} 毫秒/次)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+对比旧的整图解码 + 逐级降质量压缩与新的预览/缩放解码生成 AI 图片的开销
+每种方式在单独的子进程中运行，以便分别统计峰值内存
+用法: python benchmarks/bench_payload.py <照片文件夹> [--limit N]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from image_payload import build_image_payload
+
+SUPPORTED_EXT = ('.jpg', '.jpeg', '.png', '.nef', '.tiff', '.dng')
+
+
+def legacy_compress_image(image_path, max_size=1 * 1024 * 1024):
+    """改动前的 compress_image"""
+    img = Image.open(image_path)
+    quality = 90
+    while True:
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+        buffer.seek(0)
+        data = buffer.read()
+        if len(data) <= max_size or quality < 10:
+            break
+        quality -= 10
+    return base64.b64encode(data).decode('utf-8')
+
+
+METHODS = {
+    'legacy': legacy_compress_image,
+    'preview': build_image_payload,
+}
+
+
+def run_method(method, files):
+    func = METHODS[method]
+    errors = 0
+    start_cpu = time.process_time()
+    start_wall = time.perf_counter()
+    for file_path in files:
+        try:
+            func(file_path)
+        except Exception:
+            errors += 1
+    result = {
+        'method': method,
+        'files': len(files),
+        'errors': errors,
+        'cpu_seconds': time.process_time() - start_cpu,
+        'wall_seconds': time.perf_counter() - start_wall,
+        # Linux 上 ru_maxrss 的单位是 KB
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 图片生成开销对比")
+    parser.add_argument('folder')
+    parser.add_argument('--limit', type=int, default=50, help="最多测试的文件数")
+    parser.add_argument('--method', choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    files = sorted(
+        os.path.join(args.folder, filename)
+        for filename in os.listdir(args.folder)
+        if filename.lower().endswith(SUPPORTED_EXT)
+    )[:args.limit]
+    if not files:
+        print("文件夹中没有支持的照片")
+        return 1
+
+    if args.method:
+        run_method(args.method, files)
+        return 0
+
+    results = {}
+    for method in METHODS:
+        output = subprocess.run(
+            [sys.executable, __file__, args.folder, '--limit', str(args.limit), '--method', method],
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results[method] = result
+        per_file_ms = result['cpu_seconds'] / result['files'] * 1000
+        print(f"{method}: 每张 CPU {per_file_ms:.0f} 毫秒, 峰值内存 {result['peak_rss_mb']:.0f} MB, 失败 {result['errors']} 个")
+
+    legacy, preview = results['legacy'], results['preview']
+    print(f"CPU 时间减少 {legacy['cpu_seconds'] / preview['cpu_seconds']:.1f}x, "
+          f"峰值内存减少 {legacy['peak_rss_mb'] / preview['peak_rss_mb']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+离线运行照片、视频重命名和图片压缩三条流水线，统计吞吐量、各阶段延迟分位数和峰值内存
+- 素材由 make_corpus.py 生成（不指定 --corpus 时自动生成一份小的）
+- AI 请求发往本地替身 ai_stub.py，延迟和错误率可配置
+- 每个工具在单独的子进程中处理一份素材副本，HOME 指向临时目录，缓存和处理记录每次都从空开始
+用法: python benchmarks/bench_pipelines.py [--corpus 素材文件夹] [--tools photo,video,compressor] [--latency 0.8]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from ai_stub import start_stub
+from make_corpus import main as make_corpus
+
+TOOLS = {
+    # 工具名: (脚本, 素材子目录, 依赖的外部程序)
+    "photo": ("photo_renamer.py", "photos", ("exiftool",)),
+    "video": ("video_renamer.py", "videos", ("ffmpeg", "ffprobe")),
+    "compressor": ("image_compressor.py", "large_png", ()),
+}
+
+
+def run_tool(tool, corpus, work_dir, ai, extra_args, env):
+    script, subdir, _ = TOOLS[tool]
+    source = os.path.join(corpus, subdir)
+    target = os.path.join(work_dir, tool)
+    shutil.copytree(source, target)
+    files = sum(1 for name in os.listdir(target) if not name.startswith("."))
+    report_path = os.path.join(work_dir, f"{tool}-report.json")
+    results_path = os.path.join(work_dir, f"{tool}-results.jsonl")
+
+    command = [sys.executable, os.path.join(REPO_DIR, script), target, "--json", "--report", report_path, "--full"]
+    if tool != "compressor" and ai:
+        command.append("--ai")
+    command += extra_args
+
+    start = time.perf_counter()
+    with open(results_path, "w", encoding="utf-8") as stdout, open(os.devnull, "w") as stderr:
+        process = subprocess.Popen(command, stdout=stdout, stderr=stderr, env=env)
+        # wait4 只返回这个子进程自己的资源使用情况，不会和其他工具混在一起
+        _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+
+    with open(results_path, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    statuses = {}
+    for result in results:
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    report = {}
+    if os.path.exists(report_path):
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+
+    return {
+        "tool": tool,
+        "files": files,
+        "results": len(results),
+        "statuses": statuses,
+        "exit_code": os.waitstatus_to_exitcode(status),
+        "wall_seconds": wall,
+        "files_per_second": len(results) / wall if wall else 0,
+        # Linux 上 ru_maxrss 的单位是 KB
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "stages": report.get("stages", {}),
+        "stage_seconds": report.get("stage_seconds"),
+    }
+
+
+def print_result(result):
+    print(f"[{result['tool']}] {result['results']}/{result['files']} 个文件，"
+          f"{result['wall_seconds']:.2f} 秒，{result['files_per_second']:.1f} 个/秒，"
+          f"峰值内存 {result['peak_rss_mb']:.0f} MB，退出码 {result['exit_code']}")
+    print(f"  结果：{result['statuses']}")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage}: {stats['count']} 次，p50/p95/p99 = "
+              f"{stats['p50'] * 1000:.1f}/{stats['p95'] * 1000:.1f}/{stats['p99'] * 1000:.1f} 毫秒")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="三条流水线的离线基准测试")
+    parser.add_argument("--corpus", help="make_corpus.py 生成的素材文件夹，不指定时自动生成一份小的")
+    parser.add_argument("--tools", default="photo,video,compressor", help="要测试的工具，逗号分隔")
+    parser.add_argument("--no-ai", action="store_true", help="重命名时不使用 AI 描述")
+    parser.add_argument("--latency", type=float, default=0.8, help="AI 替身的平均响应时间（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="AI 替身响应时间的随机波动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="AI 替身返回 429/500 的比例")
+    parser.add_argument("--output", help="把全部结果保存为 JSON")
+    parser.add_argument("extra", nargs=argparse.REMAINDER, help="-- 之后的参数原样传给每个工具")
+    args = parser.parse_args(argv)
+
+    extra_args = [arg for arg in args.extra if arg != "--"]
+    tools = [tool.strip() for tool in args.tools.split(",") if tool.strip()]
+    for tool in tools:
+        if tool not in TOOLS:
+            parser.error(f"未知的工具: {tool}")
+
+    server, base_url = start_stub(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ai_renaming_bench_") as work_dir:
+        corpus = args.corpus
+        if corpus is None:
+            corpus = os.path.join(work_dir, "corpus")
+            print("生成素材...")
+            make_corpus([corpus, "--photos", "60", "--large-png", "3", "--videos", "6"])
+
+        home = os.path.join(work_dir, "home")
+        os.makedirs(home)
+        env = dict(os.environ, HOME=home, ZHIPUAI_BASE_URL=base_url, ZHIPUAI_API_KEY="bench.stub")
+
+        for tool in tools:
+            missing = [program for program in TOOLS[tool][2] if shutil.which(program) is None]
+            if missing:
+                print(f"[{tool}] 跳过：未找到 {', '.join(missing)}")
+                continue
+            if not os.path.isdir(os.path.join(corpus, TOOLS[tool][1])):
+                print(f"[{tool}] 跳过：素材中没有 {TOOLS[tool][1]}/")
+                continue
+            result = run_tool(tool, corpus, work_dir, not args.no_ai, extra_args, env)
+            results.append(result)
+            print_result(result)
+
+    server.shutdown()
+    print(f"AI 替身：{server.stats.requests} 个请求，错误 {server.stats.errors} 个，最大并发 {server.stats.max_in_flight}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"stub_requests": server.stats.requests, "results": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+生成用于基准测试的合成素材，结果只取决于参数和随机种子
+- photos/     带 EXIF 的 JPEG（以及少量 PNG），EXIF 内容可配置
+- large_png/  超过压缩阈值（9MB）的大 PNG
+- videos/     用 ffmpeg 测试源生成的 MP4/MOV 短片（需要 ffmpeg）
+用法: python benchmarks/make_corpus.py <输出文件夹> [--photos N] [--large-png N] [--videos N]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import piexif
+from PIL import Image
+
+CAMERAS = [
+    ("NIKON CORPORATION", "NIKON Z 6_2", "NIKKOR Z 24-70mm f/4 S"),
+    ("Canon", "Canon EOS R5", "RF24-105mm F4 L IS USM"),
+    ("SONY", "ILCE-7M4", "FE 35mm F1.8"),
+    ("FUJIFILM", "X-T5", "XF16-55mmF2.8 R LM WR"),
+]
+EXPOSURES = [(1, 1000), (1, 250), (1, 60), (1, 15), (2, 1)]
+APERTURES = [(18, 10), (28, 10), (40, 10), (80, 10)]
+ISOS = [100, 200, 400, 1600, 6400]
+
+
+def synthetic_image(rng, width, height, noise=12):
+    """平滑渐变加噪声，压缩后的大小接近真实照片"""
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    phase = rng.uniform(0, 6.28, size=3)
+    channels = [
+        127 + 100 * np.sin(6 * x + 4 * y + phase[i]) for i in range(3)
+    ]
+    pixels = np.stack(channels, axis=-1)
+    pixels += rng.normal(0, noise, size=pixels.shape).astype(np.float32)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def make_exif(rng, index, with_exif=True):
+    if not with_exif:
+        return None
+    make, model, lens = CAMERAS[index % len(CAMERAS)]
+    day = 1 + index % 28
+    second = index % 60
+    exposure = EXPOSURES[int(rng.integers(len(EXPOSURES)))]
+    aperture = APERTURES[int(rng.integers(len(APERTURES)))]
+    exif = {
+        "0th": {
+            piexif.ImageIFD.Make: make.encode(),
+            piexif.ImageIFD.Model: model.encode(),
+            piexif.ImageIFD.Orientation: 1,
+        },
+        "Exif": {
+            piexif.ExifIFD.DateTimeOriginal: f"2024:05:{day:02d} 10:{index // 60 % 60:02d}:{second:02d}".encode(),
+            piexif.ExifIFD.LensModel: lens.encode(),
+            piexif.ExifIFD.FocalLength: (int(rng.integers(14, 200)), 1),
+            piexif.ExifIFD.FNumber: aperture,
+            piexif.ExifIFD.ExposureTime: exposure,
+            piexif.ExifIFD.ISOSpeedRatings: ISOS[int(rng.integers(len(ISOS)))],
+        },
+    }
+    return piexif.dump(exif)
+
+
+def make_photos(folder, count, width, height, png_every, no_exif_every, rng):
+    os.makedirs(folder, exist_ok=True)
+    for index in range(count):
+        img = synthetic_image(rng, width, height)
+        exif = make_exif(rng, index, with_exif=not (no_exif_every and index % no_exif_every == 0))
+        if png_every and index % png_every == png_every - 1:
+            path = os.path.join(folder, f"IMG_{index:05d}.png")
+            img.save(path, format="PNG")
+        else:
+            path = os.path.join(folder, f"IMG_{index:05d}.jpg")
+            if exif is None:
+                img.save(path, format="JPEG", quality=92)
+            else:
+                img.save(path, format="JPEG", quality=92, exif=exif)
+
+
+def make_large_pngs(folder, count, width, height, rng):
+    """噪声较大的 PNG 几乎无法无损压缩，可以稳定地超过 9MB"""
+    os.makedirs(folder, exist_ok=True)
+    for index in range(count):
+        img = synthetic_image(rng, width, height, noise=60)
+        img.save(os.path.join(folder, f"LARGE_{index:03d}.png"), format="PNG")
+
+
+def make_videos(folder, count, seconds, size):
+    if shutil.which("ffmpeg") is None:
+        print("未找到 ffmpeg，跳过视频", file=sys.stderr)
+        return
+    os.makedirs(folder, exist_ok=True)
+    for index in range(count):
+        ext = ".mov" if index % 2 else ".mp4"
+        path = os.path.join(folder, f"CLIP_{index:04d}{ext}")
+        subprocess.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+                "-metadata", f"model={CAMERAS[index % len(CAMERAS)][1]}",
+                "-pix_fmt", "yuv420p", "-g", "30", path,
+            ],
+            check=True
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成基准测试用的合成照片、大 PNG 和视频")
+    parser.add_argument("folder")
+    parser.add_argument("--photos", type=int, default=200, help="照片数量")
+    parser.add_argument("--photo-size", default="2400x1600", help="照片分辨率")
+    parser.add_argument("--png-every", type=int, default=10, help="每 N 张照片中有一张保存为 PNG，0 表示不生成")
+    parser.add_argument("--no-exif-every", type=int, default=25, help="每 N 张照片中有一张没有 EXIF，0 表示都有")
+    parser.add_argument("--large-png", type=int, default=5, help="超过 9MB 的大 PNG 数量")
+    parser.add_argument("--large-png-size", default="3000x2000", help="大 PNG 的分辨率")
+    parser.add_argument("--videos", type=int, default=10, help="视频数量")
+    parser.add_argument("--video-seconds", type=float, default=3, help="每段视频的时长（秒）")
+    parser.add_argument("--video-size", default="1280x720", help="视频分辨率")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    width, height = map(int, args.photo_size.split("x"))
+    large_width, large_height = map(int, args.large_png_size.split("x"))
+
+    make_photos(os.path.join(args.folder, "photos"), args.photos, width, height,
+                args.png_every, args.no_exif_every, rng)
+    make_large_pngs(os.path.join(args.folder, "large_png"), args.large_png, large_width, large_height, rng)
+    make_videos(os.path.join(args.folder, "videos"), args.videos, args.video_seconds, args.video_size)
+    print(f"素材已生成：{args.folder}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
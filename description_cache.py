@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ai_renaming", "descriptions.sqlite3")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 键、模型名和描述的总字节数上限
+DEFAULT_MAX_AGE_DAYS = 180
+
+
+class DescriptionCache:
+    """
+    AI 描述的本地缓存（SQLite）
+    键为发送给模型的内容哈希 + 模型名 + 提示词，内容和提示词不变时不再重复调用 API
+    每次写入都立即提交，运行中途失败或取消后已得到的描述也不会丢失
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS descriptions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                description TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_descriptions_last_used ON descriptions (last_used)")
+        self.conn.commit()
+        self.evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def make_key(model, prompt, payload):
+        """payload 为发送给模型的内容（Base64 字符串或原始字节）"""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompt.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(payload)
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT description FROM descriptions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE descriptions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key, model, description):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO descriptions (key, model, description, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, description, now, now)
+            )
+            self.conn.commit()
+            self.writes += 1
+
+    def size_bytes(self):
+        """已存储的键、模型名和描述的总字节数；删除的页面会被重用，数据库文件大小随之稳定在这个量级"""
+        row = self.conn.execute(
+            "SELECT SUM(length(key) + length(model) + length(CAST(description AS BLOB))) FROM descriptions"
+        ).fetchone()
+        return row[0] or 0
+
+    def evict(self):
+        """删除过期的记录，并在超出大小上限时从最久未使用的记录开始删除，直到不超过上限"""
+        with self._lock:
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                self.conn.execute("DELETE FROM descriptions WHERE created < ?", (cutoff,))
+            if self.max_bytes:
+                excess = self.size_bytes() - self.max_bytes
+                if excess > 0:
+                    # 按 last_used 累加每条记录的大小，删除累计量达到超出部分为止的记录
+                    self.conn.execute(
+                        """
+                        DELETE FROM descriptions WHERE key IN (
+                            SELECT key FROM (
+                                SELECT key, size, SUM(size) OVER (ORDER BY last_used, key) AS freed
+                                FROM (
+                                    SELECT key, last_used,
+                                           length(key) + length(model) + length(CAST(description AS BLOB)) AS size
+                                    FROM descriptions
+                                )
+                            )
+                            WHERE freed - size < ?
+                        )
+                        """,
+                        (excess,)
+                    )
+            self.conn.commit()
+
+    def stats_text(self):
+        return f"AI描述缓存：命中 {self.hits} 次，未命中 {self.misses} 次，新增 {self.writes} 条"
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -0,0 +1,136 @@
+import json
+import os
+import subprocess
+import threading
+
+# create_filename_parts 用到的标签，只请求这些标签以减少 exiftool 的输出和解析开销
+EXIF_TAGS = (
+    'DateTimeOriginal',
+    'SubSecTimeOriginal',
+    'Model',
+    'LensModel',
+    'LensType',
+    'FocalLength',
+    'ExposureTime',
+    'FNumber',
+    'ISO',
+    'ISOSpeedRatings',
+)
+
+
+class ExifToolError(Exception):
+    pass
+
+
+class ExifToolSession:
+    """
+    常驻的 exiftool 进程（-stay_open True -@ -），避免每个文件都启动一次 Perl
+    进程意外退出时会自动重启并重试一次
+    """
+
+    def __init__(self, executable='exiftool', tags=EXIF_TAGS):
+        self.executable = executable
+        self.tags = tuple(tags)
+        self.process = None
+        self.restart_count = 0
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        if self.running:
+            return
+        self.process = subprocess.Popen(
+            [
+                self.executable,
+                '-stay_open', 'True',
+                '-@', '-',
+                '-common_args', '-json', '-fast', '-charset', 'filename=utf8',
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.process.stdin.write(b'-stay_open\nFalse\n')
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        finally:
+            for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+                if stream:
+                    stream.close()
+            self.process = None
+
+    def restart(self):
+        if self.process is not None:
+            try:
+                self.process.kill()
+                self.process.wait()
+            except OSError:
+                pass
+            self.close()
+        self.restart_count += 1
+        self.start()
+
+    def execute(self, *args):
+        """发送一条命令，返回 (stdout, stderr) 文本"""
+        with self._lock:
+            try:
+                return self._execute(args)
+            except (OSError, ExifToolError):
+                # exiftool 崩溃或管道断开，重启后重试一次
+                self.restart()
+                return self._execute(args)
+
+    def _execute(self, args):
+        if not self.running:
+            self.start()
+        self._counter += 1
+        ready = f'{{ready{self._counter}}}'
+        lines = list(args) + ['-echo4', ready, f'-execute{self._counter}']
+        command = ''.join(line + '\n' for line in lines)
+        self.process.stdin.write(command.encode('utf-8'))
+        self.process.stdin.flush()
+        stdout = self._read_until(self.process.stdout, ready)
+        stderr = self._read_until(self.process.stderr, ready)
+        return stdout, stderr
+
+    def _read_until(self, stream, marker):
+        marker = marker.encode('utf-8')
+        output = []
+        while True:
+            line = stream.readline()
+            if not line:
+                raise ExifToolError("exiftool 进程意外退出")
+            if line.rstrip(b'\r\n') == marker:
+                break
+            output.append(line)
+        return b''.join(output).decode('utf-8', errors='replace')
+
+    def get_metadata(self, file_path):
+        """读取单个文件的标签，返回 (标签字典或 None, 错误信息)"""
+        args = [f'-{tag}' for tag in self.tags]
+        args.append(os.fspath(file_path))
+        stdout, stderr = self.execute(*args)
+        stdout = stdout.strip()
+        if not stdout:
+            return None, stderr.strip()
+        return json.loads(stdout)[0], stderr.strip()
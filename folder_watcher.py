@@ -0,0 +1,236 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+DEFAULT_POLL_INTERVAL = 5.0
+SETTLE_SECONDS = 1.0  # 收到第一个事件后再等这么久，把同一批到达的文件合在一起处理
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_ONLYDIR
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def iter_files(directory, extensions):
+    """directory 及其子文件夹中扩展名符合的文件路径"""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(extensions):
+                yield os.path.join(root, name)
+
+
+class _Inotify:
+    """用 ctypes 调用 Linux 的 inotify，不需要额外的依赖"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(_IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.paths = {}
+
+    def add_tree(self, directory):
+        """监视 directory 及其所有子文件夹，监视数超过系统上限时抛出 OSError"""
+        for root, _, _ in os.walk(directory):
+            wd = self._add_watch(self.fd, os.fsencode(root), _WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, f"{os.strerror(errno)}: {root}")
+            self.paths[wd] = root
+
+    def read(self, timeout):
+        """等待最多 timeout 秒，返回 [(所在目录, 文件名, mask), ...]"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & _IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            events.append((self.paths.get(wd), name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    持续产出 folder（含子文件夹）中新出现或写完的文件
+    Linux 上使用 inotify，只在文件写完（IN_CLOSE_WRITE）或移入时通知；
+    inotify 不可用或监视数超过系统上限时退回轮询：只检查各文件夹的修改时间，
+    有变化的文件夹才列出其中的文件名，与上次列出的结果比较，只有新出现或被替换（inode 变化）的文件
+    才会被检查，大小和修改时间在两次轮询之间不再变化才视为写完
+    两种方式检查和产出的文件数都只与新文件数成正比，与已有文件的总数无关
+    """
+
+    def __init__(self, folder, extensions, interval=DEFAULT_POLL_INTERVAL, log=print):
+        self.folder = folder
+        self.extensions = extensions
+        self.interval = interval
+        self.log = log
+        self.inotify = None
+        self.dir_mtimes = {}
+        self.dir_entries = {}  # 轮询时各文件夹中上次看到的 {文件名: inode}
+        self.pending = {}
+        if sys.platform.startswith("linux"):
+            try:
+                self.inotify = _Inotify()
+                self.inotify.add_tree(folder)
+            except (OSError, AttributeError) as e:
+                self.log(f"无法使用 inotify（{e}），改为每 {interval:g} 秒轮询一次")
+                if self.inotify is not None:
+                    self.inotify.close()
+                    self.inotify = None
+        if self.inotify is None:
+            # 已有的文件由调用方自己处理，只记下来作为比较的基准
+            self._snapshot_dirs(folder, baseline=True)
+
+    @property
+    def method(self):
+        return "inotify" if self.inotify is not None else f"每 {self.interval:g} 秒轮询"
+
+    def batches(self, stop=None):
+        """每当有新文件时产出一批路径；stop 为 threading.Event，设置后结束"""
+        while stop is None or not stop.is_set():
+            paths = self._wait_inotify() if self.inotify is not None else self._poll(stop)
+            if paths:
+                yield sorted(paths)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def _wait_inotify(self):
+        paths = set()
+        deadline = None
+        while True:
+            timeout = 1.0 if deadline is None else max(0.0, deadline - time.monotonic())
+            events = self.inotify.read(timeout)
+            if not events and (deadline is None or time.monotonic() >= deadline):
+                # 空闲时每秒返回一次，让调用方检查 stop
+                return paths
+            for directory, name, mask in events:
+                if mask & _IN_Q_OVERFLOW:
+                    self.log("文件事件过多，重新检查整个文件夹")
+                    paths.update(iter_files(self.folder, self.extensions))
+                    continue
+                if directory is None:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        # 新文件夹：加入监视，并处理加入监视之前已经在里面的文件
+                        try:
+                            self.inotify.add_tree(path)
+                        except OSError as e:
+                            self.log(f"无法监视 {path}: {e}")
+                        paths.update(iter_files(path, self.extensions))
+                elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO) and name.lower().endswith(self.extensions):
+                    paths.add(path)
+            if paths and deadline is None:
+                deadline = time.monotonic() + SETTLE_SECONDS
+
+    def _snapshot_dirs(self, directory, baseline=False):
+        changed = []
+        for root, _, _ in os.walk(directory):
+            try:
+                mtime = os.stat(root).st_mtime_ns
+            except OSError:
+                continue
+            if self.dir_mtimes.get(root) != mtime:
+                self.dir_mtimes[root] = mtime
+                changed.append(root)
+                if baseline:
+                    self.dir_entries[root] = self._list_files(root) or {}
+        return changed
+
+    def _list_files(self, directory):
+        """{文件名: inode}，inode 在 Linux 和 macOS 上由 scandir 直接给出，不需要逐个 stat"""
+        try:
+            with os.scandir(directory) as entries:
+                return {
+                    entry.name: entry.inode()
+                    for entry in entries
+                    if entry.name.lower().endswith(self.extensions) and entry.is_file()
+                }
+        except OSError:
+            return None
+
+    def _poll(self, stop):
+        if stop is not None:
+            if stop.wait(self.interval):
+                return []
+        else:
+            time.sleep(self.interval)
+
+        for directory in list(self.dir_mtimes):
+            if not os.path.isdir(directory):
+                del self.dir_mtimes[directory]
+                self.dir_entries.pop(directory, None)
+        for directory in self._changed_dirs():
+            current = self._list_files(directory)
+            if current is None:
+                continue
+            known = self.dir_entries.get(directory, {})
+            for name, inode in current.items():
+                # 新文件，或者被另一个文件替换（例如先写临时文件再改名覆盖）
+                if known.get(name) != inode:
+                    self.pending.setdefault(os.path.join(directory, name), None)
+            self.dir_entries[directory] = current
+
+        ready = []
+        for path, previous in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current == previous:
+                ready.append(path)
+                del self.pending[path]
+            else:
+                self.pending[path] = current
+        return ready
+
+    def _changed_dirs(self):
+        changed = []
+        for directory, mtime in list(self.dir_mtimes.items()):
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            if current == mtime:
+                continue
+            self.dir_mtimes[directory] = current
+            changed.append(directory)
+            # 只需要遍历新建的子文件夹，已知的子文件夹有自己的修改时间
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False) and entry.path not in self.dir_mtimes:
+                            changed.extend(self._snapshot_dirs(entry.path))
+            except OSError:
+                continue
+        return changed
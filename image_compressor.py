@@ -0,0 +1,659 @@
+import argparse
+import io
+import math
+import os
+import sys
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+import piexif
+
+from folder_watcher import DEFAULT_POLL_INTERVAL, FolderWatcher
+from pipeline import log_to_stderr, print_json_result, scan_files
+from stage_timer import StageTimer, measure
+from state_store import DEFAULT_STATE_PATH, StateStore
+
+TARGET_SIZE = 9 * 1024 * 1024  # 9MB
+# 与重命名工具的处理记录分开保存：两者以同一个 inode 为键，放在一起会互相覆盖
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.dirname(DEFAULT_STATE_PATH), "compressor.sqlite3")
+SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png')
+MAX_QUALITY = 95
+PROBE_PIXELS = 1000000  # 估算文件大小时使用的缩小图的像素数
+PROBE_QUALITIES = (95, 90, 85, 75, 60, 45, 30, 15, 1)
+OPTIMIZE_GAIN = 0.05  # optimize 通常能再省下的比例，超出目标不多时值得用 optimize 再试一次
+RESIZE_QUALITY = 85
+RESIZE_MARGIN = 0.95  # 缩小尺寸时按目标大小的 95% 计算，留出估算误差
+RESIZE_UNDERSHOOT = 0.85  # 缩小后低于目标的 85% 时放大一些重新缩小，避免损失太多分辨率
+MIN_RESIZE_WIDTH = 500
+DEFAULT_PNG_LEVEL = 6  # zlib 压缩级别 0-9，9 比 6 慢得多，文件通常只小几个百分点
+DEFAULT_PNG_COLORS = 256  # 调色板 PNG 的颜色数，0 表示不使用调色板
+PNG_SAMPLE_STRIPS = 8
+PNG_ESTIMATE_MARGIN = 1.05  # 样本估算的误差通常在 ±8% 以内，预计超出目标 5% 以上时不对整张图编码
+MEMORY_OVERHEAD = 3  # 解码后的像素数据之外，旋转、转换和缩放还会产生几份同样大小的副本
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+PILLOW_MAX_PIXELS = Image.MAX_IMAGE_PIXELS  # Pillow 默认的解压炸弹检查上限
+
+
+def default_memory_budget():
+    """物理内存的一半，取不到时为 4GB"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (AttributeError, ValueError, OSError):
+        return 4 * 1024 * 1024 * 1024
+
+
+def estimate_memory(path):
+    """
+    只读文件头，估算处理这张图片需要的内存：宽 × 高 × 通道数 × MEMORY_OVERHEAD
+    超过 Pillow 上限两倍的图片 Pillow 会直接拒绝；介于两者之间的不再警告，由调用方按内存预算判断
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+        with Image.open(path) as img:
+            return img.width * img.height * len(img.getbands()) * MEMORY_OVERHEAD
+
+
+def compress_in_worker(settings, memory_budget, file_path, file_size):
+    """进程池中运行：返回 (结果, 日志, 各阶段耗时)，日志和耗时由主进程统一输出"""
+    messages = []
+    compressor = ImageCompressor(
+        **settings, workers=1, memory_budget=memory_budget, incremental=False, log=messages.append
+    )
+    compressor.timer = StageTimer()
+    result = compressor.compress_file(file_path, file_size)
+    return result, messages, compressor.timer.samples
+
+
+def encode_image(img, **options):
+    """在内存中编码，返回字节串"""
+    buffer = io.BytesIO()
+    img.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def write_atomic(path, data):
+    """先写临时文件再替换，中途出错不会留下写了一半的图片"""
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def probe_image(img, max_pixels=PROBE_PIXELS):
+    """缩小到约 max_pixels 像素的样本，用 Image.reduce 按整数倍缩小，代价很低"""
+    factor = math.ceil(math.sqrt(img.width * img.height / max_pixels))
+    return img.reduce(factor) if factor > 1 else img
+
+
+def sample_rows(img, max_pixels=PROBE_PIXELS, strips=PNG_SAMPLE_STRIPS):
+    """
+    从上到下等距取 strips 条整行宽的横条，拼成约 max_pixels 像素的样本，返回 (样本, 样本行数 / 原图行数)
+    PNG 按行过滤和压缩，缩小后的图片细节密度不同，无法用来估算；原分辨率的整行可以
+    """
+    strip_height = max(1, round(max_pixels / img.width / strips))
+    if strip_height * strips >= img.height:
+        return img, 1.0
+    # crop 保留模式、调色板和透明色，再把其余横条贴到同一张图上
+    sample = img.crop((0, 0, img.width, strip_height * strips))
+    step = (img.height - strip_height) / (strips - 1)
+    for index in range(1, strips):
+        top = round(index * step)
+        sample.paste(img.crop((0, top, img.width, top + strip_height)), (0, index * strip_height))
+    return sample, sample.height / img.height
+
+
+def make_palette(img, colors):
+    """RGB 图片用缩小图生成调色板；RGBA 的量化不能指定调色板，返回 None"""
+    if img.mode != "RGB":
+        return None
+    return probe_image(img).quantize(colors, method=Image.Quantize.MEDIANCUT)
+
+
+def quantize_image(img, colors, palette=None):
+    """转为调色板图片；有 palette 时套用它并做 Floyd-Steinberg 抖动，减少渐变处的色带"""
+    if palette is None:
+        return img.quantize(colors, method=Image.Quantize.FASTOCTREE)
+    return img.quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+
+
+def flatten_image(img):
+    """JPEG 不支持透明和调色板：带透明的图片合成到白色背景上，其余模式转为 RGB"""
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode not in ("RGB", "L"):
+        return img.convert("RGB")
+    return img
+
+
+class JpegSizeModel:
+    """
+    根据缩小图在几个质量下的每像素字节数预测整张图的 JPEG 大小
+    缩小图的细节密度与原图不同，每次实际编码后用真实大小修正比例
+    """
+
+    def __init__(self, img):
+        probe = probe_image(img)
+        pixels_ratio = img.width * img.height / (probe.width * probe.height)
+        self.points = sorted(
+            (quality, len(encode_image(probe, format="JPEG", quality=quality)) * pixels_ratio)
+            for quality in PROBE_QUALITIES
+        )
+        self.correction = 1.0
+
+    def estimate(self, quality):
+        """按样本点线性插值，不乘修正系数"""
+        for (q0, s0), (q1, s1) in zip(self.points, self.points[1:]):
+            if q0 <= quality <= q1:
+                return s0 + (s1 - s0) * (quality - q0) / (q1 - q0)
+        return self.points[-1][1] if quality > self.points[-1][0] else self.points[0][1]
+
+    def update(self, quality, size):
+        self.correction = size / max(1.0, self.estimate(quality))
+
+    def best_quality(self, target_size):
+        """预测大小低于 target_size 的最高质量，全都超出时返回 0"""
+        for quality in range(MAX_QUALITY, 0, -1):
+            if self.estimate(quality) * self.correction < target_size:
+                return quality
+        return 0
+
+
+class ImageCompressor:
+    """
+    图片压缩引擎，不依赖任何界面
+    日志和每个文件的结果通过回调交给调用方（GUI 或命令行）
+    """
+
+    def __init__(self, target_size=TARGET_SIZE, workers=DEFAULT_WORKERS, memory_budget=None, incremental=True,
+                 manifest_path=DEFAULT_MANIFEST_PATH, png_level=DEFAULT_PNG_LEVEL, png_colors=DEFAULT_PNG_COLORS,
+                 report_path=None, log=print, on_result=None):
+        self.target_size = target_size
+        self.png_level = png_level
+        self.png_colors = png_colors
+        self.workers = max(1, int(workers))
+        self.memory_budget = memory_budget or default_memory_budget()
+        # 超大全景图也要能压缩：Pillow 的解压炸弹检查放宽到解码后刚好放得进内存预算的像素数，
+        # 更大的图片在 iter_within_budget 中就会被拒绝，Pillow 的检查只是最后一道防线
+        Image.MAX_IMAGE_PIXELS = max(PILLOW_MAX_PIXELS, self.memory_budget // MEMORY_OVERHEAD)
+        # 记住已经检查过、之后没有改动的文件，重新运行时不再读取和记录它们
+        self.incremental = incremental
+        self.manifest_path = manifest_path
+        self.report_path = report_path
+        self.log = log
+        self.on_result = on_result
+        self.timer = None
+        self.manifest = None
+        # 影响压缩结果的选项，同时用于处理记录和进程池中的压缩器
+        self.settings = {"target_size": target_size, "png_level": png_level, "png_colors": png_colors}
+        self.settings_key = StateStore.make_settings_key({"tool": "compressor", **self.settings})
+
+    def report(self, file_path, status, original_size=None, new_size=None, error=None):
+        """每个图片处理结束时调用一次，status 为 compressed / skipped / unchanged / failed / error"""
+        if self.on_result is not None:
+            self.on_result({
+                "file": file_path,
+                "status": status,
+                "original_size": original_size,
+                "new_size": new_size,
+                "error": error,
+            })
+
+    def compress_images(self, folder):
+        """遍历并压缩图片，返回 {"total", "compressed", "skipped", "unchanged", "failed"} 统计"""
+        self.log("=== 开始处理 ===")
+        self.log(f"扫描文件夹: {folder}")
+        self.timer = StageTimer()
+        files = self.timer.iterate("scan", scan_files(folder, SUPPORTED_FORMATS, recursive=True))
+        summary = self.compress_paths(os.path.join(directory, name) for directory, name in files)
+        self.finish_run(summary)
+        return summary
+
+    def watch(self, folder, interval=DEFAULT_POLL_INTERVAL, stop=None):
+        """
+        先处理一遍整个文件夹，然后持续压缩新放入的图片，直到 stop（threading.Event）被设置或按下 Ctrl+C
+        在第一遍处理之前就开始监视，处理期间放入的文件不会漏掉
+        """
+        watcher = FolderWatcher(folder, SUPPORTED_FORMATS, interval, self.log)
+        total = {"total": 0, "compressed": 0, "skipped": 0, "unchanged": 0, "failed": 0}
+        try:
+            self.compress_images(folder)
+            self.log(f"=== 开始监视 {folder}（{watcher.method}）===")
+            self.timer = StageTimer()
+            for paths in watcher.batches(stop):
+                # 压缩后写回的文件也会触发通知，它们已在记录中，不再提示
+                for key, value in self.compress_paths(paths, log_unchanged=False).items():
+                    total[key] += value
+        finally:
+            watcher.close()
+            if self.timer is not None:
+                self.log("=== 停止监视 ===")
+                self.finish_run(total)
+        return total
+
+    def compress_paths(self, paths, log_unchanged=True):
+        """压缩 paths 中超过目标大小的图片，返回统计"""
+        summary = {"total": 0, "compressed": 0, "skipped": 0, "unchanged": 0, "failed": 0}
+        if self.incremental:
+            self.manifest = StateStore(self.manifest_path)
+        try:
+            jobs = self.iter_within_budget(self.iter_oversized(paths, summary), summary)
+            if self.workers > 1:
+                self.run_pool(jobs, summary)
+            else:
+                for file_path, file_size, _ in jobs:
+                    result = self.compress_file(file_path, file_size)
+                    self.finish_file(file_path, file_size, result, summary)
+        finally:
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
+        # 大小符合的文件不再逐个输出日志，大文件夹中它们占绝大多数
+        if summary["skipped"]:
+            self.log(f"跳过 {summary['skipped']} 个大小符合的文件")
+        if summary["unchanged"] and log_unchanged:
+            self.log(f"跳过 {summary['unchanged']} 个之前已检查且未改动的文件")
+        return summary
+
+    def finish_run(self, summary):
+        self.log("=== 处理完成 ===")
+        self.timer.finish()
+        for line in self.timer.report_lines():
+            self.log(line)
+        if self.report_path:
+            self.timer.save_json(self.report_path, tool="compressor", summary=summary)
+            self.log(f"耗时报告：{self.report_path}")
+
+    def iter_oversized(self, paths, summary):
+        """产出需要压缩的 (路径, 大小)，大小符合的直接记为跳过"""
+        pool_logged = False
+        for file_path in paths:
+            summary["total"] += 1
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                # 扫描或收到通知之后又被移走的文件
+                summary["total"] -= 1
+                continue
+            except OSError as e:
+                self.log(f"处理错误: {str(e)}")
+                summary["failed"] += 1
+                self.report(file_path, "error", error=str(e))
+                continue
+            name = os.path.basename(file_path)
+            if self.manifest is not None and self.manifest.is_processed(stat, name, self.settings_key):
+                summary["unchanged"] += 1
+                self.report(file_path, "unchanged", stat.st_size, stat.st_size)
+                continue
+            if stat.st_size < self.target_size:
+                summary["skipped"] += 1
+                self.report(file_path, "skipped", stat.st_size, stat.st_size)
+                if self.manifest is not None:
+                    self.manifest.mark_processed(stat, name, self.settings_key)
+                continue
+            if self.workers > 1 and not pool_logged:
+                self.log(f"使用 {self.workers} 个进程，内存预算 {self.format_size(self.memory_budget)}")
+                pool_logged = True
+            yield file_path, stat.st_size
+
+    def iter_within_budget(self, jobs, summary):
+        """
+        只读文件头估算每张图片解码后需要的内存，产出 (路径, 原大小, 估算内存)
+        单张就超出内存预算的图片（包括解压炸弹）不处理，直接记为错误
+        """
+        for file_path, file_size in jobs:
+            try:
+                memory = estimate_memory(file_path)
+            except Exception as e:
+                self.finish_file(file_path, file_size, ("error", None, str(e)), summary)
+                continue
+            if memory > self.memory_budget:
+                error = f"解码后约 {self.format_size(memory)}，超出内存预算 {self.format_size(self.memory_budget)}"
+                self.log(f"{os.path.basename(file_path)} {error}")
+                self.finish_file(file_path, file_size, ("error", None, error), summary)
+                continue
+            yield file_path, file_size, memory
+
+    def run_pool(self, jobs, summary):
+        """
+        在进程池中压缩，同时运行的任务不超过进程数，且估算的解码后内存之和不超过内存预算
+        子进程异常退出（例如被系统因内存不足结束）时进程池会损坏，受影响的任务逐个单独重试，其余图片照常处理
+        """
+        running = {}  # future -> (路径, 原大小, 估算内存)
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            for job in jobs:
+                memory = job[2]
+                while running and (len(running) >= self.workers
+                                   or sum(item[2] for item in running.values()) + memory > self.memory_budget):
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    executor = self.finish_done(executor, done, running, summary)
+                try:
+                    future = self.submit(executor, job)
+                except BrokenProcessPool:
+                    # 子进程在两次检查之间退出，先处理受影响的任务，再提交到新的进程池
+                    executor = self.recover_pool(executor, [], running, summary)
+                    future = self.submit(executor, job)
+                running[future] = job
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                executor = self.finish_done(executor, done, running, summary)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, executor, job):
+        file_path, file_size, _ = job
+        return executor.submit(compress_in_worker, self.settings, self.memory_budget, file_path, file_size)
+
+    def finish_done(self, executor, done, running, summary):
+        """处理已结束的任务，返回之后使用的进程池（进程池损坏时为新建的）"""
+        broken = []
+        for future in done:
+            job = running.pop(future)
+            if isinstance(future.exception(), BrokenProcessPool):
+                broken.append(job)
+            else:
+                self.finish_future(future, job, summary)
+        if broken:
+            executor = self.recover_pool(executor, broken, running, summary)
+        return executor
+
+    def recover_pool(self, executor, broken, running, summary):
+        """
+        进程池损坏后所有未完成的任务都会失败，无法知道是哪一张图片导致的：
+        先收下已经完成的结果，再在新的进程池中逐个单独重试受影响的图片，单独运行仍然退出的才记为失败
+        """
+        done, _ = wait(running)
+        for future in done:
+            job = running.pop(future)
+            if isinstance(future.exception(), BrokenProcessPool):
+                broken.append(job)
+            else:
+                self.finish_future(future, job, summary)
+        executor.shutdown(wait=True)
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        if broken:
+            self.log(f"处理图片的子进程异常退出，逐个重新处理受影响的 {len(broken)} 张图片")
+        for job in broken:
+            future = self.submit(executor, job)
+            wait([future])
+            if isinstance(future.exception(), BrokenProcessPool):
+                file_path, file_size, _ = job
+                self.finish_file(file_path, file_size, ("error", None, "处理该图片的子进程异常退出"), summary)
+                executor.shutdown(wait=True)
+                executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.finish_future(future, job, summary)
+        return executor
+
+    def finish_future(self, future, job, summary):
+        file_path, file_size, _ = job
+        try:
+            result, messages, samples = future.result()
+        except Exception as e:
+            # 子进程被系统结束（例如内存不足）等情况
+            self.finish_file(file_path, file_size, ("error", None, str(e)), summary)
+            return
+        for message in messages:
+            self.log(message)
+        self.timer.merge(samples)
+        self.finish_file(file_path, file_size, result, summary)
+
+    def compress_file(self, file_path, file_size):
+        """压缩单个图片，返回 (status, 新大小, 错误信息)；可以在子进程中运行"""
+        ext = os.path.splitext(file_path)[1].lower()
+        try:
+            self.log(f"处理 {os.path.basename(file_path)} - 原大小: {self.format_size(file_size)}")
+
+            with measure(self.timer, "decode"):
+                img = Image.open(file_path)
+                img.load()
+                img = self.fix_orientation(img, file_path)
+            if ext in ('.jpg', '.jpeg'):
+                output_path = file_path if self.compress_jpeg(img, file_path, self.target_size) else None
+            elif ext == '.png':
+                output_path = self.compress_png(img, file_path, self.target_size)
+
+            if output_path:
+                # PNG 转为 JPEG 时报告新文件的大小
+                return "compressed", os.path.getsize(output_path), None
+            return "failed", None, "无法达到目标大小"
+        except Exception as e:
+            return "error", None, str(e)
+
+    def finish_file(self, file_path, file_size, result, summary):
+        status, new_size, error = result
+        if status == "compressed":
+            self.log(f"压缩成功 - 新大小: {self.format_size(new_size)}")
+            summary["compressed"] += 1
+            if self.manifest is not None:
+                # 记录压缩后的文件（PNG 转为 JPEG 时原文件仍然保留，同样记录，下次不再转换）
+                try:
+                    self.manifest.mark_processed(os.stat(file_path), os.path.basename(file_path), self.settings_key)
+                except OSError:
+                    pass
+        elif status == "failed":
+            self.log("压缩失败：无法达到目标大小")
+            summary["failed"] += 1
+        else:
+            self.log(f"处理错误: {error}")
+            summary["failed"] += 1
+        self.report(file_path, status, file_size, new_size, error)
+
+    def fix_orientation(self, img, file_path):
+        """修正图片的 EXIF 方向信息"""
+        try:
+            exif_dict = piexif.load(file_path)
+            if '0th' in exif_dict and piexif.ImageIFD.Orientation in exif_dict['0th']:
+                orientation = exif_dict['0th'].pop(piexif.ImageIFD.Orientation)
+                if orientation == 2:
+                    img = img.transpose(Image.FLIP_LEFT_RIGHT)
+                elif orientation == 3:
+                    img = img.rotate(180)
+                elif orientation == 4:
+                    img = img.rotate(180).transpose(Image.FLIP_LEFT_RIGHT)
+                elif orientation == 5:
+                    img = img.rotate(-90, expand=True).transpose(Image.FLIP_LEFT_RIGHT)
+                elif orientation == 6:
+                    img = img.rotate(-90, expand=True)
+                elif orientation == 7:
+                    img = img.rotate(90, expand=True).transpose(Image.FLIP_LEFT_RIGHT)
+                elif orientation == 8:
+                    img = img.rotate(90, expand=True)
+        except Exception:
+            pass
+        return img
+
+    def find_jpeg_quality(self, img, target_size):
+        """
+        在内存中找出未优化编码小于 target_size 的最高质量
+        返回 (质量, 编码结果, 超出目标的最低质量, 它的大小)，都不满足时质量为 0、编码结果为 None
+        从缩小图估算的质量开始，每次编码后修正估算并在已知的上下界之间取下一个质量，通常两三次编码即可
+        搜索时不使用 optimize（两遍编码），它只会让文件更小
+        """
+        with measure(self.timer, "estimate"):
+            model = JpegSizeModel(img)
+        low, high = 0, MAX_QUALITY + 1  # low 是已知满足的最高质量，high 是已知超出的最低质量
+        best = None
+        high_size = None
+        quality = model.best_quality(target_size)
+        while high - low > 1:
+            quality = min(max(quality, low + 1), high - 1)
+            with measure(self.timer, "encode"):
+                data = encode_image(img, format="JPEG", quality=quality)
+            if len(data) < target_size:
+                low, best = quality, data
+            else:
+                high, high_size = quality, len(data)
+            model.update(quality, len(data))
+            quality = model.best_quality(target_size)
+        return low, best, high, high_size
+
+    def compress_jpeg(self, img, path, target_size):
+        """压缩 JPEG 文件，只有最终结果会写入磁盘"""
+        quality, data, next_quality, next_size = self.find_jpeg_quality(img, target_size)
+        if next_size is not None and next_size < target_size * (1 + OPTIMIZE_GAIN):
+            # 高一档的质量只超出一点，optimize 之后可能就满足了
+            with measure(self.timer, "encode"):
+                optimized = encode_image(img, format="JPEG", quality=next_quality, optimize=True)
+            if len(optimized) < target_size:
+                write_atomic(path, optimized)
+                return True
+        if data is not None:
+            with measure(self.timer, "encode"):
+                optimized = encode_image(img, format="JPEG", quality=quality, optimize=True)
+            if len(optimized) < len(data):
+                data = optimized
+            write_atomic(path, data)
+            return True
+
+        # 质量调低仍然超出 9MB，则缩小分辨率
+        img, data = self.resize_image(img, target_size)
+        if len(data) < target_size:
+            write_atomic(path, data)
+            return True
+        return False
+
+    def compress_png(self, img, path, target_size):
+        """
+        依次尝试无损 PNG、调色板 PNG 和 JPEG，返回写入的文件路径，都无法达到目标大小时返回 None
+        前两种先用原分辨率的横条样本估算大小，明显超出目标时不对整张图编码
+        """
+        name = os.path.basename(path)
+        with measure(self.timer, "estimate"):
+            sample, ratio = sample_rows(img)
+            estimate = len(encode_image(sample, format="PNG", compress_level=self.png_level)) / ratio
+        if estimate < target_size * PNG_ESTIMATE_MARGIN:
+            with measure(self.timer, "encode"):
+                data = encode_image(img, format="PNG", compress_level=self.png_level)
+            if len(data) < target_size:
+                write_atomic(path, data)
+                return path
+        else:
+            self.log(f"{name} 无损 PNG 预计 {self.format_size(estimate)}，超过限制")
+
+        if self.png_colors and img.mode in ("RGB", "RGBA"):
+            with measure(self.timer, "estimate"):
+                palette = make_palette(img, self.png_colors)
+                quantized = quantize_image(sample, self.png_colors, palette)
+                estimate = len(encode_image(quantized, format="PNG", compress_level=self.png_level)) / ratio
+            if estimate < target_size * PNG_ESTIMATE_MARGIN:
+                with measure(self.timer, "quantize"):
+                    quantized = quantize_image(img, self.png_colors, palette)
+                with measure(self.timer, "encode"):
+                    data = encode_image(quantized, format="PNG", compress_level=self.png_level)
+                if len(data) < target_size:
+                    self.log(f"{name} 转换为 {self.png_colors} 色调色板 PNG")
+                    write_atomic(path, data)
+                    return path
+                self.log(f"{name} {self.png_colors} 色调色板 PNG 为 {self.format_size(len(data))}，超过限制")
+            else:
+                self.log(f"{name} {self.png_colors} 色调色板 PNG 预计 {self.format_size(estimate)}，超过限制")
+
+        self.log(f"{name} PNG 超过限制，转换为 JPEG")
+        jpeg_path = os.path.splitext(path)[0] + ".jpg"
+        return jpeg_path if self.compress_jpeg(flatten_image(img), jpeg_path, target_size) else None
+
+    def resize_image(self, img, target_size, quality=RESIZE_QUALITY):
+        """
+        调整分辨率来进一步压缩，返回 (缩小后的图片, JPEG 数据)
+        由缩小图的每像素字节数直接算出目标尺寸，每次都从原图缩小，最多再按实际大小修正一次
+        （超出目标，或远低于目标时）
+        """
+        with measure(self.timer, "estimate"):
+            probe = probe_image(img)
+            probe_size = len(encode_image(probe, format="JPEG", quality=quality, optimize=True))
+        bytes_per_pixel = probe_size / (probe.width * probe.height)
+        scale = min(1.0, math.sqrt(target_size * RESIZE_MARGIN / (bytes_per_pixel * img.width * img.height)))
+
+        best = None
+        for attempt in range(2):
+            with measure(self.timer, "resize"):
+                resized = self.scale_image(img, scale)
+            with measure(self.timer, "encode"):
+                data = encode_image(resized, format="JPEG", quality=quality, optimize=True)
+            if len(data) < target_size:
+                best = (resized, data)
+                if len(data) >= target_size * RESIZE_UNDERSHOOT or scale >= 1.0:
+                    break
+            elif resized.width <= MIN_RESIZE_WIDTH:
+                break
+            # 文件大小与像素数大致成正比，按实际大小与目标的比例修正一次
+            scale = min(1.0, scale * math.sqrt(target_size * RESIZE_MARGIN / len(data)))
+        return best or (resized, data)
+
+    def scale_image(self, img, scale):
+        """
+        按比例缩小，宽度不小于 MIN_RESIZE_WIDTH
+        先用 Image.reduce 按整数倍快速缩小，剩下不到两倍的部分再用 LANCZOS 缩放到精确尺寸
+        """
+        width = max(min(img.width, MIN_RESIZE_WIDTH), round(img.width * scale))
+        height = max(1, round(img.height * width / img.width))
+        if (width, height) == img.size:
+            return img
+        factor = img.width // width
+        if factor >= 2:
+            img = img.reduce(factor)
+        if img.size != (width, height):
+            img = img.resize((width, height), Image.LANCZOS)
+        return img
+
+    def format_size(self, size):
+        return f"{size / (1024 * 1024):.2f}MB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="把超过大小限制的图片压缩到限制以内")
+    parser.add_argument("folder", help="目标文件夹（包含子文件夹）")
+    parser.add_argument("--target-mb", type=float, default=TARGET_SIZE / (1024 * 1024), help="目标大小（MB）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="同时压缩的进程数，1 表示在当前进程中逐个压缩")
+    parser.add_argument("--memory-mb", type=int, help="同时处理的图片解码后的内存上限（MB），默认为物理内存的一半；单张就超出的图片不处理")
+    parser.add_argument("--png-level", type=int, choices=range(10), default=DEFAULT_PNG_LEVEL, metavar="0-9",
+                        help="PNG 的压缩级别，越大越慢、文件越小")
+    parser.add_argument("--png-colors", type=int, default=DEFAULT_PNG_COLORS,
+                        help="无损 PNG 超过限制时先尝试的调色板颜色数（2-256），0 表示直接转换为 JPEG")
+    parser.add_argument("--full", action="store_true", help="重新检查所有文件，不跳过之前已检查且未改动的文件")
+    parser.add_argument("--watch", action="store_true", help="处理完后继续监视文件夹，压缩新放入的图片，按 Ctrl+C 结束")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="无法使用 inotify 时轮询文件夹的间隔（秒）")
+    parser.add_argument("--report", help="把各阶段耗时保存为 JSON 报告的路径")
+    parser.add_argument("--json", action="store_true", help="每个图片输出一行 JSON 结果，日志输出到 stderr")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"文件夹不存在: {args.folder}")
+    if args.png_colors and not 2 <= args.png_colors <= 256:
+        parser.error("--png-colors 必须为 0 或 2-256")
+
+    compressor = ImageCompressor(
+        target_size=int(args.target_mb * 1024 * 1024),
+        workers=args.workers,
+        memory_budget=args.memory_mb * 1024 * 1024 if args.memory_mb else None,
+        incremental=not args.full,
+        png_level=args.png_level,
+        png_colors=args.png_colors,
+        report_path=args.report,
+        log=log_to_stderr if args.json else print,
+        on_result=print_json_result if args.json else None
+    )
+    try:
+        if args.watch:
+            compressor.watch(args.folder, args.poll_interval)
+            return 0
+        summary = compressor.compress_images(args.folder)
+    except KeyboardInterrupt:
+        return 0 if args.watch else 130
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import base64
+import io
+import struct
+
+from PIL import Image, ImageOps
+
+# 视觉模型实际使用的输入分辨率有限，更大的图片只会增加编码和上传开销
+PAYLOAD_MAX_EDGE = 1280
+PAYLOAD_MAX_SIZE = 1 * 1024 * 1024
+PAYLOAD_QUALITY = 85
+
+RAW_EXTENSIONS = ('.nef', '.dng')
+
+# TIFF 标签
+_TAG_COMPRESSION = 0x0103
+_TAG_PHOTOMETRIC = 0x0106
+_TAG_STRIP_OFFSETS = 0x0111
+_TAG_ORIENTATION = 0x0112
+_TAG_STRIP_BYTE_COUNTS = 0x0117
+_TAG_SUB_IFDS = 0x014A
+_TAG_JPEG_OFFSET = 0x0201
+_TAG_JPEG_LENGTH = 0x0202
+
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+_TYPE_FORMATS = {3: 'H', 4: 'I', 8: 'h', 9: 'i', 13: 'I'}
+
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def _read_ifd(f, offset, byte_order):
+    """读取一个 IFD，返回 ({标签: 数值列表}, 下一个 IFD 偏移)"""
+    f.seek(offset)
+    count_data = f.read(2)
+    if len(count_data) < 2:
+        return {}, 0
+    (count,) = struct.unpack(byte_order + 'H', count_data)
+    entries = f.read(count * 12)
+    tags = {}
+    for i in range(count):
+        tag, typ, n = struct.unpack(byte_order + 'HHI', entries[i * 12:i * 12 + 8])
+        fmt = _TYPE_FORMATS.get(typ)
+        if fmt is None or n == 0 or n > 4096:
+            continue
+        size = _TYPE_SIZES[typ] * n
+        raw = entries[i * 12 + 8:i * 12 + 12]
+        if size > 4:
+            position = f.tell()
+            (value_offset,) = struct.unpack(byte_order + 'I', raw)
+            f.seek(value_offset)
+            raw = f.read(size)
+            f.seek(position)
+        tags[tag] = list(struct.unpack(byte_order + fmt * n, raw[:size]))
+    next_data = f.read(4)
+    next_offset = struct.unpack(byte_order + 'I', next_data)[0] if len(next_data) == 4 else 0
+    return tags, next_offset
+
+
+def open_embedded_preview(raw_path, max_edge=PAYLOAD_MAX_EDGE):
+    """
+    从 NEF/DNG 等 TIFF 结构的 RAW 文件中找出最大的内嵌 JPEG 预览并以缩放模式解码
+    :return: (图片或 None, EXIF 方向)
+    """
+    with open(raw_path, 'rb') as f:
+        header = f.read(8)
+        if header[:2] == b'II':
+            byte_order = '<'
+        elif header[:2] == b'MM':
+            byte_order = '>'
+        else:
+            return None, 1
+        (ifd_offset,) = struct.unpack(byte_order + 'I', header[4:8])
+
+        candidates = []
+        orientation = 1
+        queue = [ifd_offset]
+        visited = set()
+        while queue:
+            offset = queue.pop(0)
+            if not offset or offset in visited or len(visited) > 64:
+                continue
+            visited.add(offset)
+            tags, next_offset = _read_ifd(f, offset, byte_order)
+            queue.append(next_offset)
+            queue.extend(tags.get(_TAG_SUB_IFDS, []))
+
+            if offset == ifd_offset and _TAG_ORIENTATION in tags:
+                orientation = tags[_TAG_ORIENTATION][0]
+
+            if _TAG_JPEG_OFFSET in tags and _TAG_JPEG_LENGTH in tags:
+                candidates.append((tags[_TAG_JPEG_LENGTH][0], tags[_TAG_JPEG_OFFSET][0]))
+            elif (
+                tags.get(_TAG_COMPRESSION, [0])[0] in (6, 7)
+                and tags.get(_TAG_PHOTOMETRIC, [0])[0] in (2, 6)
+                and len(tags.get(_TAG_STRIP_OFFSETS, [])) == 1
+                and len(tags.get(_TAG_STRIP_BYTE_COUNTS, [])) == 1
+            ):
+                # DNG 的预览图以单条 JPEG 压缩的 strip 形式存放
+                candidates.append((tags[_TAG_STRIP_BYTE_COUNTS][0], tags[_TAG_STRIP_OFFSETS][0]))
+
+        # 从大到小尝试，跳过无法解码的数据（例如无损 JPEG 压缩的 RAW 数据本身）
+        for length, offset in sorted(candidates, reverse=True):
+            f.seek(offset)
+            data = f.read(length)
+            if not data.startswith(b'\xff\xd8'):
+                continue
+            try:
+                preview = Image.open(io.BytesIO(data))
+                preview.draft('RGB', (max_edge, max_edge))
+                preview.load()
+                return preview, orientation
+            except Exception:
+                continue
+    return None, orientation
+
+
+def load_preview_image(image_path, max_edge=PAYLOAD_MAX_EDGE):
+    """
+    以尽量低的代价得到长边不超过 max_edge 的 RGB 图片
+    RAW 文件使用内嵌预览，JPEG 使用 DCT 缩放解码（draft），其余格式正常解码后缩小
+    """
+    orientation = None
+    img = None
+    if image_path.lower().endswith(RAW_EXTENSIONS):
+        img, orientation = open_embedded_preview(image_path, max_edge)
+        if img is None:
+            orientation = None
+
+    if img is None:
+        img = Image.open(image_path)
+        if img.format == 'JPEG':
+            # 让 libjpeg 直接以 1/2、1/4、1/8 的比例解码
+            img.draft('RGB', (max_edge, max_edge))
+
+    if orientation is None:
+        img = ImageOps.exif_transpose(img)
+    elif orientation in _ORIENTATION_TRANSPOSE:
+        img = img.transpose(_ORIENTATION_TRANSPOSE[orientation])
+
+    if img.mode not in ('RGB', 'L'):
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        else:
+            img = img.convert('RGB')
+
+    img.thumbnail((max_edge, max_edge), Image.LANCZOS, reducing_gap=2.0)
+    return img
+
+
+def encode_jpeg(img, max_size=PAYLOAD_MAX_SIZE, quality=PAYLOAD_QUALITY):
+    """
+    编码为不超过 max_size 的 JPEG，通常一次完成
+    超出时按字节数比例一次性估算新的尺寸，最多再编码一次
+    """
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality)
+    data = buffer.getvalue()
+    if len(data) <= max_size:
+        return data
+
+    scale = (max_size / len(data)) ** 0.5 * 0.9
+    size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+    buffer = io.BytesIO()
+    img.resize(size, Image.LANCZOS).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def build_image_payload(image_path, max_size=PAYLOAD_MAX_SIZE, max_edge=PAYLOAD_MAX_EDGE):
+    """
+    生成发送给视觉模型的图片
+    :param image_path: 图片文件的路径
+    :param max_size: 最大允许的文件大小（字节），默认为1MB
+    :param max_edge: 长边的最大像素数
+    :return: JPEG 的 Base64 编码字符串
+    """
+    img = load_preview_image(image_path, max_edge)
+    data = encode_jpeg(img, max_size)
+    return base64.b64encode(data).decode('utf-8')
@@ -0,0 +1,82 @@
+import os
+import threading
+
+
+class NameIndex:
+    """
+    目录内文件名的内存索引
+    每次运行只扫描一次目录，之后随重命名原地更新，查找冲突不再访问磁盘
+    所有方法都可以在多个线程中同时调用
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with os.scandir(directory) as entries:
+            self.names = {entry.name for entry in entries}
+        # 本次运行中新产生的名字，扫描目录时据此跳过刚重命名出来的文件
+        self.created = set()
+        # 每个 (基础名, 扩展名) 下一次尝试的序号，避免每次都从 1 开始逐个尝试
+        self._next_counter = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self.names
+
+    def __len__(self):
+        with self._lock:
+            return len(self.names)
+
+    def claim(self, base_name, extension, current_name=None):
+        """
+        返回一个不冲突的文件名并立即占用
+        :param current_name: 正在被重命名的文件当前的名字，与它同名不算冲突
+        """
+        with self._lock:
+            new_name = f"{base_name}{extension}"
+            if new_name == current_name or new_name not in self.names:
+                self._add_created(new_name, current_name)
+                return new_name
+
+            # 文件已经是这个名字加序号的形式（之前重命名过），保持不变
+            if current_name is not None and self._is_numbered(current_name, base_name, extension):
+                return current_name
+
+            key = (base_name, extension)
+            counter = self._next_counter.get(key, 1)
+            while True:
+                new_name = f"{base_name}_{counter}{extension}"
+                counter += 1
+                if new_name == current_name or new_name not in self.names:
+                    break
+            self._next_counter[key] = counter
+            self._add_created(new_name, current_name)
+            return new_name
+
+    @staticmethod
+    def _is_numbered(name, base_name, extension):
+        prefix = f"{base_name}_"
+        if not (name.startswith(prefix) and name.endswith(extension)):
+            return False
+        counter = name[len(prefix):len(name) - len(extension)]
+        return counter.isdigit()
+
+    def _add_created(self, new_name, current_name):
+        self.names.add(new_name)
+        if new_name != current_name:
+            self.created.add(new_name)
+
+    def is_created(self, name):
+        """该名字是否是本次运行中重命名产生的"""
+        with self._lock:
+            return name in self.created
+
+    def discard(self, name):
+        """文件被移走，或重命名失败需要归还 claim 占用的名字时调用"""
+        with self._lock:
+            self.names.discard(name)
+            self.created.discard(name)
+
+    def add(self, name):
+        with self._lock:
+            self.names.add(name)
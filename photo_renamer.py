@@ -0,0 +1,467 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from ai_client import (
+    DEFAULT_AI_WORKERS, DEFAULT_BATCH_MAX_BYTES, DEFAULT_BATCH_SIZE, MODEL_NAME,
+    describe_batch_cached, describe_cached, get_client
+)
+from exiftool_session import ExifToolSession
+from image_payload import build_image_payload
+from pipeline import log_to_stderr, print_json_result
+from rate_limiter import DEFAULT_RATE, DEFAULT_RETRIES
+from rename_journal import new_journal_path, run_undo
+from renamer_base import RenamerBase, sanitize_filename
+from similar_images import DEFAULT_MAX_DISTANCE, DEFAULT_WINDOW_SECONDS, SimilarityGrouper, image_hashes
+from stage_timer import measure
+from state_store import DEFAULT_STATE_PATH
+
+SUPPORTED_EXT = ('.jpg', '.jpeg', '.png', '.nef', '.tiff', '.dng')
+DEFAULT_PROMPT = "简洁的描述图片字数10字以内，不要有任何断句"
+
+
+def get_image_description(img_path, api_key, prompt, cache=None, log=print, timer=None):
+    client = get_client(api_key)
+    with measure(timer, "payload"):
+        img_base = build_image_payload(img_path)
+
+    try:
+        with measure(timer, "ai"):
+            return describe_cached(client, img_base, prompt, cache, log=log)
+    except Exception as e:
+        log(f"调用API时发生错误: {e}")
+        return None
+
+
+class PhotoRenamer(RenamerBase):
+    """
+    照片重命名引擎，不依赖任何界面
+    日志、进度和每个文件的结果通过回调交给调用方（GUI 或命令行）
+    """
+
+    TOOL = "photo"
+    SUPPORTED_EXT = SUPPORTED_EXT
+
+    def __init__(
+            self,
+            directory,
+            include_datetime=True,
+            include_camera=True,
+            include_lens=True,
+            include_focal=True,
+            include_aperture=True,
+            include_exposure=True,
+            include_iso=True,
+            include_ai_description=False,
+            recursive=False,
+            api_key="",
+            ai_prompt=DEFAULT_PROMPT,
+            ai_workers=DEFAULT_AI_WORKERS,
+            ai_rate=DEFAULT_RATE,
+            ai_retries=DEFAULT_RETRIES,
+            ai_batch_size=DEFAULT_BATCH_SIZE,
+            ai_batch_bytes=DEFAULT_BATCH_MAX_BYTES,
+            group_similar=False,
+            similar_distance=DEFAULT_MAX_DISTANCE,
+            similar_window=DEFAULT_WINDOW_SECONDS,
+            prefill_only=False,
+            dry_run=False,
+            plan_first=False,
+            journal_path=None,
+            incremental=True,
+            state_path=DEFAULT_STATE_PATH,
+            report_path=None,
+            log=print,
+            on_progress=None,
+            on_result=None
+    ):
+        super().__init__(
+            directory,
+            include_ai_description=include_ai_description,
+            recursive=recursive,
+            api_key=api_key,
+            ai_prompt=ai_prompt,
+            ai_workers=ai_workers,
+            ai_rate=ai_rate,
+            ai_retries=ai_retries,
+            prefill_only=prefill_only,
+            dry_run=dry_run,
+            plan_first=plan_first,
+            journal_path=journal_path,
+            incremental=incremental,
+            state_path=state_path,
+            report_path=report_path,
+            log=log,
+            on_progress=on_progress,
+            on_result=on_result
+        )
+        self.include_datetime = include_datetime
+        self.include_camera = include_camera
+        self.include_lens = include_lens
+        self.include_focal = include_focal
+        self.include_aperture = include_aperture
+        self.include_exposure = include_exposure
+        self.include_iso = include_iso
+        self.ai_batch_size = ai_batch_size
+        self.ai_batch_bytes = ai_batch_bytes
+        # 连拍等相似照片只描述其中一张，其余沿用它的描述
+        self.group_similar = group_similar and self.use_ai
+        self.similar_distance = similar_distance
+        self.similar_window = similar_window
+
+        self.exiftool = None
+        self.grouper = None
+        # 代表照片尚未完成时先到达的同组照片，{分组: [task]}
+        self.waiting_for_group = {}
+
+    def add_stages(self, pipeline):
+        if not self.prefill_only or self.group_similar:
+            # 只生成缓存时不需要 EXIF，除非要分组：分组依赖拍摄时间，必须与正式运行选出相同的代表照片，
+            # 描述才能在正式运行时命中缓存
+            pipeline.add_stage("exif", self.read_metadata)
+        if self.group_similar:
+            self.grouper = SimilarityGrouper(self.similar_distance, self.similar_window)
+            # 多线程计算哈希，但按扫描顺序交给分组阶段，每次运行（包括只生成缓存时）分出的组都相同
+            pipeline.add_stage("hash", self.hash_image, workers=self.ai_worker_count, ordered=True)
+            # 单线程分组，保证代表照片总是先于同组的其他照片进入 AI 阶段
+            pipeline.add_stage("group", self.group_image)
+        if self.use_ai:
+            if self.ai_batch_size > 1:
+                # 先并行生成图片数据，再把多张图片合并到一个请求中
+                pipeline.add_stage("payload", self.build_payload, workers=self.ai_worker_count)
+                pipeline.add_batch_stage(
+                    "ai", self.describe_batch, self.ai_batch_size, workers=self.ai_worker_count
+                )
+            else:
+                pipeline.add_stage("ai", self.describe, workers=self.ai_worker_count)
+
+    def sorted_scan(self):
+        # 分组结果取决于照片到达的顺序，按文件名（通常就是拍摄顺序）处理，连拍的照片依次比较
+        return self.group_similar
+
+    def open_resources(self):
+        # 整个批次共用一个常驻 exiftool 进程
+        self.exiftool = ExifToolSession()
+        super().open_resources()
+
+    def finish_pipeline(self):
+        self.release_waiting_tasks()
+
+    def close_resources(self):
+        self.exiftool.close()
+        self.exiftool = None
+        super().close_resources()
+        if self.grouper is not None:
+            self.log(self.grouper.stats_text())
+
+    def naming_settings(self):
+        """影响新文件名的全部选项，任何一项变化都会让之前的处理记录失效"""
+        return {
+            "tool": self.TOOL,
+            "datetime": self.include_datetime,
+            "camera": self.include_camera,
+            "lens": self.include_lens,
+            "focal": self.include_focal,
+            "aperture": self.include_aperture,
+            "exposure": self.include_exposure,
+            "iso": self.include_iso,
+            "ai": self.use_ai,
+            "prompt": self.ai_prompt if self.use_ai else None,
+            "model": MODEL_NAME if self.use_ai else None,
+            "group_similar": self.group_similar,
+        }
+
+    def read_metadata(self, task):
+        if task.status is not None:
+            return task
+        try:
+            with self.timer.measure("exif"):
+                exif_data = self.get_exif_data(task.path)
+
+            if not exif_data:
+                self.log(f"跳过 {task.filename}：无EXIF信息")
+                task.fail("skipped", "无EXIF信息")
+                return task
+
+            task.name_parts = self.create_filename_parts(exif_data)
+            task.timestamp = self.capture_time(exif_data)
+        except Exception as e:
+            self.log(f"处理失败 {task.filename}: {str(e)}")
+            task.fail("failed", str(e))
+        return task
+
+    def capture_time(self, exif_data):
+        if 'DateTimeOriginal' not in exif_data:
+            return None
+        try:
+            timestamp = datetime.strptime(exif_data['DateTimeOriginal'], '%Y:%m:%d %H:%M:%S').timestamp()
+        except ValueError:
+            return None
+        sub_second = str(exif_data.get('SubSecTimeOriginal', '')).strip()
+        if sub_second.isdigit():
+            timestamp += float("0." + sub_second)
+        return timestamp
+
+    def hash_image(self, task):
+        if task.status is None:
+            try:
+                with self.timer.measure("hash"):
+                    task.hashes = image_hashes(task.path)
+                if task.timestamp is None:
+                    task.timestamp = os.path.getmtime(task.path)
+            except Exception as e:
+                # 无法计算哈希时不参与分组，照常单独描述
+                self.log(f"计算图片哈希失败 {task.filename}: {str(e)}")
+        return task
+
+    def group_image(self, task):
+        if task.status is None and task.hashes is not None:
+            task.group, task.representative = self.grouper.assign(task, *task.hashes, task.timestamp)
+            if not task.representative:
+                self.log(f"{task.filename} 与 {task.group.representative.filename} 相似，沿用其AI描述")
+            task.hashes = None
+        return task
+
+    def describe(self, task):
+        if not task.representative:
+            # 沿用代表照片的描述，在 finish_task 中填入
+            return task
+        try:
+            if task.status is None:
+                try:
+                    task.description = get_image_description(
+                        task.path, self.api_key, self.ai_prompt, self.description_cache, self.log, self.timer
+                    )
+                except Exception as e:
+                    self.log(f"处理失败 {task.filename}: {str(e)}")
+                    task.fail("failed", str(e))
+        finally:
+            if task.group is not None:
+                task.group.resolve(task.description)
+        return task
+
+    def build_payload(self, task):
+        if task.status is None and task.representative:
+            try:
+                with self.timer.measure("payload"):
+                    task.payload = build_image_payload(task.path)
+            except Exception as e:
+                self.log(f"处理失败 {task.filename}: {str(e)}")
+                task.fail("failed", str(e))
+        return task
+
+    def describe_batch(self, tasks):
+        pending = [task for task in tasks if task.status is None and task.representative]
+        if pending:
+            client = get_client(self.api_key)
+            try:
+                with self.timer.measure("ai"):
+                    descriptions = describe_batch_cached(
+                        client, [task.payload for task in pending], self.ai_prompt, self.description_cache,
+                        max_bytes=self.ai_batch_bytes, log=self.log
+                    )
+                for task, description in zip(pending, descriptions):
+                    task.description = description
+            except Exception as e:
+                self.log(f"调用API时发生错误: {e}")
+        for task in tasks:
+            # 图片数据已经用完，不再占用内存
+            task.payload = None
+            if task.group is not None and task.representative:
+                task.group.resolve(task.description)
+        return tasks
+
+    def finish_task(self, task):
+        """同组照片沿用代表照片的描述，代表照片完成后再处理先到达的同组照片"""
+        if task.status is None and not task.representative:
+            if not task.group.ready.is_set():
+                # 代表照片还没有处理完，等它到达这里时再一起处理，不阻塞任何线程
+                self.waiting_for_group.setdefault(task.group, []).append(task)
+                return
+            task.description = task.group.description
+            if not task.description:
+                # 代表照片失败或被取消时不能不带描述地完成，下次运行重新处理
+                if self.cancel_flag:
+                    task.fail("cancelled", "已取消")
+                else:
+                    task.fail("failed", f"代表照片 {task.group.representative.filename} 未获取到AI描述")
+
+        super().finish_task(task)
+
+        if task.group is not None and task.representative:
+            for follower in self.waiting_for_group.pop(task.group, ()):
+                self.finish_task(follower)
+
+    def release_waiting_tasks(self):
+        """代表照片因取消或出错没有到达 finish_task 时，同组照片在 finish_task 中记为取消或失败"""
+        waiting, self.waiting_for_group = self.waiting_for_group, {}
+        for group, tasks in waiting.items():
+            group.resolve(group.description)
+            for task in tasks:
+                self.finish_task(task)
+
+    def build_new_name(self, task):
+        name_parts = list(task.name_parts)
+        if task.description:
+            name_parts.append(sanitize_filename(task.description))
+        return sanitize_filename(" ｜ ".join(name_parts))
+
+    def get_exif_data(self, file_path):
+        """
+        返回标签字典，文件确实没有 EXIF 时返回 None
+        exiftool 无法启动、崩溃或报错时抛出异常，文件记为失败而不是跳过，下次运行会重新读取
+        """
+        if self.exiftool is None:
+            self.exiftool = ExifToolSession()
+        exif_data, error = self.exiftool.get_metadata(file_path)
+
+        if exif_data:
+            if error:
+                self.log(f"EXIFTool Error: {error}")
+            return exif_data
+        if error:
+            raise RuntimeError(f"EXIFTool Error: {error}")
+        self.log(f"EXIF数据为空 {file_path}")
+        return None
+
+    def create_filename_parts(self, exif_data):
+        name_parts = []
+
+        if self.include_datetime and 'DateTimeOriginal' in exif_data:
+            dt_str = exif_data['DateTimeOriginal']
+            dt = datetime.strptime(dt_str, '%Y:%m:%d %H:%M:%S')
+            name_parts.append(dt.strftime("%Y-%m-%d_%H.%M.%S"))
+
+        if self.include_camera and 'Model' in exif_data:
+            camera_model = exif_data['Model'].strip().replace(" ", "")
+            name_parts.append(camera_model)
+
+        if self.include_lens:
+            lens_model = exif_data.get('LensModel') or exif_data.get('LensType')
+            if lens_model:
+                lens_model = lens_model.strip().replace(" ", "")
+                name_parts.append(lens_model)
+
+        if self.include_focal and 'FocalLength' in exif_data:
+            try:
+                focal_value = exif_data['FocalLength'].split(' ')[0]
+                focal_float = float(focal_value)
+                focal_str = f"{focal_float:.1f}".rstrip('0').rstrip('.') + "mm"
+                name_parts.append(focal_str)
+            except (ValueError, KeyError) as e:
+                self.log(f"焦距解析失败: {str(e)}")
+
+        if self.include_exposure and 'ExposureTime' in exif_data:
+            exposure = exif_data['ExposureTime']
+            try:
+                if '/' in exposure:
+                    numerator, denominator = exposure.split('/')
+                    exposure_str = f"{numerator}:{denominator}s"
+                elif float(exposure) >= 1.0:
+                    exposure_str = f"{float(exposure):.0f}s"
+                else:
+                    exposure_str = f"{float(exposure):.3f}s".rstrip('0').rstrip('.') + 's'
+                name_parts.append(exposure_str)
+            except (ValueError, KeyError) as e:
+                self.log(f"快门解析失败: {str(e)}")
+
+        if self.include_aperture and 'FNumber' in exif_data:
+            aperture = str(exif_data['FNumber'])
+            name_parts.append(f"F{aperture}")
+
+        if self.include_iso:
+            iso = exif_data.get('ISOSpeedRatings') or exif_data.get('ISO')
+            if iso:
+                name_parts.append(f"ISO{iso}")
+
+        return name_parts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="读取照片 EXIF（可选 AI 描述）并重命名")
+    parser.add_argument("directory", nargs="?", help="照片所在的文件夹")
+    parser.add_argument("--no-datetime", action="store_true", help="不包含日期时间")
+    parser.add_argument("--no-camera", action="store_true", help="不包含相机型号")
+    parser.add_argument("--no-lens", action="store_true", help="不包含镜头型号")
+    parser.add_argument("--no-focal", action="store_true", help="不包含焦段")
+    parser.add_argument("--no-aperture", action="store_true", help="不包含光圈")
+    parser.add_argument("--no-exposure", action="store_true", help="不包含曝光时间")
+    parser.add_argument("--no-iso", action="store_true", help="不包含ISO")
+    parser.add_argument("--recursive", action="store_true", help="包含子文件夹")
+    parser.add_argument("--ai", action="store_true", help="使用AI描述")
+    parser.add_argument("--api-key", default=os.environ.get("ZHIPUAI_API_KEY", ""),
+                        help="智谱AI API Key，默认读取环境变量 ZHIPUAI_API_KEY")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="AI提示词")
+    parser.add_argument("--ai-workers", type=int, default=DEFAULT_AI_WORKERS,
+                        help="AI并发数上限，实际并发会根据限流情况自动调整")
+    parser.add_argument("--ai-rate", type=float, default=DEFAULT_RATE, help="每秒最多发出的AI请求数，0 表示不限")
+    parser.add_argument("--ai-retries", type=int, default=DEFAULT_RETRIES,
+                        help="AI请求遇到限流、服务器错误或超时时的最大重试次数")
+    parser.add_argument("--ai-batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="每个AI请求合并的图片数，1 表示逐张请求")
+    parser.add_argument("--ai-batch-mb", type=float, default=DEFAULT_BATCH_MAX_BYTES / (1024 * 1024),
+                        help="合并请求中图片数据的总大小上限（MB）")
+    parser.add_argument("--group-similar", action="store_true", help="连拍等相似照片只请求一次AI描述，其余照片沿用")
+    parser.add_argument("--similar-distance", type=int, default=DEFAULT_MAX_DISTANCE,
+                        help="视为相似的最大汉明距离（64 位哈希）")
+    parser.add_argument("--similar-window", type=float, default=DEFAULT_WINDOW_SECONDS,
+                        help="视为相似的最大拍摄时间差（秒）")
+    parser.add_argument("--prefill-cache", action="store_true", help="仅生成AI描述缓存，不重命名")
+    parser.add_argument("--dry-run", action="store_true", help="只计算新文件名并输出，不改动任何文件")
+    parser.add_argument("--plan", action="store_true", help="先计算全部新文件名并写入重命名记录，再批量重命名")
+    parser.add_argument("--journal", help="重命名记录文件路径，默认在 ~/.cache/ai_renaming/journals 下新建")
+    parser.add_argument("--full", action="store_true", help="重新处理所有文件，不跳过之前已处理且未改动的文件")
+    parser.add_argument("--report", help="把各阶段耗时保存为 JSON 报告的路径")
+    parser.add_argument("--undo", metavar="JOURNAL", help="根据重命名记录撤销一次运行，传 latest 表示最近一次")
+    parser.add_argument("--json", action="store_true", help="每个文件输出一行 JSON 结果，日志输出到 stderr")
+    args = parser.parse_args(argv)
+
+    if args.undo:
+        return run_undo(parser, args.undo, log_to_stderr if args.json else print, "photo")
+    if args.directory is None:
+        parser.error("需要指定照片所在的文件夹")
+    if not os.path.isdir(args.directory):
+        parser.error(f"目录不存在: {args.directory}")
+    if (args.ai or args.prefill_cache) and not args.api_key:
+        parser.error("使用AI描述时需要 --api-key 或环境变量 ZHIPUAI_API_KEY")
+
+    renamer = PhotoRenamer(
+        args.directory,
+        include_datetime=not args.no_datetime,
+        include_camera=not args.no_camera,
+        include_lens=not args.no_lens,
+        include_focal=not args.no_focal,
+        include_aperture=not args.no_aperture,
+        include_exposure=not args.no_exposure,
+        include_iso=not args.no_iso,
+        include_ai_description=args.ai,
+        recursive=args.recursive,
+        api_key=args.api_key,
+        ai_prompt=args.prompt,
+        ai_workers=args.ai_workers,
+        ai_rate=args.ai_rate,
+        ai_retries=args.ai_retries,
+        ai_batch_size=args.ai_batch_size,
+        ai_batch_bytes=int(args.ai_batch_mb * 1024 * 1024),
+        group_similar=args.group_similar,
+        similar_distance=args.similar_distance,
+        similar_window=args.similar_window,
+        prefill_only=args.prefill_cache,
+        dry_run=args.dry_run,
+        plan_first=args.plan,
+        journal_path=None if args.dry_run else (args.journal or new_journal_path("photo")),
+        incremental=not args.full,
+        report_path=args.report,
+        log=log_to_stderr if args.json else print,
+        on_result=print_json_result if args.json else None
+    )
+    try:
+        summary = renamer.run()
+    except KeyboardInterrupt:
+        return 130
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
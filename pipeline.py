@@ -0,0 +1,331 @@
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_BATCH_WAIT = 0.2  # 凑不满一批时最多等待的秒数
+DEPTH_SAMPLE_INTERVAL = 0.5  # 队列深度的采样间隔（秒）
+DEPTH_REPORT_INTERVAL = 10.0  # 调用 on_depths 的间隔（秒）
+
+_DONE = object()
+
+
+class _OrderedOutput:
+    """
+    让多线程阶段按进入该阶段的顺序输出：取输入时编号，先完成的结果等前面的都完成后再放入下一队列
+    被丢弃或出错的 item 也占一个编号，不会让后面的结果一直等下去
+    """
+
+    def __init__(self, input_queue, output_queue):
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.next_in = 0
+        self.next_out = 0
+        self.results = {}
+        self._in_lock = threading.Lock()
+        self._out_lock = threading.Lock()
+
+    def get(self):
+        with self._in_lock:
+            item = self.input_queue.get()
+            sequence = self.next_in
+            if item is not _DONE:
+                self.next_in += 1
+        return sequence, item
+
+    def put(self, sequence, result):
+        with self._out_lock:
+            self.results[sequence] = result
+            while self.next_out in self.results:
+                result = self.results.pop(self.next_out)
+                self.next_out += 1
+                if result is not None:
+                    self.output_queue.put(result)
+
+
+def scan_files(directory, extensions, recursive=False, skip=None, sort=False):
+    """
+    用 os.scandir 逐个产出 (所在目录, 文件名)，不会先把整个目录读进内存
+    :param extensions: 小写的扩展名元组
+    :param skip: skip(所在目录, 文件名) 返回 True 时跳过该文件，例如本次运行中刚重命名出来的文件
+    :param sort: 为 True 时每个目录内按文件名排序后再产出（需要先读完该目录的文件名），
+                 顺序不再取决于文件系统，相机按拍摄顺序编号的文件也就按拍摄顺序产出
+    """
+    pending_dirs = [directory]
+    while pending_dirs:
+        current = pending_dirs.pop()
+        try:
+            with os.scandir(current) as entries:
+                first_subdir = len(pending_dirs)
+                names = _matching_names(entries, extensions, recursive, pending_dirs)
+                if sort:
+                    names = sorted(names)
+                    # 出栈顺序即按名字的顺序
+                    pending_dirs[first_subdir:] = sorted(pending_dirs[first_subdir:], reverse=True)
+                for name in names:
+                    if skip is not None and skip(current, name):
+                        continue
+                    yield current, name
+        except OSError:
+            continue
+
+
+def _matching_names(entries, extensions, recursive, pending_dirs):
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    pending_dirs.append(entry.path)
+                continue
+        except OSError:
+            continue
+        if entry.name.lower().endswith(extensions):
+            yield entry.name
+
+
+def print_json_result(result):
+    print(json.dumps(result, ensure_ascii=False), flush=True)
+
+
+def log_to_stderr(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+class FileTask:
+    """流水线中流动的单个文件"""
+
+    def __init__(self, directory, filename):
+        self.directory = directory
+        self.filename = filename
+        self.path = os.path.join(directory, filename)
+        self.stat = None
+        self.payload = None
+        self.timestamp = None  # 拍摄时间（秒），用于相似照片分组
+        self.duration = None  # 视频时长（秒），用于选择取帧位置
+        self.prompt = None  # 需要针对单个文件改写提示词时使用，例如视频拼图
+        self.hashes = None
+        self.group = None
+        self.representative = True  # 不属于任何分组或是分组的代表时为 True
+        self.name_parts = []
+        self.description = None
+        self.status = None  # None 表示仍需继续处理，否则为 unchanged / skipped / failed
+        self.error = None
+
+    def fail(self, status, error):
+        self.status = status
+        self.error = error
+
+
+class Pipeline:
+    """
+    多阶段流水线：每个阶段有自己的线程数，阶段之间用有界队列连接
+    上游过快时会阻塞在 put 上，因此内存占用只与队列长度有关，与文件总数无关
+    最后的 sink 在调用 run() 的线程中依次执行
+    """
+
+    def __init__(self, source, queue_size=DEFAULT_QUEUE_SIZE, on_error=None, on_depths=None):
+        """
+        :param on_depths: 运行期间每隔 DEPTH_REPORT_INTERVAL 秒以 {阶段名: 等待数} 调用一次，用于调整各阶段线程数
+        """
+        self.source = source
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.on_depths = on_depths
+        self.stages = []
+        self.queues = []
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.depth_samples = 0
+        self.depth_totals = {}
+        self.depth_max = {}
+
+    def add_stage(self, name, func, workers=1, ordered=False):
+        """
+        func(item) 返回交给下一阶段的 item，返回 None 表示丢弃
+        :param ordered: 为 True 时即使有多个线程，结果也按 item 进入该阶段的顺序交给下一阶段
+        """
+        self.stages.append((name, func, max(1, int(workers)), None, None, ordered))
+        return self
+
+    def add_batch_stage(self, name, func, batch_size, workers=1, max_wait=DEFAULT_BATCH_WAIT):
+        """
+        func(items) 每次收到最多 batch_size 个 item 的列表，返回交给下一阶段的 item 列表
+        上游一时没有更多 item 时，最多等待 max_wait 秒就处理已经收到的部分
+        """
+        self.stages.append((name, func, max(1, int(workers)), max(1, int(batch_size)), max_wait, False))
+        return self
+
+    def cancel(self):
+        """停止读取新的文件，队列中尚未开始的任务直接丢弃，正在进行的任务照常完成"""
+        self.cancelled.set()
+
+    def queue_depths(self):
+        """各阶段输入队列中等待的任务数"""
+        names = [stage[0] for stage in self.stages] + ["sink"]
+        return {name: q.qsize() for name, q in zip(names, self.queues)}
+
+    def depth_summary(self):
+        """运行期间各队列的平均和最大等待数；某个阶段前的队列经常是满的，说明这个阶段是瓶颈"""
+        samples = max(1, self.depth_samples)
+        return {
+            name: {"mean": self.depth_totals[name] / samples, "max": self.depth_max[name]}
+            for name in self.depth_totals
+        }
+
+    def depth_lines(self):
+        lines = [f"队列深度（平均/最大，上限 {self.queue_size}）："]
+        for name, depth in self.depth_summary().items():
+            lines.append(f"  {name}: {depth['mean']:.1f}/{depth['max']}")
+        return lines
+
+    def _sample_depths(self):
+        last_report = time.monotonic()
+        while not self.finished.wait(DEPTH_SAMPLE_INTERVAL):
+            depths = self.queue_depths()
+            self.depth_samples += 1
+            for name, depth in depths.items():
+                self.depth_totals[name] = self.depth_totals.get(name, 0) + depth
+                self.depth_max[name] = max(self.depth_max.get(name, 0), depth)
+            if self.on_depths is not None and time.monotonic() - last_report >= DEPTH_REPORT_INTERVAL:
+                last_report = time.monotonic()
+                self.on_depths(depths)
+
+    def run(self, sink, on_idle=None, idle_wait=DEFAULT_BATCH_WAIT):
+        """
+        :param on_idle: 最后一个队列超过 idle_wait 秒没有新结果时调用，sink 可以借此处理攒着的部分
+        """
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        self.finished.clear()
+        threads = [
+            threading.Thread(target=self._feed, name="pipeline-source", daemon=True),
+            threading.Thread(target=self._sample_depths, name="pipeline-depths", daemon=True),
+        ]
+        for index, (name, func, workers, batch_size, max_wait, ordered) in enumerate(self.stages):
+            remaining = [workers]
+            lock = threading.Lock()
+            order = _OrderedOutput(self.queues[index], self.queues[index + 1]) if ordered and workers > 1 else None
+            for i in range(workers):
+                if batch_size is None:
+                    target = self._work
+                    args = (func, self.queues[index], self.queues[index + 1], remaining, lock, order)
+                else:
+                    target = self._work_batch
+                    args = (func, batch_size, max_wait, self.queues[index], self.queues[index + 1], remaining, lock)
+                threads.append(threading.Thread(
+                    target=target,
+                    args=args,
+                    name=f"pipeline-{name}-{i}",
+                    daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+
+        output = self.queues[-1]
+        finished = False
+        try:
+            while True:
+                if on_idle is None:
+                    item = output.get()
+                else:
+                    try:
+                        item = output.get(timeout=idle_wait)
+                    except queue.Empty:
+                        on_idle()
+                        continue
+                if item is _DONE:
+                    finished = True
+                    break
+                sink(item)
+        finally:
+            if not finished:
+                # sink 出错时让上游尽快停下来，并取走剩余结果，避免上游阻塞在已满的队列上
+                self.cancel()
+                while output.get() is not _DONE:
+                    pass
+            self.finished.set()
+            for thread in threads:
+                thread.join()
+
+    def _feed(self):
+        first = self.queues[0]
+        try:
+            for item in self.source:
+                if self.cancelled.is_set():
+                    break
+                first.put(item)
+        except Exception as e:
+            self._report_error(None, e)
+        finally:
+            first.put(_DONE)
+
+    def _finish_worker(self, input_queue, output_queue, remaining, lock):
+        # 让同一阶段的其他线程也能看到结束标记，最后一个退出的线程通知下游
+        input_queue.put(_DONE)
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            output_queue.put(_DONE)
+
+    def _work(self, func, input_queue, output_queue, remaining, lock, order=None):
+        while True:
+            if order is None:
+                item = input_queue.get()
+            else:
+                sequence, item = order.get()
+            if item is _DONE:
+                self._finish_worker(input_queue, output_queue, remaining, lock)
+                return
+            result = None
+            if not self.cancelled.is_set():
+                try:
+                    result = func(item)
+                except Exception as e:
+                    self._report_error(item, e)
+            if order is not None:
+                order.put(sequence, result)
+            elif result is not None:
+                output_queue.put(result)
+
+    def _work_batch(self, func, batch_size, max_wait, input_queue, output_queue, remaining, lock):
+        done = False
+        while not done:
+            batch = []
+            item = input_queue.get()
+            if item is _DONE:
+                done = True
+            else:
+                batch.append(item)
+                deadline = time.monotonic() + max_wait
+                while len(batch) < batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = input_queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        done = True
+                        break
+                    batch.append(item)
+
+            if not batch or self.cancelled.is_set():
+                continue
+            try:
+                results = func(batch)
+            except Exception as e:
+                for item in batch:
+                    self._report_error(item, e)
+                continue
+            for result in results:
+                if result is not None:
+                    output_queue.put(result)
+        self._finish_worker(input_queue, output_queue, remaining, lock)
+
+    def _report_error(self, item, error):
+        if self.on_error is not None:
+            self.on_error(item, error)
@@ -0,0 +1,147 @@
+import collections
+import random
+import threading
+import time
+
+from zhipuai import APIConnectionError, APIStatusError, APITimeoutError
+
+DEFAULT_RATE = 5.0  # 每秒最多发出的请求数
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_RETRIES = 4  # 每个请求（即每个文件或每批图片）最多重试的次数
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+DECREASE_INTERVAL = 1.0  # 同一波 429 只减半一次
+THROUGHPUT_WINDOW = 30.0
+REPORT_EVERY = 5.0
+
+
+def is_retryable(error):
+    """429、5xx、超时和连接错误值得重试，其余错误（如 400、401）重试也不会成功"""
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (APITimeoutError, APIConnectionError))
+
+
+def retry_after(error):
+    if isinstance(error, APIStatusError):
+        value = error.response.headers.get("retry-after")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+    return None
+
+
+class AdaptiveLimiter:
+    """
+    令牌桶限制请求速率，AIMD 控制同时进行的请求数：
+    每次成功把并发上限加 1/上限（即每一轮成功加 1），遇到 429/5xx 时减半，
+    失败的请求按指数退避加随机抖动重试，每个请求最多重试 retries 次
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, max_concurrency=DEFAULT_MAX_CONCURRENCY, retries=DEFAULT_RETRIES):
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.limit = min(2.0, float(max_concurrency))
+        self.in_flight = 0
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.last_decrease = 0.0
+        self.completed = collections.deque()
+        self.succeeded = 0
+        self.throttled = 0
+        self.retried = 0
+        self.log = None
+        self.last_report = time.monotonic()
+        self._condition = threading.Condition()
+
+    def configure(self, rate=None, max_concurrency=None, retries=None):
+        with self._condition:
+            if rate is not None:
+                self.rate = rate
+            if max_concurrency is not None:
+                self.max_concurrency = max(1, int(max_concurrency))
+                self.limit = min(self.limit, float(self.max_concurrency))
+            if retries is not None:
+                self.retries = retries
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.rate:
+                    self.tokens = min(
+                        max(1.0, self.rate), self.tokens + (now - self.last_refill) * self.rate
+                    )
+                    self.last_refill = now
+                if self.in_flight < int(self.limit) and (not self.rate or self.tokens >= 1):
+                    break
+                if self.in_flight < int(self.limit):
+                    # 只差令牌，算出下一个令牌到达的时间
+                    self._condition.wait((1 - self.tokens) / self.rate)
+                else:
+                    self._condition.wait()
+            if self.rate:
+                self.tokens -= 1
+            self.in_flight += 1
+
+    def release(self, success=True, throttled=False):
+        message = None
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if success:
+                self.succeeded += 1
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+                self.completed.append(now)
+            elif throttled:
+                self.throttled += 1
+                if now - self.last_decrease >= DECREASE_INTERVAL:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+            while self.completed and now - self.completed[0] > THROUGHPUT_WINDOW:
+                self.completed.popleft()
+            if self.log is not None and now - self.last_report >= REPORT_EVERY:
+                self.last_report = now
+                message = self.stats_text()
+            self._condition.notify_all()
+        if message is not None:
+            self.log(message)
+
+    def throughput(self):
+        """最近 THROUGHPUT_WINDOW 秒内每分钟完成的请求数"""
+        now = time.monotonic()
+        with self._condition:
+            recent = [t for t in self.completed if now - t <= THROUGHPUT_WINDOW]
+        if not recent:
+            return 0.0
+        return len(recent) * 60 / max(now - recent[0], 1.0)
+
+    def stats_text(self):
+        return (f"AI吞吐：{self.throughput():.0f} 个/分钟，并发上限 {int(self.limit)}，"
+                f"进行中 {self.in_flight}，限流 {self.throttled} 次，重试 {self.retried} 次")
+
+    def call(self, func):
+        """在限速和并发控制下调用 func()，遇到可重试的错误时退避重试"""
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = func()
+            except Exception as e:
+                retryable = is_retryable(e)
+                self.release(success=False, throttled=retryable)
+                if not retryable or attempt >= self.retries:
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+                attempt += 1
+                with self._condition:
+                    self.retried += 1
+                time.sleep(delay)
+                continue
+            self.release(success=True)
+            return result
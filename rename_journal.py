@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai_renaming", "journals")
+
+
+def new_journal_path(tool, journal_dir=DEFAULT_JOURNAL_DIR):
+    """tool 为工具名（photo / video），照片和视频工具的记录分开，各自只撤销自己的上一次运行"""
+    return os.path.join(journal_dir, f"{tool}-" + datetime.now().strftime("%Y%m%d-%H%M%S-%f") + ".jsonl")
+
+
+def latest_journal_path(tool, journal_dir=DEFAULT_JOURNAL_DIR):
+    """tool 最近一次实际计划过重命名的运行记录，没有时返回 None"""
+    if not os.path.isdir(journal_dir):
+        return None
+    journals = sorted(
+        name for name in os.listdir(journal_dir) if name.startswith(f"{tool}-") and name.endswith(".jsonl")
+    )
+    for name in reversed(journals):
+        path = os.path.join(journal_dir, name)
+        # 崩溃时可能留下没有任何记录的文件，撤销它什么也不会做
+        if read_journal(path)[0]:
+            return path
+    return None
+
+
+class RenameJournal:
+    """
+    追加写入的重命名记录（JSON Lines）
+    重命名前先写入并落盘 plan 记录（可以一批一起写），完成后写 done 记录
+    即使运行中途崩溃，也可以根据记录和磁盘上的实际情况撤销
+    文件在第一次 record_plan 时才创建，没有重命名任何文件的运行不会留下空记录
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.opened = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open(self):
+        if self.file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.file = open(self.path, "a", encoding="utf-8")
+            self.opened = True
+
+    def _write(self, op, src, dst):
+        record = {"op": op, "src": src, "dst": dst, "time": time.time()}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def record_plan(self, moves):
+        """写入一批计划中的重命名 [(原路径, 新路径)]，只落盘一次"""
+        with self._lock:
+            self._open()
+            for src, dst in moves:
+                self._write("plan", src, dst)
+            self._sync()
+
+    def record_done(self, src, dst):
+        with self._lock:
+            self._write("done", src, dst)
+            self.file.flush()
+
+    def record_undone(self, src, dst):
+        with self._lock:
+            self._open()
+            self._write("undone", src, dst)
+            self.file.flush()
+
+    def close(self):
+        with self._lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+                self.file = None
+
+
+def read_journal(path):
+    """返回 (按顺序的计划列表, 已完成集合, 已撤销集合)，忽略崩溃时写了一半的最后一行"""
+    plans = []
+    done = set()
+    undone = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            move = (record["src"], record["dst"])
+            if record["op"] == "plan":
+                plans.append(move)
+            elif record["op"] == "done":
+                done.add(move)
+            elif record["op"] == "undone":
+                undone.add(move)
+    return plans, done, undone
+
+
+def undo_journal(path, log=print):
+    """
+    按相反顺序撤销一次运行中的所有重命名
+    没有 done 记录但新文件存在、原文件不存在的条目（重命名后崩溃）也会被撤销
+    :return: (撤销成功数, 失败数)
+    """
+    plans, done, undone = read_journal(path)
+    undone_count = 0
+    failed_count = 0
+
+    with RenameJournal(path) as journal:
+        for src, dst in reversed(plans):
+            move = (src, dst)
+            if move in undone:
+                continue
+            if move not in done and not (os.path.exists(dst) and not os.path.exists(src)):
+                # 计划了但没有执行
+                continue
+            if os.path.exists(src):
+                log(f"撤销失败：{src} 已存在")
+                failed_count += 1
+                continue
+            try:
+                os.rename(dst, src)
+            except OSError as e:
+                log(f"撤销失败 {dst}: {str(e)}")
+                failed_count += 1
+                continue
+            journal.record_undone(src, dst)
+            undone.add(move)
+            undone_count += 1
+            log(f"已撤销：{os.path.basename(dst)} -> {os.path.basename(src)}")
+
+    log(f"撤销完成！成功 {undone_count} 个，失败 {failed_count} 个")
+    return undone_count, failed_count
+
+
+def run_undo(parser, journal, log, tool):
+    """命令行的 --undo：journal 为记录路径或 "latest"（tool 最近一次运行），返回退出码"""
+    if journal == "latest":
+        journal = latest_journal_path(tool)
+        if journal is None:
+            parser.error("没有找到任何重命名记录")
+    if not os.path.isfile(journal):
+        parser.error(f"重命名记录不存在: {journal}")
+    _, failed = undo_journal(journal, log)
+    return 0 if failed == 0 else 1
@@ -0,0 +1,358 @@
+import os
+import threading
+import time
+
+from ai_client import DEFAULT_AI_WORKERS, get_client, get_limiter
+from description_cache import DescriptionCache
+from name_index import NameIndex
+from pipeline import FileTask, Pipeline, scan_files
+from rate_limiter import DEFAULT_RATE, DEFAULT_RETRIES
+from rename_journal import RenameJournal
+from stage_timer import StageTimer
+from state_store import DEFAULT_STATE_PATH, StateStore
+
+# 边处理边重命名时，计划攒够这么多个、或最早的一个等了这么久，才一起写入重命名记录并落盘
+JOURNAL_BATCH_SIZE = 32
+JOURNAL_BATCH_SECONDS = 0.5
+
+
+def sanitize_filename(filename):
+    filename = filename.replace("?", "_").replace("<", "_").replace(">", "_")
+    filename = filename.replace("*", "_").replace("\"", "_").replace("'", "_")
+    filename = filename.replace("&", "_").replace("%", "_").replace("#", "_")
+    filename = filename.replace("+", "_")
+    return filename
+
+
+class RenamerBase:
+    """
+    照片和视频重命名引擎共用的部分：流水线的运行和收尾、结果统计、处理记录、重命名记录和实际的重命名
+    子类设置 TOOL 和 SUPPORTED_EXT，并实现 add_stages、read_metadata、build_new_name 和 naming_settings
+    """
+
+    TOOL = None
+    SUPPORTED_EXT = ()
+    DESCRIPTION_LABEL = "AI描述"
+
+    def __init__(
+            self,
+            directory,
+            include_ai_description=False,
+            recursive=False,
+            api_key="",
+            ai_prompt="",
+            ai_workers=DEFAULT_AI_WORKERS,
+            ai_rate=DEFAULT_RATE,
+            ai_retries=DEFAULT_RETRIES,
+            prefill_only=False,
+            dry_run=False,
+            plan_first=False,
+            journal_path=None,
+            incremental=True,
+            state_path=DEFAULT_STATE_PATH,
+            report_path=None,
+            log=print,
+            on_progress=None,
+            on_result=None
+    ):
+        self.selected_dir = directory
+        self.recursive = recursive
+        self.prefill_only = prefill_only
+        self.use_ai = include_ai_description or prefill_only
+        self.api_key = api_key
+        self.ai_prompt = ai_prompt
+        self.ai_worker_count = ai_workers
+        self.ai_rate = ai_rate
+        self.ai_retries = ai_retries
+        self.dry_run = dry_run
+        self.plan_first = plan_first
+        self.journal_path = journal_path
+        # 跳过之前已经用相同设置处理过、且之后没有改动的文件
+        self.incremental = incremental and not (dry_run or prefill_only)
+        self.state_path = state_path
+        self.report_path = report_path
+        self.log = log
+        self.on_progress = on_progress
+        self.on_result = on_result
+
+        self.total_files = 0
+        self.file_count = 0
+        self.success_count = 0
+        self.error_count = 0
+        self.cancel_flag = False
+        self.pipeline = None
+        self.description_cache = None
+        self.journal = None
+        self.state_store = None
+        self.settings_key = None
+        self.limiter = None
+        self.timer = None
+        # 先生成计划时收集的 (task, 新文件名)，流水线结束后统一重命名
+        self.plan = []
+        # 边处理边重命名时等待一起落盘的 (task, 新文件名)，以及其中最早一个的加入时间
+        self.pending_moves = []
+        self.pending_since = None
+        # 每个目录一个文件名索引，递归处理子文件夹时按需建立
+        self.name_indexes = {}
+        self._name_indexes_lock = threading.Lock()
+
+    def cancel(self):
+        self.cancel_flag = True
+        if self.pipeline is not None:
+            self.pipeline.cancel()
+
+    def report(self, task, status, new_name=None, error=None):
+        """每个文件处理结束时调用一次，status 为 renamed / unchanged / planned / cached / skipped / cancelled / failed"""
+        self.file_count += 1
+        if status in ("renamed", "unchanged", "planned", "cached"):
+            self.success_count += 1
+        else:
+            self.error_count += 1
+        if self.on_result is not None:
+            self.on_result({
+                "file": task.path,
+                "status": status,
+                "new_name": new_name,
+                "error": error,
+            })
+        if self.state_store is not None and task.stat is not None and self.is_final(task, status):
+            self.state_store.mark_processed(task.stat, new_name or task.filename, self.settings_key)
+        return status in ("renamed", "unchanged", "planned", "cached")
+
+    def is_final(self, task, status):
+        """
+        只记录文件不变时再处理一次结果也不会变的文件：重命名成功的，以及确定无法重命名而跳过的
+        失败和取消的文件下次重新处理；开启 AI 但没有得到描述的文件虽然已重命名，下次也要重新请求描述
+        """
+        if status == "renamed":
+            return not (self.use_ai and not task.description)
+        return status == "skipped"
+
+    def run(self):
+        """处理整个目录，返回 {"total", "success", "failed"} 统计"""
+        self.log("开始处理...")
+        self.timer = StageTimer()
+
+        # 扫描、读取元数据、AI 描述和重命名分别在不同线程中进行，之间用有界队列连接
+        self.pipeline = Pipeline(self.iter_tasks(), on_error=self.on_pipeline_error, on_depths=self.log_depths)
+        self.add_stages(self.pipeline)
+        self.open_resources()
+        try:
+            self.pipeline.run(self.finish_task, on_idle=self.flush_pending_moves)
+            self.finish_pipeline()
+            self.flush_pending_moves()
+            if self.plan:
+                self.apply_plan()
+        finally:
+            self.close_resources()
+
+        self.log(f"处理完成！共处理 {self.file_count} 个文件，成功 {self.success_count} 个，失败 {self.error_count} 个")
+        summary = {"total": self.file_count, "success": self.success_count, "failed": self.error_count}
+        self.report_timing(summary)
+        return summary
+
+    def add_stages(self, pipeline):
+        raise NotImplementedError
+
+    def open_resources(self):
+        if self.use_ai:
+            self.description_cache = DescriptionCache()
+        if self.journal_path and not (self.dry_run or self.prefill_only):
+            self.journal = RenameJournal(self.journal_path)
+        if self.incremental:
+            self.state_store = StateStore(self.state_path)
+            self.settings_key = StateStore.make_settings_key(self.naming_settings())
+        if self.use_ai:
+            # 同一个 API Key 的所有请求共用一个限速器
+            self.limiter = get_limiter(get_client(self.api_key))
+            self.limiter.configure(self.ai_rate, self.ai_worker_count, self.ai_retries)
+            self.limiter.log = self.log
+
+    def finish_pipeline(self):
+        """流水线结束之后、批量重命名之前调用"""
+
+    def close_resources(self):
+        if self.description_cache is not None:
+            self.log(self.description_cache.stats_text())
+            self.description_cache.close()
+            self.description_cache = None
+        if self.journal is not None:
+            self.journal.close()
+            if self.journal.opened:
+                self.log(f"重命名记录：{self.journal_path}")
+            self.journal = None
+        if self.state_store is not None:
+            self.log(self.state_store.stats_text())
+            self.state_store.close()
+            self.state_store = None
+        if self.limiter is not None:
+            self.log(self.limiter.stats_text())
+            self.limiter.log = None
+            self.limiter = None
+
+    def report_timing(self, summary):
+        self.timer.finish()
+        for line in self.timer.report_lines() + self.pipeline.depth_lines():
+            self.log(line)
+        if self.report_path:
+            self.timer.save_json(
+                self.report_path, tool=self.TOOL, summary=summary, queue_depths=self.pipeline.depth_summary()
+            )
+            self.log(f"耗时报告：{self.report_path}")
+
+    def log_depths(self, depths):
+        self.log("队列：" + "，".join(f"{name} {depth}" for name, depth in depths.items()))
+
+    def naming_settings(self):
+        """影响新文件名的全部选项，任何一项变化都会让之前的处理记录失效"""
+        raise NotImplementedError
+
+    def iter_tasks(self):
+        files = self.timer.iterate("scan", scan_files(
+            self.selected_dir, self.SUPPORTED_EXT, self.recursive, skip=self.is_renamed_this_run,
+            sort=self.sorted_scan()
+        ))
+        for directory, filename in files:
+            if self.cancel_flag:
+                return
+            self.total_files += 1
+            task = FileTask(directory, filename)
+            if self.state_store is not None:
+                with self.timer.measure("state"):
+                    try:
+                        task.stat = os.stat(task.path)
+                    except OSError:
+                        pass
+                    else:
+                        if self.state_store.is_processed(task.stat, filename, self.settings_key):
+                            task.fail("unchanged", None)
+            yield task
+
+    def sorted_scan(self):
+        """是否按文件名顺序处理每个目录，结果与处理顺序有关时返回 True"""
+        return False
+
+    def is_renamed_this_run(self, directory, filename):
+        with self._name_indexes_lock:
+            name_index = self.name_indexes.get(directory)
+        return name_index is not None and name_index.is_created(filename)
+
+    def on_pipeline_error(self, task, error):
+        self.log(f"处理失败 {task.filename if task else ''}: {str(error)}")
+
+    def finish_task(self, task):
+        """流水线的最后一步，所有重命名都在同一个线程中进行"""
+        if task.status is not None:
+            self.report(task, task.status, error=task.error)
+        else:
+            self.rename_file(task)
+        if self.on_progress is not None:
+            self.on_progress(self.file_count, self.total_files)
+
+    def build_new_name(self, task):
+        """由 task.name_parts 和 task.description 拼出不含扩展名的新文件名，无法命名时返回空字符串"""
+        raise NotImplementedError
+
+    def rename_file(self, task):
+        """拼接文件名并重命名"""
+        filename = task.filename
+        try:
+            if self.prefill_only:
+                if not task.description:
+                    self.log(f"未获取到{self.DESCRIPTION_LABEL} {filename}")
+                    return self.report(task, "failed", error=f"未获取到{self.DESCRIPTION_LABEL}")
+                self.log(f"已缓存{self.DESCRIPTION_LABEL}：{filename} -> {task.description}")
+                return self.report(task, "cached")
+
+            new_name = self.build_new_name(task)
+            if not new_name:
+                self.log(f"跳过 {filename}：未获取到有效元数据用于重命名")
+                return self.report(task, "skipped", error="未获取到有效元数据用于重命名")
+
+            ext = os.path.splitext(filename)[1].lower()
+            new_filename = self.get_unique_filename(task.directory, new_name, ext, filename)
+
+            if self.dry_run:
+                self.log(f"预览：{filename} -> {new_filename}")
+                return self.report(task, "planned", new_name=new_filename)
+            if self.plan_first:
+                self.plan.append((task, new_filename))
+                return True
+
+            if self.journal is not None and new_filename != filename:
+                # 重命名前必须先把计划落盘，崩溃后才能撤销；每个文件单独落盘太慢，攒一小批一起写
+                self.pending_moves.append((task, new_filename))
+                if self.pending_since is None:
+                    self.pending_since = time.monotonic()
+                if (len(self.pending_moves) >= JOURNAL_BATCH_SIZE
+                        or time.monotonic() - self.pending_since >= JOURNAL_BATCH_SECONDS):
+                    self.flush_pending_moves()
+                return True
+            self.move_file(task, new_filename)
+            self.log(f"重命名成功：{filename} -> {new_filename}")
+            return self.report(task, "renamed", new_name=new_filename)
+
+        except Exception as e:
+            self.log(f"处理失败 {filename}: {str(e)}")
+            return self.report(task, "failed", error=str(e))
+
+    def move_file(self, task, new_filename):
+        if new_filename == task.filename:
+            return
+        new_path = os.path.join(task.directory, new_filename)
+        name_index = self.get_name_index(task.directory)
+        try:
+            with self.timer.measure("rename"):
+                os.rename(task.path, new_path)
+        except OSError:
+            name_index.discard(new_filename)
+            raise
+        name_index.discard(task.filename)
+        if self.journal is not None:
+            self.journal.record_done(task.path, new_path)
+
+    def apply_plan(self):
+        """所有新文件名都确定后，先整体写入重命名记录，再批量重命名"""
+        self.log(f"开始批量重命名 {len(self.plan)} 个文件...")
+        plan, self.plan = self.plan, []
+        self.move_files(plan)
+
+    def flush_pending_moves(self):
+        """把边处理边重命名时攒下的计划一次落盘，再执行这些重命名；流水线空闲时也会调用"""
+        if self.pending_moves:
+            moves, self.pending_moves, self.pending_since = self.pending_moves, [], None
+            self.move_files(moves)
+
+    def move_files(self, moves):
+        """先把 [(task, 新文件名)] 整体写入重命名记录并落盘一次，再依次重命名"""
+        if self.journal is not None:
+            self.journal.record_plan([
+                (task.path, os.path.join(task.directory, new_filename))
+                for task, new_filename in moves
+                if new_filename != task.filename
+            ])
+        for task, new_filename in moves:
+            if self.cancel_flag:
+                self.report(task, "cancelled", error="已取消")
+                continue
+            try:
+                self.move_file(task, new_filename)
+                self.log(f"重命名成功：{task.filename} -> {new_filename}")
+                self.report(task, "renamed", new_name=new_filename)
+            except Exception as e:
+                self.log(f"处理失败 {task.filename}: {str(e)}")
+                self.report(task, "failed", error=str(e))
+            if self.on_progress is not None:
+                self.on_progress(self.file_count, self.total_files)
+
+    def get_name_index(self, directory):
+        with self._name_indexes_lock:
+            name_index = self.name_indexes.get(directory)
+            if name_index is None:
+                name_index = NameIndex(directory)
+                self.name_indexes[directory] = name_index
+            return name_index
+
+    def get_unique_filename(self, directory, base_name, extension, current_name=None):
+        # 与文件当前的名字相同（例如之前已经重命名过）时直接沿用，不算冲突
+        return self.get_name_index(directory).claim(base_name, extension, current_name)
@@ -0,0 +1,152 @@
+import hashlib
+import threading
+
+import numpy as np
+from PIL import Image
+
+from image_payload import load_preview_image
+
+DEFAULT_MAX_DISTANCE = 7  # 64 位哈希中允许不同的位数
+DEFAULT_WINDOW_SECONDS = 2.0
+HASH_PREVIEW_EDGE = 256
+HASH_SIZE = 8
+PHASH_SIZE = 32
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / n)
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(gray):
+    """差值哈希：缩成 9x8 后比较每行相邻像素的明暗"""
+    pixels = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(gray):
+    """感知哈希：32x32 灰度图做二维 DCT，取左上角 8x8 低频系数与其中位数比较"""
+    pixels = np.asarray(gray.resize((PHASH_SIZE, PHASH_SIZE), Image.BILINEAR), dtype=np.float32)
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # 直流分量只反映整体亮度，不参与中位数
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int(low > median)
+
+
+def content_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_hashes(path):
+    """返回 (内容哈希, dHash, pHash)；感知哈希基于小尺寸预览，RAW 使用内嵌预览"""
+    gray = load_preview_image(path, HASH_PREVIEW_EDGE).convert("L")
+    return content_hash(path), dhash(gray), phash(gray)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SimilarGroup:
+    """一组相似照片，只有代表照片会请求 AI 描述，其余照片等待并沿用它的描述"""
+
+    def __init__(self, representative, content, d_hash, p_hash, timestamp):
+        self.representative = representative
+        self.content = content
+        self.dhash = d_hash
+        self.phash = p_hash
+        self.timestamp = timestamp
+        self.size = 1
+        self.description = None
+        self.ready = threading.Event()
+
+    def resolve(self, description):
+        self.description = description
+        self.ready.set()
+
+
+class SimilarityGrouper:
+    """
+    把内容完全相同的文件，以及拍摄时间相差不超过 window_seconds、
+    dHash 和 pHash 的汉明距离都不超过 max_distance 的照片分到同一组
+    只要与组内任意一张照片相似就加入该组（单链接），连拍中逐渐变化的画面不会因为离第一张稍远而另起一组；
+    为了不让缓慢变化的场景一路串下去，与代表照片的距离还不能超过 max_distance 的 REPRESENTATIVE_FACTOR 倍
+    按时间分桶，每张照片只与相邻时间桶中的照片比较
+    结果取决于调用 assign 的顺序，调用方需要保证每次运行的顺序相同
+    """
+
+    REPRESENTATIVE_FACTOR = 2
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, window_seconds=DEFAULT_WINDOW_SECONDS):
+        self.max_distance = max_distance
+        self.window_seconds = max(window_seconds, 1e-3)
+        self.by_content = {}
+        # {时间桶: [(分组, dHash, pHash, 拍摄时间)]}，包括每一组的全部照片
+        self.buckets = {}
+        self.groups = 0
+        self.members = 0
+        self._lock = threading.Lock()
+
+    def assign(self, item, content, d_hash, p_hash, timestamp):
+        """返回 (group, 是否为代表照片)"""
+        with self._lock:
+            self.members += 1
+            group = self.by_content.get(content)
+            if group is not None:
+                group.size += 1
+                return group, False
+
+            if timestamp is not None:
+                group = self._find_similar(d_hash, p_hash, timestamp)
+            representative = group is None
+            if representative:
+                group = SimilarGroup(item, content, d_hash, p_hash, timestamp)
+                self.groups += 1
+            else:
+                group.size += 1
+            self.by_content[content] = group
+            if timestamp is not None:
+                self.buckets.setdefault(self._bucket(timestamp), []).append((group, d_hash, p_hash, timestamp))
+            return group, representative
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.window_seconds)
+
+    def _find_similar(self, d_hash, p_hash, timestamp):
+        """与窗口内最相似的照片所在的组，距离相同时保留先找到的，结果只取决于调用顺序"""
+        bucket = self._bucket(timestamp)
+        representative_limit = self.max_distance * self.REPRESENTATIVE_FACTOR
+        best = None
+        best_distance = None
+        for neighbour in (bucket - 1, bucket, bucket + 1):
+            for group, member_dhash, member_phash, member_time in self.buckets.get(neighbour, ()):
+                if abs(member_time - timestamp) > self.window_seconds:
+                    continue
+                d_distance = hamming(member_dhash, d_hash)
+                p_distance = hamming(member_phash, p_hash)
+                if d_distance > self.max_distance or p_distance > self.max_distance:
+                    continue
+                if best is not None and d_distance + p_distance >= best_distance:
+                    continue
+                if (hamming(group.dhash, d_hash) > representative_limit
+                        or hamming(group.phash, p_hash) > representative_limit):
+                    continue
+                best = group
+                best_distance = d_distance + p_distance
+        return best
+
+    def stats_text(self):
+        return f"相似照片分组：{self.members} 张照片分为 {self.groups} 组，省去 {self.members - self.groups} 次AI描述"
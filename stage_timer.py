@@ -0,0 +1,113 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+DEFAULT_REPORT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai_renaming", "reports")
+
+
+def new_report_path(name, report_dir=DEFAULT_REPORT_DIR):
+    os.makedirs(report_dir, exist_ok=True)
+    return os.path.join(report_dir, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+
+
+def percentile(sorted_values, fraction):
+    """最近秩法求百分位数，sorted_values 须已排序且非空"""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class StageTimer:
+    """
+    线程安全地收集每个阶段每次执行的耗时
+    运行结束后给出各阶段的 p50/p95/p99，以及总耗时与各阶段耗时之和的对比
+    （之和明显大于总耗时说明阶段之间在并行，接近时说明基本是串行的）
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def merge(self, samples):
+        """并入其他进程中收集的 {阶段: [耗时, ...]}"""
+        with self._lock:
+            for stage, values in samples.items():
+                self.samples.setdefault(stage, []).extend(values)
+
+    def iterate(self, stage, iterable):
+        """逐个产出 iterable 的元素，只统计取下一个元素的耗时，不包括调用方处理元素的时间"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        wall = (self.finished or time.perf_counter()) - self.started
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+        stages = {}
+        for stage, values in samples.items():
+            total = sum(values)
+            stages[stage] = {
+                "count": len(values),
+                "total": total,
+                "mean": total / len(values),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "p99": percentile(values, 0.99),
+                "max": values[-1],
+            }
+        return {
+            "wall_seconds": wall,
+            "stage_seconds": sum(stage["total"] for stage in stages.values()),
+            "stages": stages,
+        }
+
+    def report_lines(self):
+        summary = self.summary()
+        lines = ["阶段耗时："]
+        for stage, stats in summary["stages"].items():
+            lines.append(
+                f"  {stage}: {stats['count']} 次，合计 {stats['total']:.2f} 秒，p50/p95/p99 = "
+                f"{stats['p50'] * 1000:.1f}/{stats['p95'] * 1000:.1f}/{stats['p99'] * 1000:.1f} 毫秒"
+            )
+        lines.append(f"总耗时 {summary['wall_seconds']:.2f} 秒，各阶段耗时之和 {summary['stage_seconds']:.2f} 秒")
+        return lines
+
+    def save_json(self, path, **extra):
+        report = dict(extra)
+        report.update(self.summary())
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def measure(timer, stage):
+    """timer 为 None 时不计时，便于模块级函数在没有计时器时单独调用"""
+    return timer.measure(stage) if timer is not None else nullcontext()
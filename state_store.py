@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_STATE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ai_renaming", "state.sqlite3")
+COMMIT_EVERY = 100
+
+
+class StateStore:
+    """
+    已处理文件的本地记录（SQLite）
+    以 (设备号, inode) 标识文件，大小、修改时间、处理时的设置和处理后的文件名都一致时视为无需再处理；
+    重命名不会改变 inode 和修改时间，所以重新运行或中断后继续时可以直接跳过这些文件
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        self.skipped = 0
+        self.writes = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed (
+                dev INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                settings TEXT NOT NULL,
+                name TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (dev, inode)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def make_settings_key(settings):
+        """settings 为影响处理结果的全部选项（可 JSON 序列化的字典）"""
+        encoded = json.dumps(settings, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def is_processed(self, stat, name, settings_key):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, settings, name FROM processed WHERE dev = ? AND inode = ?",
+                (stat.st_dev, stat.st_ino)
+            ).fetchone()
+        # 文件名不同说明之后被撤销或手动改过名，需要重新处理
+        processed = row == (stat.st_size, stat.st_mtime_ns, settings_key, name)
+        if processed:
+            self.skipped += 1
+        return processed
+
+    def mark_processed(self, stat, name, settings_key):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO processed (dev, inode, size, mtime_ns, settings, name, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, settings_key, name, time.time())
+            )
+            self.writes += 1
+            self._pending += 1
+            # 分批提交；中途崩溃最多丢失最后一批记录，这些文件下次会重新处理，结果不变
+            if self._pending >= COMMIT_EVERY:
+                self.conn.commit()
+                self._pending = 0
+
+    def stats_text(self):
+        return f"处理记录：跳过未改动的文件 {self.skipped} 个，新增记录 {self.writes} 条"
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
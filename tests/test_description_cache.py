@@ -0,0 +1,98 @@
+import itertools
+
+import pytest
+
+import description_cache
+from description_cache import DescriptionCache
+
+MODEL = "glm-4v-flash"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """每次调用 time.time() 前进一秒，last_used 不会相同"""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(description_cache.time, "time", lambda: next(ticks))
+
+
+def entry_size(key, description):
+    return len(key) + len(MODEL) + len(description.encode("utf-8"))
+
+
+def test_key_depends_on_model_prompt_and_payload():
+    key = DescriptionCache.make_key(MODEL, "提示词", "abc")
+    assert key == DescriptionCache.make_key(MODEL, "提示词", b"abc")
+    assert key != DescriptionCache.make_key(MODEL, "另一个提示词", "abc")
+    assert key != DescriptionCache.make_key("other-model", "提示词", "abc")
+    assert key != DescriptionCache.make_key(MODEL, "提示词", "abd")
+
+
+def test_put_get_and_stats(tmp_path):
+    with DescriptionCache(str(tmp_path / "cache.sqlite3")) as cache:
+        key = DescriptionCache.make_key(MODEL, "p", "payload")
+        assert cache.get(key) is None
+        cache.put(key, MODEL, "海边日落")
+        assert cache.get(key) == "海边日落"
+        assert (cache.hits, cache.misses, cache.writes) == (1, 1, 1)
+        assert cache.size_bytes() == entry_size(key, "海边日落")
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    key = DescriptionCache.make_key(MODEL, "p", "payload")
+    with DescriptionCache(path) as cache:
+        cache.put(key, MODEL, "猫")
+    with DescriptionCache(path) as cache:
+        assert cache.get(key) == "猫"
+
+
+def test_evicts_least_recently_used_until_under_limit(clock):
+    keys = [DescriptionCache.make_key(MODEL, "p", str(i)) for i in range(4)]
+    size = entry_size(keys[0], "描述")
+    cache = DescriptionCache(":memory:", max_bytes=3 * size, max_age_days=None)
+    for key in keys[:3]:
+        cache.put(key, MODEL, "描述")
+    # 读取第一条后，最久未使用的变成第二条
+    assert cache.get(keys[0]) == "描述"
+    cache.put(keys[3], MODEL, "描述")
+    cache.evict()
+
+    assert cache.size_bytes() == 3 * size
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) == "描述" for key in (keys[0], keys[2], keys[3]))
+    cache.close()
+
+
+def test_evicts_only_as_many_bytes_as_needed(clock):
+    small = DescriptionCache.make_key(MODEL, "p", "small")
+    large = DescriptionCache.make_key(MODEL, "p", "large")
+    newest = DescriptionCache.make_key(MODEL, "p", "newest")
+    cache = DescriptionCache(":memory:", max_bytes=0, max_age_days=None)
+    cache.put(small, MODEL, "小")
+    cache.put(large, MODEL, "很长的描述" * 20)
+    cache.put(newest, MODEL, "新")
+    total = cache.size_bytes()
+
+    # 只超出一个字节，删掉最旧的一条就够了
+    cache.max_bytes = total - 1
+    cache.evict()
+    assert cache.get(small) is None
+    assert cache.get(large) is not None
+    assert cache.get(newest) is not None
+    cache.close()
+
+
+def test_evicts_entries_older_than_max_age(clock):
+    old = DescriptionCache.make_key(MODEL, "p", "old")
+    fresh = DescriptionCache.make_key(MODEL, "p", "fresh")
+    cache = DescriptionCache(":memory:", max_bytes=None, max_age_days=1)
+    cache.put(old, MODEL, "旧")
+    cache.put(fresh, MODEL, "新")
+    # 按创建时间过期，即使刚刚读取过也一样
+    cache.conn.execute("UPDATE descriptions SET created = created - 2 * 86400 WHERE key = ?", (old,))
+    assert cache.get(old) == "旧"
+    cache.evict()
+
+    assert cache.get(old) is None
+    assert cache.get(fresh) == "新"
+    cache.close()
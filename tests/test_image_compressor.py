@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_compressor
+from image_compressor import MEMORY_OVERHEAD, ImageCompressor
+
+TARGET_SIZE = 200 * 1024
+_compress_in_worker = image_compressor.compress_in_worker
+
+
+def crash_on_second(settings, memory_budget, file_path, file_size):
+    """模拟处理某一张图片时子进程被系统结束"""
+    if os.path.basename(file_path) == "2.jpg":
+        os._exit(9)
+    return _compress_in_worker(settings, memory_budget, file_path, file_size)
+
+
+@pytest.fixture(autouse=True)
+def restore_pillow_limit(monkeypatch):
+    # ImageCompressor 会按内存预算修改 Pillow 的全局上限
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", Image.MAX_IMAGE_PIXELS)
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = np.random.default_rng(0)
+    for i in range(5):
+        pixels = rng.integers(0, 256, (400, 600, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(tmp_path / f"{i}.jpg", quality=95)
+    return tmp_path
+
+
+def compress(folder, **options):
+    results = {}
+    compressor = ImageCompressor(
+        target_size=TARGET_SIZE, incremental=False, log=lambda message: None,
+        on_result=lambda result: results.__setitem__(os.path.basename(result["file"]), result), **options
+    )
+    return compressor.compress_images(str(folder)), results
+
+
+def test_serial_compresses_to_target(images):
+    summary, results = compress(images, workers=1)
+    assert summary["compressed"] == 5
+    assert all(os.path.getsize(images / name) <= TARGET_SIZE for name in results)
+
+
+def test_crashed_worker_fails_only_its_file(images, monkeypatch):
+    monkeypatch.setattr(image_compressor, "compress_in_worker", crash_on_second)
+    summary, results = compress(images, workers=2)
+
+    assert summary == {"total": 5, "compressed": 4, "skipped": 0, "unchanged": 0, "failed": 1}
+    assert results["2.jpg"]["status"] == "error"
+    assert all(results[f"{i}.jpg"]["status"] == "compressed" for i in (0, 1, 3, 4))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_image_over_memory_budget_is_not_decoded(images, workers):
+    budget = 400 * 600 * 3 * MEMORY_OVERHEAD - 1
+    summary, results = compress(images, workers=workers, memory_budget=budget)
+
+    assert summary["failed"] == 5
+    assert all("超出内存预算" in result["error"] for result in results.values())
+    assert all(os.path.getsize(images / name) > TARGET_SIZE for name in results)
+
+
+def test_pillow_limit_follows_memory_budget():
+    ImageCompressor(memory_budget=1)
+    assert Image.MAX_IMAGE_PIXELS == image_compressor.PILLOW_MAX_PIXELS
+
+    budget = 4 * image_compressor.PILLOW_MAX_PIXELS * MEMORY_OVERHEAD
+    ImageCompressor(memory_budget=budget)
+    assert Image.MAX_IMAGE_PIXELS == budget // MEMORY_OVERHEAD
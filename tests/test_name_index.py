@@ -0,0 +1,59 @@
+import pytest
+
+from name_index import NameIndex
+
+
+@pytest.fixture
+def directory(tmp_path):
+    for name in ("a.jpg", "2024 ｜ GH6.jpg", "2024 ｜ GH6_1.jpg", "other.jpg"):
+        (tmp_path / name).write_bytes(b"")
+    return tmp_path
+
+
+def test_free_name_is_used_as_is(directory):
+    index = NameIndex(str(directory))
+    assert index.claim("2025 ｜ GH6", ".jpg", "a.jpg") == "2025 ｜ GH6.jpg"
+    assert "2025 ｜ GH6.jpg" in index
+    assert index.is_created("2025 ｜ GH6.jpg")
+
+
+def test_collisions_get_the_next_free_counter(directory):
+    index = NameIndex(str(directory))
+    assert index.claim("2024 ｜ GH6", ".jpg", "a.jpg") == "2024 ｜ GH6_2.jpg"
+    assert index.claim("2024 ｜ GH6", ".jpg", "other.jpg") == "2024 ｜ GH6_3.jpg"
+
+
+def test_claimed_names_collide_with_later_claims(tmp_path):
+    index = NameIndex(str(tmp_path))
+    names = [index.claim("burst", ".jpg", f"IMG_{i}.jpg") for i in range(4)]
+    assert names == ["burst.jpg", "burst_1.jpg", "burst_2.jpg", "burst_3.jpg"]
+    assert len(index) == 4
+
+
+def test_current_name_is_not_a_collision(directory):
+    index = NameIndex(str(directory))
+    # 已经是这个名字，不加序号，也不算本次运行新产生的
+    assert index.claim("2024 ｜ GH6", ".jpg", "2024 ｜ GH6.jpg") == "2024 ｜ GH6.jpg"
+    assert not index.is_created("2024 ｜ GH6.jpg")
+
+
+def test_previously_numbered_name_is_kept(directory):
+    index = NameIndex(str(directory))
+    assert index.claim("2024 ｜ GH6", ".jpg", "2024 ｜ GH6_1.jpg") == "2024 ｜ GH6_1.jpg"
+
+
+def test_discard_releases_a_name(directory):
+    index = NameIndex(str(directory))
+    index.discard("a.jpg")
+    assert "a.jpg" not in index
+    assert index.claim("a", ".jpg", "other.jpg") == "a.jpg"
+
+    # 重命名失败时归还占用的名字，下一个文件可以再用
+    index.discard("a.jpg")
+    assert not index.is_created("a.jpg")
+    assert index.claim("a", ".jpg", "b.jpg") == "a.jpg"
+
+
+def test_extension_is_part_of_the_name(directory):
+    index = NameIndex(str(directory))
+    assert index.claim("a", ".png", "x.png") == "a.png"
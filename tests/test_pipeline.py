@@ -0,0 +1,84 @@
+import random
+import threading
+import time
+
+from pipeline import Pipeline, scan_files
+from similar_images import SimilarityGrouper
+
+
+def jitter(item):
+    time.sleep(random.uniform(0, 0.005))
+    return item
+
+
+def run(pipeline):
+    results = []
+    pipeline.run(results.append)
+    return results
+
+
+def test_scan_files_sorted(tmp_path):
+    for name in ("P1030.JPG", "P1002.jpg", "notes.txt", "P1010.jpg"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "b").mkdir()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b" / "x.jpg").write_bytes(b"")
+    (tmp_path / "a" / "y.jpg").write_bytes(b"")
+
+    found = list(scan_files(str(tmp_path), (".jpg",), recursive=True, sort=True))
+    assert [name for _, name in found] == ["P1002.jpg", "P1010.jpg", "P1030.JPG", "y.jpg", "x.jpg"]
+    assert list(scan_files(str(tmp_path), (".jpg",), skip=lambda d, n: n == "P1010.jpg", sort=True)) == [
+        (str(tmp_path), "P1002.jpg"), (str(tmp_path), "P1030.JPG")
+    ]
+
+
+def test_stage_keeps_items():
+    pipeline = Pipeline(range(50)).add_stage("double", lambda x: x * 2, workers=4)
+    assert sorted(run(pipeline)) == [x * 2 for x in range(50)]
+
+
+def test_ordered_stage_keeps_input_order():
+    pipeline = Pipeline(range(200), queue_size=8).add_stage("jitter", jitter, workers=8, ordered=True)
+    assert run(pipeline) == list(range(200))
+
+
+def test_ordered_stage_skips_dropped_and_failed_items():
+    errors = []
+
+    def func(item):
+        jitter(item)
+        if item % 7 == 0:
+            raise ValueError(item)
+        return item if item % 5 else None
+
+    pipeline = Pipeline(range(100), on_error=lambda item, error: errors.append(item))
+    pipeline.add_stage("filter", func, workers=4, ordered=True)
+    assert run(pipeline) == [x for x in range(100) if x % 7 and x % 5]
+    assert sorted(errors) == list(range(0, 100, 7))
+
+
+def test_grouping_after_parallel_stage_is_identical_between_runs():
+    # 多线程阶段完成的先后每次不同，分组阶段看到的顺序必须相同，否则每次选出的代表照片不同
+    items = [(f"IMG_{i:03d}.jpg", i // 3, 0, i * 0.5) for i in range(90)]
+
+    def group_once():
+        grouper = SimilarityGrouper(max_distance=0, window_seconds=1.0)
+        representatives = {}
+        lock = threading.Lock()
+
+        def group(item):
+            name, d_hash, p_hash, timestamp = item
+            with lock:
+                group, _ = grouper.assign(name, name, d_hash, p_hash, timestamp)
+            representatives[name] = group.representative
+            return item
+
+        pipeline = Pipeline(items, queue_size=4)
+        pipeline.add_stage("hash", jitter, workers=6, ordered=True)
+        pipeline.add_stage("group", group)
+        run(pipeline)
+        return representatives
+
+    first = group_once()
+    assert first == group_once()
+    assert first["IMG_001.jpg"] == "IMG_000.jpg"
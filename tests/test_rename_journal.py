@@ -0,0 +1,105 @@
+import os
+
+from rename_journal import RenameJournal, latest_journal_path, new_journal_path, read_journal, undo_journal
+
+
+def quiet(message):
+    pass
+
+
+def rename(journal, src, dst):
+    journal.record_plan([(src, dst)])
+    os.rename(src, dst)
+    journal.record_done(src, dst)
+
+
+def test_journal_is_created_on_first_plan(tmp_path):
+    path = tmp_path / "journals" / "photo-1.jsonl"
+    with RenameJournal(str(path)) as journal:
+        pass
+    assert not journal.opened
+    assert not path.exists()
+
+    with RenameJournal(str(path)) as journal:
+        journal.record_plan([("a", "b")])
+    assert journal.opened
+    assert read_journal(str(path)) == ([("a", "b")], set(), set())
+
+
+def test_plan_done_undo_round_trip(tmp_path):
+    files = tmp_path / "files"
+    files.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        (files / name).write_text(name)
+    a, b = str(files / "a.jpg"), str(files / "b.jpg")
+    a_new, b_new = str(files / "2024 ｜ GH6.jpg"), str(files / "2024 ｜ GH6_1.jpg")
+    path = str(tmp_path / "photo-1.jsonl")
+
+    with RenameJournal(path) as journal:
+        rename(journal, a, a_new)
+        rename(journal, b, b_new)
+
+    plans, done, undone = read_journal(path)
+    assert plans == [(a, a_new), (b, b_new)]
+    assert done == {(a, a_new), (b, b_new)}
+    assert undone == set()
+
+    assert undo_journal(path, log=quiet) == (2, 0)
+    assert sorted(os.listdir(files)) == ["a.jpg", "b.jpg"]
+    assert (files / "a.jpg").read_text() == "a.jpg"
+    assert read_journal(path)[2] == {(a, a_new), (b, b_new)}
+
+    # 再撤销一次什么也不做
+    assert undo_journal(path, log=quiet) == (0, 0)
+
+
+def test_undo_recovers_rename_without_done_record(tmp_path):
+    src, dst = str(tmp_path / "a.jpg"), str(tmp_path / "new.jpg")
+    (tmp_path / "a.jpg").write_text("a")
+    path = str(tmp_path / "photo-1.jsonl")
+    with RenameJournal(path) as journal:
+        # 重命名之后、写 done 之前崩溃
+        journal.record_plan([(src, dst)])
+        os.rename(src, dst)
+        # 计划了但还没执行
+        journal.record_plan([(str(tmp_path / "b.jpg"), str(tmp_path / "b_new.jpg"))])
+
+    assert undo_journal(path, log=quiet) == (1, 0)
+    assert os.path.exists(src) and not os.path.exists(dst)
+
+
+def test_undo_does_not_overwrite_existing_file(tmp_path):
+    src, dst = str(tmp_path / "a.jpg"), str(tmp_path / "new.jpg")
+    (tmp_path / "a.jpg").write_text("a")
+    path = str(tmp_path / "photo-1.jsonl")
+    with RenameJournal(path) as journal:
+        rename(journal, src, dst)
+    (tmp_path / "a.jpg").write_text("someone else")
+
+    assert undo_journal(path, log=quiet) == (0, 1)
+    assert (tmp_path / "a.jpg").read_text() == "someone else"
+    assert os.path.exists(dst)
+
+
+def test_read_journal_ignores_truncated_last_line(tmp_path):
+    path = tmp_path / "photo-1.jsonl"
+    with RenameJournal(str(path)) as journal:
+        journal.record_plan([("a", "b")])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "done", "src": "a"')
+    assert read_journal(str(path)) == ([("a", "b")], set(), set())
+
+
+def test_latest_journal_is_per_tool_and_skips_empty(tmp_path):
+    journal_dir = str(tmp_path)
+    with RenameJournal(os.path.join(journal_dir, "photo-20240101-000000-000000.jsonl")) as journal:
+        journal.record_plan([("a", "b")])
+    with RenameJournal(os.path.join(journal_dir, "video-20240102-000000-000000.jsonl")) as journal:
+        journal.record_plan([("c", "d")])
+    # 崩溃时留下的空记录
+    open(os.path.join(journal_dir, "photo-20240103-000000-000000.jsonl"), "w").close()
+
+    assert latest_journal_path("photo", journal_dir).endswith("photo-20240101-000000-000000.jsonl")
+    assert latest_journal_path("video", journal_dir).endswith("video-20240102-000000-000000.jsonl")
+    assert latest_journal_path("photo", str(tmp_path / "missing")) is None
+    assert os.path.basename(new_journal_path("video", journal_dir)).startswith("video-")
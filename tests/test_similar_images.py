@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from similar_images import SimilarityGrouper, dhash, hamming, image_hashes, phash
+
+
+def scene(seed, size=(256, 192)):
+    """带有随机明暗块的灰度图，不同 seed 的画面互不相关"""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (6, 8)).astype(np.uint8)
+    return Image.fromarray(blocks).resize(size, Image.BILINEAR)
+
+
+def with_noise(image, amplitude, seed):
+    rng = np.random.default_rng(seed)
+    pixels = np.asarray(image, dtype=np.int16) + rng.integers(-amplitude, amplitude + 1, image.size[::-1])
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def test_hamming():
+    assert hamming(0, 0) == 0
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(2 ** 64 - 1, 0) == 64
+
+
+@pytest.mark.parametrize("hash_func", [dhash, phash])
+def test_hash_is_64_bit_and_deterministic(hash_func):
+    image = scene(1)
+    value = hash_func(image)
+    assert 0 <= value < 2 ** 64
+    assert hash_func(scene(1)) == value
+
+
+@pytest.mark.parametrize("hash_func", [dhash, phash])
+def test_hash_tolerates_resize_and_noise(hash_func):
+    image = scene(1)
+    assert hamming(hash_func(image), hash_func(image.resize((128, 96), Image.BILINEAR))) <= 2
+    assert hamming(hash_func(image), hash_func(with_noise(image, 3, seed=7))) <= 4
+
+
+@pytest.mark.parametrize("hash_func", [dhash, phash])
+def test_hash_separates_different_scenes(hash_func):
+    distances = [hamming(hash_func(scene(1)), hash_func(scene(seed))) for seed in range(2, 12)]
+    assert min(distances) > 10
+
+
+def test_dhash_of_horizontal_gradient():
+    # 每行从左到右越来越亮，64 位全为 1
+    gradient = Image.fromarray(np.tile(np.arange(0, 256, 4, dtype=np.uint8), (48, 1)))
+    assert dhash(gradient) == 2 ** 64 - 1
+    assert dhash(gradient.transpose(Image.FLIP_LEFT_RIGHT)) == 0
+
+
+def test_image_hashes_from_file(tmp_path):
+    path = tmp_path / "a.jpg"
+    scene(1).convert("RGB").save(path, quality=95)
+    content, d_hash, p_hash = image_hashes(str(path))
+    assert len(content) == 64
+    assert hamming(d_hash, dhash(scene(1))) <= 4
+    assert hamming(p_hash, phash(scene(1))) <= 4
+
+
+def burst(seed, frames, amplitude=3):
+    """连拍：同一场景每秒一张，每张向右平移一个像素并带 ±amplitude 的噪声"""
+    base = scene(seed, size=(320, 240))
+    images = []
+    for i in range(frames):
+        crop = base.crop((i, 0, i + 256, 192))
+        images.append(with_noise(crop, amplitude, seed=seed * 100 + i))
+    return images
+
+
+def assign_all(grouper, items):
+    return [grouper.assign(name, name, dhash(image), phash(image), timestamp) for name, image, timestamp in items]
+
+
+def test_burst_longer_than_window_stays_in_one_group():
+    # 8 秒的连拍，时间窗口只有 2 秒：每张都与前一张相似，整组只有一张代表照片
+    grouper = SimilarityGrouper(window_seconds=2.0)
+    items = [(f"IMG_{i}.jpg", image, 100.0 + i) for i, image in enumerate(burst(1, 8))]
+    results = assign_all(grouper, items)
+
+    assert [representative for _, representative in results] == [True] + [False] * 7
+    assert {group for group, _ in results} == {results[0][0]}
+    assert results[0][0].size == 8
+    assert grouper.groups == 1
+
+
+def test_different_scenes_and_distant_times_are_separate_groups():
+    grouper = SimilarityGrouper(window_seconds=2.0)
+    first, second = burst(1, 3), burst(2, 3)
+    items = [(f"a{i}", image, 100.0 + i) for i, image in enumerate(first)]
+    items += [(f"b{i}", image, 103.5 + i) for i, image in enumerate(second)]
+    # 同一场景但隔了一分钟，不算连拍
+    items.append(("later", first[0], 200.0))
+    results = assign_all(grouper, items)
+
+    assert grouper.groups == 3
+    assert results[0][0] is results[2][0]
+    assert results[3][0] is results[5][0]
+    assert results[0][0] is not results[3][0]
+    assert results[6][1]
+
+
+def test_identical_content_joins_without_timestamp():
+    grouper = SimilarityGrouper()
+    group, representative = grouper.assign("a.jpg", "same", 0, 0, None)
+    assert representative
+    assert grouper.assign("copy.jpg", "same", 2 ** 64 - 1, 2 ** 64 - 1, None) == (group, False)
+
+
+def test_same_order_gives_same_groups():
+    items = [(f"{seed}-{i}", image, 100.0 + 1.5 * seed + i)
+             for seed in (1, 2, 3) for i, image in enumerate(burst(seed, 4))]
+
+    def groups():
+        grouper = SimilarityGrouper()
+        return [(group.representative, representative) for group, representative in assign_all(grouper, items)]
+
+    assert groups() == groups()
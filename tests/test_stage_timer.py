@@ -0,0 +1,41 @@
+import pytest
+
+from stage_timer import StageTimer, percentile
+
+
+@pytest.mark.parametrize("fraction, expected", [
+    (0.0, 1),
+    (0.10, 1),
+    (0.11, 2),
+    (0.50, 5),
+    (0.90, 9),
+    (0.95, 10),
+    (0.99, 10),
+    (1.0, 10),
+])
+def test_percentile_nearest_rank(fraction, expected):
+    assert percentile(list(range(1, 11)), fraction) == expected
+
+
+def test_percentile_single_value():
+    assert percentile([0.25], 0.5) == 0.25
+    assert percentile([0.25], 0.99) == 0.25
+
+
+def test_percentile_does_not_interpolate():
+    # 20 个样本的 p95 是第 19 个，而不是第 19、20 个之间的插值
+    values = [float(i) for i in range(1, 21)]
+    assert percentile(values, 0.95) == 19.0
+    assert percentile(values, 0.50) == 10.0
+
+
+def test_summary_uses_sorted_samples():
+    timer = StageTimer()
+    for seconds in (0.4, 0.1, 0.3, 0.2):
+        timer.add("ai", seconds)
+    stats = timer.summary()["stages"]["ai"]
+    assert stats["count"] == 4
+    assert stats["p50"] == 0.2
+    assert stats["p99"] == 0.4
+    assert stats["max"] == 0.4
+    assert stats["total"] == pytest.approx(1.0)
@@ -0,0 +1,50 @@
+import subprocess
+
+import pytest
+
+import video_frames
+
+
+@pytest.fixture
+def version_output(monkeypatch):
+    """让 ffmpeg -version 输出指定内容，并清掉缓存的版本号"""
+    calls = []
+
+    def use(stdout):
+        def fake_run(args, **kwargs):
+            calls.append(args)
+            return subprocess.CompletedProcess(args, 0, stdout=stdout)
+        monkeypatch.setattr(video_frames.subprocess, "run", fake_run)
+
+    monkeypatch.setattr(video_frames, "_ffmpeg_version", None)
+    use.calls = calls
+    return use
+
+
+@pytest.mark.parametrize("stdout, version, option", [
+    (b"ffmpeg version 4.4.2-0ubuntu0.22.04.1 Copyright (c) 2000-2021", (4, 4), "vsync"),
+    (b"ffmpeg version 5.0.1 Copyright", (5, 0), "vsync"),
+    (b"ffmpeg version n5.1.2 Copyright", (5, 1), "fps_mode"),
+    (b"ffmpeg version 7.0.2-static https://johnvansickle.com/ffmpeg/", (7, 0), "fps_mode"),
+    (b"ffmpeg version N-109421-g9adf02247c Copyright", (), "fps_mode"),
+])
+def test_passthrough_option_by_version(version_output, stdout, version, option):
+    version_output(stdout)
+    assert video_frames.ffmpeg_version() == version
+    assert video_frames.passthrough_args() == {option: "passthrough"}
+
+
+def test_version_is_detected_once(version_output):
+    version_output(b"ffmpeg version 4.4.2")
+    video_frames.passthrough_args()
+    video_frames.passthrough_args()
+    assert version_output.calls == [["ffmpeg", "-version"]]
+
+
+def test_missing_ffmpeg_uses_current_option(monkeypatch):
+    def missing(args, **kwargs):
+        raise FileNotFoundError(args[0])
+
+    monkeypatch.setattr(video_frames, "_ffmpeg_version", None)
+    monkeypatch.setattr(video_frames.subprocess, "run", missing)
+    assert video_frames.passthrough_args() == {"fps_mode": "passthrough"}
@@ -0,0 +1,107 @@
+import os
+import threading
+import tkinter as tk
+from datetime import datetime
+
+DEFAULT_LOG_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai_renaming", "logs")
+DEFAULT_FRAME_MS = 50  # 每秒最多刷新界面 20 次
+DEFAULT_MAX_LINES = 5000
+
+
+def new_log_path(name, log_dir=DEFAULT_LOG_DIR):
+    os.makedirs(log_dir, exist_ok=True)
+    return os.path.join(log_dir, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+
+
+class UIChannel:
+    """
+    工作线程到 Tk 主线程的事件通道
+    任何线程都可以调用 log / progress / call，它们只把事件放进缓冲区；
+    主线程按固定帧率一次性取出并更新界面，日志框只保留最近 max_lines 行，
+    完整日志写入 spill_path 指定的文件
+    """
+
+    def __init__(self, root, text_widget, progress_bar=None, frame_ms=DEFAULT_FRAME_MS,
+                 max_lines=DEFAULT_MAX_LINES, spill_path=None):
+        self.root = root
+        self.text_widget = text_widget
+        self.progress_bar = progress_bar
+        self.frame_ms = frame_ms
+        self.max_lines = max_lines
+        self.spill_path = spill_path
+        self.spill_file = None
+        self.widget_lines = 0
+        self.trimmed = False
+
+        self._lock = threading.Lock()
+        self._lines = []
+        self._progress = None
+        self._calls = []
+        self.root.after(self.frame_ms, self._flush)
+
+    def log(self, message):
+        with self._lock:
+            self._lines.append(message)
+
+    def progress(self, value, total):
+        # 只保留最新的进度，中间的更新直接丢弃
+        with self._lock:
+            self._progress = (value, total)
+
+    def call(self, func, *args):
+        """在主线程中执行 func(*args)，例如修改按钮状态"""
+        with self._lock:
+            self._calls.append((func, args))
+
+    def _flush(self):
+        with self._lock:
+            lines, self._lines = self._lines, []
+            progress, self._progress = self._progress, None
+            calls, self._calls = self._calls, []
+
+        try:
+            if lines:
+                self._write_spill(lines)
+                self._append_lines(lines)
+            if progress is not None and self.progress_bar is not None:
+                value, total = progress
+                self.progress_bar["maximum"] = total
+                self.progress_bar["value"] = value
+            for func, args in calls:
+                func(*args)
+        finally:
+            self.root.after(self.frame_ms, self._flush)
+
+    def _write_spill(self, lines):
+        if self.spill_path is None:
+            return
+        if self.spill_file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+            self.spill_file = open(self.spill_path, "a", encoding="utf-8")
+        self.spill_file.write("\n".join(lines) + "\n")
+        self.spill_file.flush()
+
+    def _append_lines(self, lines):
+        # 一帧内的日志比日志框能保留的还多时，只插入最后的部分
+        if len(lines) > self.max_lines:
+            lines = lines[-self.max_lines:]
+        self.widget_lines += len(lines)
+
+        self.text_widget.configure(state=tk.NORMAL)
+        self.text_widget.insert(tk.END, "\n".join(lines) + "\n")
+        excess = self.widget_lines - self.max_lines
+        if excess > 0:
+            # 第一行是提示文字时从第二行开始删
+            first = 2 if self.trimmed else 1
+            self.text_widget.delete(f"{first}.0", f"{first + excess}.0")
+            self.widget_lines -= excess
+            if not self.trimmed and self.spill_path is not None:
+                self.text_widget.insert("1.0", f"（更早的日志见 {self.spill_path}）\n")
+                self.trimmed = True
+        self.text_widget.see(tk.END)
+        self.text_widget.configure(state=tk.DISABLED)
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
@@ -0,0 +1,255 @@
+import math
+import re
+import subprocess
+import threading
+
+import ffmpeg
+import numpy as np
+
+FRAME_MODES = ("fast", "best", "sheet", "first")
+FRAME_MODE_LABELS = {
+    "fast": "快速关键帧",
+    "best": "挑选最清晰的画面",
+    "sheet": "多画面拼图",
+    "first": "第一个 I 帧（原始分辨率）",
+}
+DEFAULT_FRAME_MODE = "fast"
+FRAME_MAX_EDGE = 768  # 发给模型的帧长边像素数
+FRAME_QUALITY = 5  # MJPEG 的 -q:v，2 最好，31 最差
+KEYFRAME_POSITION = 0.1  # 默认在时长 10% 处取帧，避开开头的黑场和对焦
+DEFAULT_SHEET_FRAMES = 4
+SHEET_MAX_EDGE = 1280  # 拼图的长边像素数
+SHEET_PADDING = 4
+DEFAULT_CANDIDATES = 6  # best 模式的候选帧数
+DEFAULT_CANDIDATE_EDGE = 160  # 候选帧缩小到的边长，只用于打分
+DARK_LEVEL = 16
+BRIGHT_LEVEL = 240
+FPS_MODE_VERSION = (5, 1)  # -fps_mode 从 FFmpeg 5.1 开始才有，更早的版本只有 -vsync
+
+_ffmpeg_version = None
+_ffmpeg_version_lock = threading.Lock()
+
+
+def ffmpeg_version():
+    """
+    PATH 中 ffmpeg 的 (主版本, 次版本)，只在第一次调用时运行 ffmpeg -version
+    无法运行或版本号无法识别（例如从 git 主干编译的 N-xxxxx）时返回 ()，按新版本处理
+    """
+    global _ffmpeg_version
+    with _ffmpeg_version_lock:
+        if _ffmpeg_version is None:
+            try:
+                process = subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                match = re.match(rb'ffmpeg version n?(\d+)\.(\d+)', process.stdout)
+            except OSError:
+                match = None
+            _ffmpeg_version = (int(match.group(1)), int(match.group(2))) if match else ()
+        return _ffmpeg_version
+
+
+def passthrough_args():
+    """让 ffmpeg 原样输出每一帧、不按恒定帧率丢帧或补帧的输出参数，兼容 5.1 之前的版本"""
+    version = ffmpeg_version()
+    if version and version < FPS_MODE_VERSION:
+        return {'vsync': 'passthrough'}
+    return {'fps_mode': 'passthrough'}
+
+
+def seek_time(duration, position=KEYFRAME_POSITION):
+    """根据视频时长计算取帧的时间点（秒），时长未知时取开头"""
+    if not duration or duration <= 0:
+        return 0.0
+    return duration * position
+
+
+def extract_first_keyframe(video_path, log=print):
+    """原始方式：从头解码到第一个 I 帧，以原始分辨率输出"""
+    try:
+        out, err = (
+            ffmpeg
+            .input(video_path)
+            .filter('select', 'eq(pict_type,PICT_TYPE_I)')
+            .output('pipe:', format='image2', vframes=1)
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        if err:
+            log(f"ffmpeg 错误信息: {err.decode('utf-8')}")
+        return out
+    except Exception as e:
+        log(f"提取关键帧时出错: {e}")
+        return None
+
+
+def extract_keyframe(video_path, at=0.0, max_edge=FRAME_MAX_EDGE, log=print):
+    """
+    快速提取 at 秒附近的一个关键帧，返回 JPEG 数据
+    - 在输入端定位（-ss 写在 -i 之前），按索引直接跳到附近的关键帧，不从头解码
+    - 解码器只解关键帧（-skip_frame nokey），不取最接近 at 的精确帧
+    - 在滤镜中缩小到长边 max_edge，输出体积很小的 JPEG
+    """
+    def run(start):
+        out, err = (
+            ffmpeg
+            .input(video_path, ss=start, skip_frame='nokey', noaccurate_seek=None)
+            .filter('scale', max_edge, max_edge, force_original_aspect_ratio='decrease')
+            .output('pipe:', format='image2', vcodec='mjpeg', vframes=1, an=None, sn=None,
+                    **{'q:v': FRAME_QUALITY})
+            .global_args('-hide_banner', '-loglevel', 'error')
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        if err:
+            log(f"ffmpeg 错误信息: {err.decode('utf-8', 'replace')}")
+        return out
+
+    try:
+        out = run(at)
+        if not out and at > 0:
+            # 时长不准或定位点之后没有关键帧时，从开头再取一次
+            out = run(0)
+        return out or None
+    except Exception as e:
+        log(f"提取关键帧时出错: {e}")
+        return None
+
+
+def sheet_layout(frames):
+    """返回拼图的 (列数, 行数)，尽量接近正方形"""
+    columns = math.ceil(math.sqrt(frames))
+    return columns, math.ceil(frames / columns)
+
+
+def sheet_times(duration, frames):
+    """把时长等分为 frames 段，取每段中点"""
+    return [duration * (index + 0.5) / frames for index in range(frames)]
+
+
+def extract_contact_sheet(video_path, duration, frames=DEFAULT_SHEET_FRAMES, max_edge=SHEET_MAX_EDGE, log=print):
+    """
+    在一次 ffmpeg 调用中取 frames 个均匀分布的关键帧，按时间顺序拼成一张图，返回 JPEG 数据
+    每个时间点是一个单独定位的输入（只解码定位处的一个关键帧），不需要把整个文件读一遍；
+    各帧缩小到同样大小的格子后用 concat + tile 拼接
+    """
+    columns, rows = sheet_layout(frames)
+    cell = (max_edge - SHEET_PADDING * (columns - 1)) // columns
+    streams = [
+        ffmpeg
+        .input(video_path, ss=start, skip_frame='nokey', noaccurate_seek=None)
+        .video
+        .filter('trim', end_frame=1)
+        .filter('setpts', 'PTS-STARTPTS')
+        .filter('scale', cell, cell, force_original_aspect_ratio='decrease', force_divisible_by=2)
+        .filter('setsar', 1)
+        for start in sheet_times(duration, frames)
+    ]
+    try:
+        out, err = (
+            ffmpeg
+            .concat(*streams, v=1, a=0)
+            .filter('tile', f"{columns}x{rows}", padding=SHEET_PADDING, color='white')
+            .output('pipe:', format='image2', vcodec='mjpeg', vframes=1, **{'q:v': FRAME_QUALITY})
+            .global_args('-hide_banner', '-loglevel', 'error')
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        if err:
+            log(f"ffmpeg 错误信息: {err.decode('utf-8', 'replace')}")
+        return out or None
+    except Exception as e:
+        log(f"生成拼图时出错: {e}")
+        return None
+
+
+def read_candidates(video_path, times, edge=DEFAULT_CANDIDATE_EDGE, log=print):
+    """
+    在一次 ffmpeg 调用中取 times 处的关键帧，缩小为 edge x edge 的灰度图，
+    以 rawvideo 从管道读入，返回形状为 (帧数, edge, edge) 的 uint8 数组，不写任何文件
+    定位到结尾之后等原因取不到的帧不会出现在结果中
+    """
+    streams = [
+        ffmpeg
+        .input(video_path, ss=start, skip_frame='nokey', noaccurate_seek=None)
+        .video
+        .filter('trim', end_frame=1)
+        .filter('setpts', 'PTS-STARTPTS')
+        # 打分不在乎宽高比，统一拉伸为正方形便于直接切分字节流
+        .filter('scale', edge, edge)
+        for start in times
+    ]
+    try:
+        out, err = (
+            ffmpeg
+            .concat(*streams, v=1, a=0)
+            # 各帧时间戳相同，passthrough 防止按恒定帧率丢帧
+            .output('pipe:', format='rawvideo', pix_fmt='gray', **passthrough_args())
+            .global_args('-hide_banner', '-loglevel', 'error')
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+        if err:
+            log(f"ffmpeg 错误信息: {err.decode('utf-8', 'replace')}")
+    except Exception as e:
+        log(f"读取候选帧时出错: {e}")
+        return None
+    count = len(out) // (edge * edge)
+    if count == 0:
+        return None
+    return np.frombuffer(out[:count * edge * edge], dtype=np.uint8).reshape(count, edge, edge)
+
+
+def score_frames(frames):
+    """
+    一次性给所有候选帧打分，越大越适合发给模型
+    - 清晰度：拉普拉斯算子响应的方差，运动模糊和失焦时很小
+    - 曝光：去掉过暗和过亮像素后的比例乘以直方图熵，黑场、镜头盖和过曝画面接近 0
+    """
+    pixels = frames.astype(np.float32)
+    laplacian = (
+        pixels[:, :-2, 1:-1] + pixels[:, 2:, 1:-1] + pixels[:, 1:-1, :-2] + pixels[:, 1:-1, 2:]
+        - 4 * pixels[:, 1:-1, 1:-1]
+    )
+    sharpness = laplacian.reshape(len(frames), -1).var(axis=1)
+
+    # 每帧的灰度值加上 256 * 帧序号，一次 bincount 得到所有帧的直方图
+    offsets = (np.arange(len(frames)) * 256)[:, None, None]
+    histograms = np.bincount((frames + offsets).ravel(), minlength=256 * len(frames))
+    histograms = histograms.reshape(len(frames), 256) / frames[0].size
+    clipped = histograms[:, :DARK_LEVEL].sum(axis=1) + histograms[:, BRIGHT_LEVEL:].sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.nansum(np.where(histograms > 0, histograms * np.log2(histograms), 0), axis=1) / 8
+    exposure = np.clip(1 - clipped, 0, 1) * entropy
+    return np.log1p(sharpness) * exposure
+
+
+def extract_best_keyframe(video_path, duration, candidates=DEFAULT_CANDIDATES, edge=DEFAULT_CANDIDATE_EDGE,
+                          log=print):
+    """从均匀分布的 candidates 个关键帧中选出最清晰、曝光最好的一个，按 fast 模式输出 JPEG"""
+    times = sheet_times(duration, candidates)
+    frames = read_candidates(video_path, times, edge, log)
+    if frames is None:
+        return None
+    scores = score_frames(frames)
+    # 取不到的帧只会出现在末尾，前面的序号与时间点一一对应
+    best = int(np.argmax(scores))
+    return extract_keyframe(video_path, times[best], log=log)
+
+
+def sheet_prompt(prompt, frames):
+    """告诉模型这是同一段视频的多个画面，而不是多张不相关的图片"""
+    return f"这张图由同一段视频按时间顺序截取的 {frames} 个画面拼成，请把它们当作一段视频来描述。{prompt}"
+
+
+def extract_frame(video_path, duration=None, mode=DEFAULT_FRAME_MODE, frames=DEFAULT_SHEET_FRAMES,
+                  candidates=DEFAULT_CANDIDATES, candidate_edge=DEFAULT_CANDIDATE_EDGE, log=print):
+    """
+    按 mode 提取发给模型的图片，返回 (JPEG 数据, 图中的画面数)
+    sheet 和 best 模式在时长未知、只取一帧或失败时退回 fast
+    """
+    if mode == "first":
+        return extract_first_keyframe(video_path, log), 1
+    if mode == "sheet" and duration and frames > 1:
+        sheet = extract_contact_sheet(video_path, duration, frames, log=log)
+        if sheet:
+            return sheet, frames
+    if mode == "best" and duration and candidates > 1:
+        best = extract_best_keyframe(video_path, duration, candidates, candidate_edge, log)
+        if best:
+            return best, 1
+    return extract_keyframe(video_path, seek_time(duration), log=log), 1
@@ -0,0 +1,423 @@
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import ffmpeg
+
+from ai_client import DEFAULT_AI_WORKERS, MODEL_NAME, describe_cached, get_client
+from pipeline import log_to_stderr, print_json_result
+from rate_limiter import DEFAULT_RATE, DEFAULT_RETRIES
+from rename_journal import new_journal_path, run_undo
+from renamer_base import RenamerBase, sanitize_filename
+from stage_timer import measure
+from state_store import DEFAULT_STATE_PATH
+from video_frames import (
+    DEFAULT_CANDIDATE_EDGE, DEFAULT_CANDIDATES, DEFAULT_FRAME_MODE, DEFAULT_SHEET_FRAMES, FRAME_MODES,
+    extract_frame, sheet_prompt
+)
+
+SUPPORTED_EXT = ('.mp4', '.mov', '.avi', '.mkv')
+DEFAULT_PROMPT = "简洁描述关键帧 10 字内"
+DEFAULT_PROBE_WORKERS = 4
+DEFAULT_DECODE_WORKERS = 2
+PROBE_SIZE = 2 * 1024 * 1024  # ffprobe 最多读取的字节数
+PROBE_ANALYZE_US = 1000000  # ffprobe 最多分析的时长（微秒）
+# 只取命名用得到的字段：格式的时长和全部标签，第一个视频流的尺寸、帧率和编码
+PROBE_ENTRIES = "format=duration:format_tags:stream=codec_type,width,height,r_frame_rate,codec_name,profile"
+
+
+def probe_video(video_path):
+    """
+    精简版的 ffmpeg.probe：只选第一个视频流、只输出需要的字段，并限制探测的数据量
+    返回的结构与 ffmpeg.probe 相同，出错时抛出 ffmpeg.Error
+    """
+    args = [
+        'ffprobe', '-v', 'error', '-of', 'json',
+        '-probesize', str(PROBE_SIZE), '-analyzeduration', str(PROBE_ANALYZE_US),
+        '-select_streams', 'v:0', '-show_entries', PROBE_ENTRIES,
+        video_path
+    ]
+    process = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffprobe', process.stdout, process.stderr)
+    probe = json.loads(process.stdout.decode('utf-8'))
+    probe.setdefault('format', {})
+    probe.setdefault('streams', [])
+    return probe
+
+
+def build_video_payload(video_path, prompt, log=print, timer=None, duration=None,
+                        frame_mode=DEFAULT_FRAME_MODE, sheet_frames=DEFAULT_SHEET_FRAMES,
+                        candidates=DEFAULT_CANDIDATES, candidate_edge=DEFAULT_CANDIDATE_EDGE):
+    """提取发给模型的画面，返回 (Base64 编码的图片, 提示词)，取不到画面时图片为 None"""
+    # 提取关键帧
+    with measure(timer, "keyframe"):
+        keyframes, frame_count = extract_frame(
+            video_path, duration, frame_mode, sheet_frames, candidates, candidate_edge, log
+        )
+    if frame_count > 1:
+        prompt = sheet_prompt(prompt, frame_count)
+    if not keyframes:
+        return None, prompt
+    # 对关键帧进行 Base64 编码
+    return base64.b64encode(keyframes).decode('utf-8'), prompt
+
+
+def request_video_description(img_base, api_key, prompt, cache=None, log=print, timer=None):
+    client = get_client(api_key)
+    with measure(timer, "ai"):
+        return describe_cached(client, img_base, prompt, cache, log=log)
+
+
+# 调用智谱 AI 接口获取视频描述
+def get_video_description(video_path, api_key, prompt, cache=None, log=print, timer=None,
+                          duration=None, frame_mode=DEFAULT_FRAME_MODE, sheet_frames=DEFAULT_SHEET_FRAMES,
+                          candidates=DEFAULT_CANDIDATES, candidate_edge=DEFAULT_CANDIDATE_EDGE):
+    try:
+        img_base, prompt = build_video_payload(
+            video_path, prompt, log, timer, duration, frame_mode, sheet_frames, candidates, candidate_edge
+        )
+        if img_base:
+            return request_video_description(img_base, api_key, prompt, cache, log, timer)
+    except Exception as e:
+        log(f"调用智谱 AI 接口时出现错误: {str(e)}")
+    return None
+
+
+class VideoRenamer(RenamerBase):
+    """
+    视频重命名引擎，不依赖任何界面
+    日志、进度和每个文件的结果通过回调交给调用方（GUI 或命令行）
+    """
+
+    TOOL = "video"
+    SUPPORTED_EXT = SUPPORTED_EXT
+    DESCRIPTION_LABEL = "AI 描述"
+
+    def __init__(
+            self,
+            directory,
+            include_modification_time=True,
+            include_model=True,
+            include_resolution=True,
+            include_frame_rate=True,
+            include_codec=True,
+            include_ai_description=False,
+            recursive=False,
+            api_key="",
+            ai_prompt=DEFAULT_PROMPT,
+            ai_workers=DEFAULT_AI_WORKERS,
+            probe_workers=DEFAULT_PROBE_WORKERS,
+            decode_workers=DEFAULT_DECODE_WORKERS,
+            ai_rate=DEFAULT_RATE,
+            ai_retries=DEFAULT_RETRIES,
+            frame_mode=DEFAULT_FRAME_MODE,
+            sheet_frames=DEFAULT_SHEET_FRAMES,
+            candidates=DEFAULT_CANDIDATES,
+            candidate_edge=DEFAULT_CANDIDATE_EDGE,
+            prefill_only=False,
+            dry_run=False,
+            plan_first=False,
+            journal_path=None,
+            incremental=True,
+            state_path=DEFAULT_STATE_PATH,
+            report_path=None,
+            log=print,
+            on_progress=None,
+            on_result=None
+    ):
+        super().__init__(
+            directory,
+            include_ai_description=include_ai_description,
+            recursive=recursive,
+            api_key=api_key,
+            ai_prompt=ai_prompt,
+            ai_workers=ai_workers,
+            ai_rate=ai_rate,
+            ai_retries=ai_retries,
+            prefill_only=prefill_only,
+            dry_run=dry_run,
+            plan_first=plan_first,
+            journal_path=journal_path,
+            incremental=incremental,
+            state_path=state_path,
+            report_path=report_path,
+            log=log,
+            on_progress=on_progress,
+            on_result=on_result
+        )
+        self.include_modification_time = include_modification_time
+        self.include_model = include_model
+        self.include_resolution = include_resolution
+        self.include_frame_rate = include_frame_rate
+        self.include_codec = include_codec
+        self.probe_worker_count = probe_workers
+        self.decode_worker_count = decode_workers
+        self.frame_mode = frame_mode
+        self.sheet_frames = sheet_frames
+        self.candidates = candidates
+        self.candidate_edge = candidate_edge
+
+    def get_video_metadata(self, file_path):
+        """ffprobe 无法运行或报错时抛出异常，文件记为失败，下次运行会重新读取"""
+        with measure(self.timer, "probe"):
+            probe = probe_video(file_path)
+        try:
+            resolution = None
+            frame_rate = None
+            codec = None
+            model = None
+            duration = None
+
+            format_info = probe['format']
+            tags = format_info.get('tags', {})
+            try:
+                duration = float(format_info['duration'])
+            except (KeyError, TypeError, ValueError):
+                pass
+
+            possible_model_tags = ['model', 'Make', 'DeviceModelName', 'CameraModelName', 'ProductModel']
+            for tag in possible_model_tags:
+                if tag in tags:
+                    model = tags[tag]
+                    break
+
+            xml_metadata = tags.get('com.panasonic.Semi-Pro.metadata.xml')
+            if xml_metadata and not model:
+                try:
+                    root = ET.fromstring(xml_metadata)
+                    for elem in root.findall('.//*'):
+                        if elem.text and 'Model' in elem.tag:
+                            model = elem.text
+                            break
+                    if not model:
+                        self.log("未找到模型信息。")
+                except ET.ParseError as e:
+                    self.log(f"解析 XML 元数据时出错: {e}")
+
+            video_stream = next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
+            if video_stream:
+                width = video_stream.get('width')
+                height = video_stream.get('height')
+                if width and height:
+                    resolution = f"{width}x{height}"
+
+                r_frame_rate = video_stream.get('r_frame_rate')
+                if r_frame_rate:
+                    try:
+                        num, den = map(int, r_frame_rate.split('/'))
+                        frame_rate = num / den if den != 0 else None
+                    except ValueError:
+                        pass
+
+                profile = video_stream.get('profile')
+                codec_name = video_stream.get('codec_name')
+                if profile and codec_name:
+                    codec = f"{codec_name}_{profile}"
+
+                if not codec:
+                    codec_keywords = ['codec', 'encoding']
+                    for keyword in codec_keywords:
+                        for key, value in tags.items():
+                            if keyword.lower() in key.lower():
+                                codec = value
+                                break
+                        if codec:
+                            break
+
+                if not codec:
+                    codec = codec_name
+
+            return resolution, frame_rate, codec, model, duration
+
+        except Exception as e:
+            self.log(f"读取元数据时出错: {e}")
+            return None, None, None, None, None
+
+    def add_stages(self, pipeline):
+        if not self.prefill_only or self.frame_mode != "first":
+            # 取帧位置由时长决定，只生成缓存时也要探测，否则取到的画面与正式运行不同，描述无法命中缓存
+            # ffprobe 的时间大多花在等待磁盘或网络存储上，多个进程同时探测
+            pipeline.add_stage("metadata", self.read_metadata, workers=self.probe_worker_count)
+        if self.use_ai:
+            # 解码和 AI 请求分成两个阶段，下一个文件的关键帧在上一个文件等待 AI 回复时解码
+            pipeline.add_stage("keyframe", self.extract_payload, workers=self.decode_worker_count)
+            pipeline.add_stage("ai", self.describe, workers=self.ai_worker_count)
+
+    def naming_settings(self):
+        """影响新文件名的全部选项，任何一项变化都会让之前的处理记录失效"""
+        return {
+            "tool": self.TOOL,
+            "modification_time": self.include_modification_time,
+            "model": self.include_model,
+            "resolution": self.include_resolution,
+            "frame_rate": self.include_frame_rate,
+            "codec": self.include_codec,
+            "ai": self.use_ai,
+            "prompt": self.ai_prompt if self.use_ai else None,
+            "ai_model": MODEL_NAME if self.use_ai else None,
+            "frame_mode": self.frame_mode if self.use_ai else None,
+            "sheet_frames": self.sheet_frames if self.use_ai and self.frame_mode == "sheet" else None,
+            "candidates": self.candidates if self.use_ai and self.frame_mode == "best" else None,
+        }
+
+    def read_metadata(self, task):
+        if task.status is not None:
+            return task
+        try:
+            task.name_parts = self.create_name_parts(task)
+        except Exception as e:
+            self.log(f"处理失败 {task.filename}: {str(e)}")
+            task.fail("failed", str(e))
+        return task
+
+    def extract_payload(self, task):
+        """解码关键帧，与上一个文件的 AI 请求同时进行"""
+        if task.status is None:
+            try:
+                task.payload, task.prompt = build_video_payload(
+                    task.path, self.ai_prompt, self.log, self.timer, task.duration, self.frame_mode,
+                    self.sheet_frames, self.candidates, self.candidate_edge
+                )
+            except Exception as e:
+                # 与以前一样，取不到画面时不带描述继续重命名
+                self.log(f"提取关键帧时出错: {e}")
+        return task
+
+    def describe(self, task):
+        if task.status is None and task.payload:
+            try:
+                task.description = request_video_description(
+                    task.payload, self.api_key, task.prompt, self.description_cache, self.log, self.timer
+                )
+            except Exception as e:
+                self.log(f"调用智谱 AI 接口时出现错误: {str(e)}")
+            # 图片数据已经用不到了，不要一直留在队列里
+            task.payload = None
+        return task
+
+    def create_name_parts(self, task):
+        file_path = task.path
+        resolution, frame_rate, codec, model, task.duration = self.get_video_metadata(file_path)
+
+        name_parts = []
+
+        if self.include_modification_time:
+            mod_time = os.path.getmtime(file_path)
+            dt = datetime.fromtimestamp(mod_time)
+            name_parts.append(dt.strftime("%Y-%m-%d_%H.%M.%S"))
+
+        if self.include_model and model:
+            name_parts.append(model)
+
+        if self.include_resolution and resolution:
+            name_parts.append(resolution)
+
+        if self.include_frame_rate and frame_rate:
+            formatted_frame_rate = "{:.2f}".format(frame_rate)
+            name_parts.append(formatted_frame_rate)
+
+        if self.include_codec and codec:
+            name_parts.append(codec)
+
+        return name_parts
+
+    def build_new_name(self, task):
+        name_parts = list(task.name_parts)
+        if task.description:
+            name_parts.append(sanitize_filename(task.description))
+        return " | ".join(name_parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="读取视频元数据（可选 AI 描述）并重命名")
+    parser.add_argument("directory", nargs="?", help="视频所在的文件夹")
+    parser.add_argument("--no-modification-time", action="store_true", help="不包含修改日期时间")
+    parser.add_argument("--no-model", action="store_true", help="不包含拍摄机型")
+    parser.add_argument("--no-resolution", action="store_true", help="不包含分辨率")
+    parser.add_argument("--no-frame-rate", action="store_true", help="不包含帧率")
+    parser.add_argument("--no-codec", action="store_true", help="不包含编码方式")
+    parser.add_argument("--recursive", action="store_true", help="包含子文件夹")
+    parser.add_argument("--ai", action="store_true", help="使用 AI 描述")
+    parser.add_argument("--api-key", default=os.environ.get("ZHIPUAI_API_KEY", ""),
+                        help="智谱 AI API Key，默认读取环境变量 ZHIPUAI_API_KEY")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="AI 提示词")
+    parser.add_argument("--ai-workers", type=int, default=DEFAULT_AI_WORKERS,
+                        help="AI 并发数上限，实际并发会根据限流情况自动调整")
+    parser.add_argument("--probe-workers", type=int, default=DEFAULT_PROBE_WORKERS,
+                        help="同时运行的 ffprobe 进程数")
+    parser.add_argument("--decode-workers", type=int, default=DEFAULT_DECODE_WORKERS,
+                        help="同时提取关键帧的 ffmpeg 进程数")
+    parser.add_argument("--ai-rate", type=float, default=DEFAULT_RATE, help="每秒最多发出的 AI 请求数，0 表示不限")
+    parser.add_argument("--ai-retries", type=int, default=DEFAULT_RETRIES,
+                        help=" AI 请求遇到限流、服务器错误或超时时的最大重试次数")
+    parser.add_argument("--frame-mode", choices=FRAME_MODES, default=DEFAULT_FRAME_MODE,
+                        help="发给 AI 的画面：fast 在时长 10%% 处快速取一个缩小的关键帧，"
+                             "best 从多个候选关键帧中挑选最清晰、曝光最好的一个，"
+                             "sheet 把均匀分布的多个关键帧拼成一张图，first 为原始分辨率的第一个 I 帧")
+    parser.add_argument("--sheet-frames", type=int, default=DEFAULT_SHEET_FRAMES, help="sheet 模式的画面数")
+    parser.add_argument("--candidates", type=int, default=DEFAULT_CANDIDATES, help="best 模式的候选帧数")
+    parser.add_argument("--candidate-size", type=int, default=DEFAULT_CANDIDATE_EDGE,
+                        help="best 模式给候选帧打分时使用的边长（像素）")
+    parser.add_argument("--prefill-cache", action="store_true", help="仅生成 AI 描述缓存，不重命名")
+    parser.add_argument("--dry-run", action="store_true", help="只计算新文件名并输出，不改动任何文件")
+    parser.add_argument("--plan", action="store_true", help="先计算全部新文件名并写入重命名记录，再批量重命名")
+    parser.add_argument("--journal", help="重命名记录文件路径，默认在 ~/.cache/ai_renaming/journals 下新建")
+    parser.add_argument("--full", action="store_true", help="重新处理所有文件，不跳过之前已处理且未改动的文件")
+    parser.add_argument("--report", help="把各阶段耗时保存为 JSON 报告的路径")
+    parser.add_argument("--undo", metavar="JOURNAL", help="根据重命名记录撤销一次运行，传 latest 表示最近一次")
+    parser.add_argument("--json", action="store_true", help="每个文件输出一行 JSON 结果，日志输出到 stderr")
+    args = parser.parse_args(argv)
+
+    if args.undo:
+        return run_undo(parser, args.undo, log_to_stderr if args.json else print, "video")
+    if args.directory is None:
+        parser.error("需要指定视频所在的文件夹")
+    if not os.path.isdir(args.directory):
+        parser.error(f"目录不存在: {args.directory}")
+    if (args.ai or args.prefill_cache) and not args.api_key:
+        parser.error("使用 AI 描述时需要 --api-key 或环境变量 ZHIPUAI_API_KEY")
+
+    renamer = VideoRenamer(
+        args.directory,
+        include_modification_time=not args.no_modification_time,
+        include_model=not args.no_model,
+        include_resolution=not args.no_resolution,
+        include_frame_rate=not args.no_frame_rate,
+        include_codec=not args.no_codec,
+        include_ai_description=args.ai,
+        recursive=args.recursive,
+        api_key=args.api_key,
+        ai_prompt=args.prompt,
+        ai_workers=args.ai_workers,
+        probe_workers=args.probe_workers,
+        decode_workers=args.decode_workers,
+        ai_rate=args.ai_rate,
+        ai_retries=args.ai_retries,
+        frame_mode=args.frame_mode,
+        sheet_frames=args.sheet_frames,
+        candidates=args.candidates,
+        candidate_edge=args.candidate_size,
+        prefill_only=args.prefill_cache,
+        dry_run=args.dry_run,
+        plan_first=args.plan,
+        journal_path=None if args.dry_run else (args.journal or new_journal_path("video")),
+        incremental=not args.full,
+        report_path=args.report,
+        log=log_to_stderr if args.json else print,
+        on_result=print_json_result if args.json else None
+    )
+    try:
+        summary = renamer.run()
+    except KeyboardInterrupt:
+        return 130
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())